@@ -0,0 +1,380 @@
+"""JSON API v1 для киосков и мобильного приложения (blueprint /api/v1).
+
+Логика та же, что у страниц клиента, — всё берётся из booking_flow.py.
+Авторизация — та же сессия Flask-Login (POST /login), без сессии API отвечает
+401 JSON, а не редиректом на форму входа.
+
+Общие параметры списков:
+- limit — размер страницы (по умолчанию API_PAGE_SIZE, не больше API_MAX_PAGE_SIZE);
+- after — курсор из поля next предыдущего ответа (keyset, без OFFSET);
+- fields — список полей через запятую, чтобы не гонять лишнее.
+
+GET-ответы снабжаются ETag (хеш тела), на If-None-Match отвечается 304.
+Суммы отдаются строками ("1500.00"), время — ISO 8601 без часового пояса.
+"""
+from __future__ import annotations
+from typing import Callable, Optional
+
+from datetime import datetime, date
+from decimal import Decimal
+from functools import wraps
+
+from flask import Blueprint, jsonify, request
+from flask_login import current_user
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session, joinedload
+
+from availability import slot_available
+from booking_flow import (
+    BookingError, schedule_query, load_slot, usable_subscriptions, book_slot, pay_booking_due,
+)
+from db import SessionLocal
+from lookups import lookups
+from models import Booking, Payment, ScheduleSlot
+
+api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str, reason: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+
+@api.errorhandler(ApiError)
+def _api_error(e: ApiError):
+    body = {"error": str(e)}
+    if e.reason:
+        body["reason"] = e.reason
+    return jsonify(body), e.status
+
+
+@api.errorhandler(404)
+def _not_found(e):
+    return jsonify({"error": "Не найдено"}), 404
+
+
+@api.errorhandler(405)
+def _method_not_allowed(e):
+    return jsonify({"error": "Метод не поддерживается"}), 405
+
+
+def api_login_required(role: Optional[str] = None):
+    def decorator(fn: Callable):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not current_user.is_authenticated:
+                raise ApiError(401, "Требуется вход")
+            if role and getattr(current_user, "role", "") != role:
+                raise ApiError(403, "Недостаточно прав")
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---- сериализация ----
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return f"{value:.2f}"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def slot_json(slot: ScheduleSlot, available: int) -> dict:
+    return {
+        "id": slot.id,
+        "zone_id": slot.zone_id,
+        "zone": slot.zone.zone_name,
+        "employee_id": slot.employee_id,
+        "employee": slot.employee.full_name if slot.employee else None,
+        "datetime_from": slot.datetime_from,
+        "datetime_to": slot.datetime_to,
+        "lesson_type": slot.lesson_type,
+        "price": Decimal(str(slot.price)),
+        "capacity": slot.capacity,
+        "available": available,
+    }
+
+
+def booking_json(b: Booking) -> dict:
+    return {
+        "id": b.id,
+        "slot_id": b.schedule_slot_id,
+        "zone_id": b.zone_id,
+        "status": b.status.code,
+        "datetime_from": b.datetime_from,
+        "datetime_to": b.datetime_to,
+        "participants_count": b.participants_count,
+        "subscription_id": b.subscription_id,
+        "session_sum": Decimal(str(b.session_sum or 0)),
+        "total_sum": Decimal(str(b.total_sum or 0)),
+        "paid_sum": Decimal(str(b.paid_sum or 0)),
+        "due_sum": Decimal(str(b.due_sum or 0)),
+        "created_at": b.created_at,
+    }
+
+
+def payment_json(p: Payment) -> dict:
+    return {
+        "id": p.id,
+        "booking_id": p.booking_id,
+        "paid_at": p.paid_at,
+        "amount": Decimal(str(p.amount)),
+        "method": p.method,
+    }
+
+
+def _selected_fields(allowed: list[str]) -> Optional[list[str]]:
+    raw = request.args.get("fields", "").strip()
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ApiError(400, f"Неизвестные поля: {', '.join(unknown)}; доступны: {', '.join(allowed)}")
+    return fields
+
+
+def _render(item: dict, fields: Optional[list[str]]) -> dict:
+    return {k: _json_value(v) for k, v in item.items() if fields is None or k in fields}
+
+
+def _conditional(body):
+    """JSON-ответ с ETag; 304, если у клиента та же версия."""
+    response = jsonify(body)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# ---- разбор параметров ----
+def _int_arg(name: str) -> Optional[int]:
+    raw = request.args.get(name, "").strip()
+    if not raw:
+        return None
+    if not raw.isdigit():
+        raise ApiError(400, f"{name}: ожидается целое число")
+    return int(raw)
+
+
+def _limit() -> int:
+    limit = _int_arg("limit") or API_PAGE_SIZE
+    return min(limit, API_MAX_PAGE_SIZE)
+
+
+def _cursor() -> Optional[tuple[datetime, int]]:
+    """Курсор «<ISO-время>_<id>» — как в списке броней админки."""
+    after = request.args.get("after", "").strip()
+    if not after:
+        return None
+    try:
+        after_dt, after_id = after.rsplit("_", 1)
+        return datetime.fromisoformat(after_dt), int(after_id)
+    except ValueError:
+        raise ApiError(400, "after: некорректный курсор")
+
+
+def _page(s: Session, query, time_column, id_column, descending: bool, key: Callable) -> tuple[list, Optional[str]]:
+    """Страница keyset-пагинации по (time_column, id_column) и курсор следующей."""
+    cursor = _cursor()
+    if cursor:
+        pair, bound = tuple_(time_column, id_column), tuple_(*cursor)
+        query = query.where(pair < bound if descending else pair > bound)
+    order = (time_column.desc(), id_column.desc()) if descending else (time_column.asc(), id_column.asc())
+    limit = _limit()
+    items = s.execute(query.order_by(*order).limit(limit + 1)).scalars().all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last_dt, last_id = key(items[-1])
+        next_cursor = f"{last_dt.isoformat()}_{last_id}"
+    return items, next_cursor
+
+
+def _json_body() -> dict:
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ApiError(400, "Ожидается JSON-объект в теле запроса")
+    return body
+
+
+def _positive_int(body: dict, name: str, default: Optional[int] = None) -> Optional[int]:
+    value = body.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ApiError(400, f"{name}: ожидается положительное целое число")
+    return value
+
+
+# ---- расписание ----
+SLOT_FIELDS = [
+    "id", "zone_id", "zone", "employee_id", "employee", "datetime_from", "datetime_to",
+    "lesson_type", "price", "capacity", "available",
+]
+
+
+@api.get("/slots")
+@api_login_required()
+def slots():
+    """Расписание с теми же фильтрами, что /client/schedule: date, time_from, time_to, zone_id, lesson_type, employee_id."""
+    fields = _selected_fields(SLOT_FIELDS)
+    try:
+        day = date.fromisoformat(request.args["date"]) if request.args.get("date") else None
+        time_from = datetime.strptime(request.args["time_from"], "%H:%M").time() if request.args.get("time_from") else None
+        time_to = datetime.strptime(request.args["time_to"], "%H:%M").time() if request.args.get("time_to") else None
+    except ValueError:
+        raise ApiError(400, "date: ожидается YYYY-MM-DD, time_from/time_to: HH:MM")
+    with SessionLocal() as s:
+        query = schedule_query(
+            datetime.now(),
+            day=day,
+            time_from=time_from,
+            time_to=time_to,
+            zone_id=_int_arg("zone_id"),
+            lesson_type=request.args.get("lesson_type", "").strip() or None,
+            employee_id=_int_arg("employee_id"),
+        )
+        items, next_cursor = _page(
+            s, query, ScheduleSlot.datetime_from, ScheduleSlot.id, False, lambda it: (it.datetime_from, it.id)
+        )
+        data = [_render(slot_json(slot, slot_available(s, slot)), fields) for slot in items]
+    return _conditional({"items": data, "next": next_cursor})
+
+
+@api.get("/slots/<int:slot_id>/availability")
+@api_login_required()
+def slot_availability(slot_id: int):
+    with SessionLocal() as s:
+        slot = load_slot(s, slot_id)
+        if not slot or not slot.is_active:
+            raise ApiError(404, "Слот не найден")
+        available = slot_available(s, slot)
+    return _conditional({
+        "slot_id": slot.id,
+        "capacity": slot.capacity,
+        "booked": slot.booked_count,
+        "available": available,
+        "bookable": available > 0 and slot.datetime_from > datetime.now(),
+    })
+
+
+# ---- брони ----
+BOOKING_FIELDS = [
+    "id", "slot_id", "zone_id", "status", "datetime_from", "datetime_to", "participants_count",
+    "subscription_id", "session_sum", "total_sum", "paid_sum", "due_sum", "created_at",
+]
+
+
+def _client_booking(s: Session, booking_id: int) -> Booking:
+    booking = s.execute(
+        select(Booking)
+        .options(joinedload(Booking.status))
+        .where(Booking.id == booking_id, Booking.client_id == current_user.client_id)
+    ).scalar_one_or_none()
+    if not booking:
+        raise ApiError(404, "Бронь не найдена")
+    return booking
+
+
+@api.get("/bookings")
+@api_login_required("client")
+def bookings():
+    """Брони текущего клиента, новые по дате занятия — первыми."""
+    fields = _selected_fields(BOOKING_FIELDS)
+    with SessionLocal() as s:
+        query = select(Booking).options(joinedload(Booking.status)).where(Booking.client_id == current_user.client_id)
+        items, next_cursor = _page(
+            s, query, Booking.datetime_from, Booking.id, True, lambda it: (it.datetime_from, it.id)
+        )
+        data = [_render(booking_json(b), fields) for b in items]
+    return _conditional({"items": data, "next": next_cursor})
+
+
+@api.get("/bookings/<int:booking_id>")
+@api_login_required("client")
+def booking_detail(booking_id: int):
+    fields = _selected_fields(BOOKING_FIELDS)
+    with SessionLocal() as s:
+        data = _render(booking_json(_client_booking(s, booking_id)), fields)
+    return _conditional(data)
+
+
+@api.post("/bookings")
+@api_login_required("client")
+def booking_create():
+    """{"slot_id", "participants_count"=1, "subscription_id"?, "services"?: {"<id услуги>": кол-во}} -> 201 и бронь."""
+    body = _json_body()
+    slot_id = _positive_int(body, "slot_id")
+    if slot_id is None:
+        raise ApiError(400, "slot_id: обязательное поле")
+    participants = _positive_int(body, "participants_count", 1)
+    subscription_id = _positive_int(body, "subscription_id")
+    services = body.get("services") or {}
+    if not isinstance(services, dict):
+        raise ApiError(400, "services: ожидается объект {id услуги: количество}")
+    try:
+        service_qty = {int(k): int(v) for k, v in services.items()}
+    except (TypeError, ValueError):
+        raise ApiError(400, "services: id и количество — целые числа")
+
+    with SessionLocal() as s:
+        slot = load_slot(s, slot_id)
+        if not slot or not slot.is_active:
+            raise ApiError(404, "Слот не найден")
+        subscription = None
+        if subscription_id:
+            subscription = next((sub for sub in usable_subscriptions(s, current_user.client_id) if sub.id == subscription_id), None)
+            if subscription is None:
+                raise ApiError(409, "Недостаточно посещений в абонементе", "subscription")
+        lk = lookups.get(s)
+        try:
+            booking = book_slot(s, slot, current_user.client_id, participants, lk, subscription, service_qty)
+        except BookingError as e:
+            raise ApiError(409, str(e), e.reason)
+        data = _render(booking_json(_client_booking(s, booking.id)), None)
+    return jsonify(data), 201
+
+
+# ---- оплаты ----
+PAYMENT_FIELDS = ["id", "booking_id", "paid_at", "amount", "method"]
+PAYMENT_METHODS = ("card", "cash", "sbp")
+
+
+@api.get("/payments")
+@api_login_required("client")
+def payments():
+    """Оплаты текущего клиента, последние — первыми."""
+    fields = _selected_fields(PAYMENT_FIELDS)
+    with SessionLocal() as s:
+        query = select(Payment).join(Booking, Booking.id == Payment.booking_id).where(
+            Booking.client_id == current_user.client_id
+        )
+        items, next_cursor = _page(s, query, Payment.paid_at, Payment.id, True, lambda it: (it.paid_at, it.id))
+        data = [_render(payment_json(p), fields) for p in items]
+    return _conditional({"items": data, "next": next_cursor})
+
+
+@api.post("/payments")
+@api_login_required("client")
+def payment_create():
+    """{"booking_id", "method"="card"} — оплатить весь остаток брони -> 201 и оплата."""
+    body = _json_body()
+    booking_id = _positive_int(body, "booking_id")
+    if booking_id is None:
+        raise ApiError(400, "booking_id: обязательное поле")
+    method = body.get("method", "card")
+    if method not in PAYMENT_METHODS:
+        raise ApiError(400, f"method: одно из {', '.join(PAYMENT_METHODS)}")
+    with SessionLocal() as s:
+        booking = _client_booking(s, booking_id)
+        try:
+            payment = pay_booking_due(s, booking, method, lookups.get(s))
+        except BookingError as e:
+            raise ApiError(409, str(e), e.reason)
+        data = _render(payment_json(payment), None)
+    return jsonify(data), 201
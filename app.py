@@ -1,19 +1,53 @@
 from __future__ import annotations
-from typing import Optional
+from typing import Callable, Optional
 
 from datetime import datetime, timedelta
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal, InvalidOperation
 from functools import wraps
+import hmac
+import io
+import json
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+import click
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import select, func, text
+from sqlalchemy import select, func, text, update, tuple_, or_
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session, joinedload, selectinload
 
-from db import engine, SessionLocal
+from db import engine, SessionLocal, DB_URL, DB_BACKEND, SQLITE_PRAGMAS, server_version, sqlite_pragma_status, pool_status
+from migrations import run_migrations, applied_versions
+from query_plans import check_hot_queries
+from query_budget import check_query_budgets, seed_query_fixture
+from availability import availability, db_free_capacity, lock_zone, slot_available
+from ledger import apply_payment, payment_drift, rebuild_payment_totals
+from client_search import client_filter, search_clients
+from lookups import lookups
+from principals import principals
+from stats import compact_stats, read_stats, rebuild_stats, stats_drift
+from trigger_check import check_triggers
+from concurrency_check import check_slot_concurrency
+from rollups import refresh_rollups, last_refresh
+from exports import EXPORTS, stream_csv, export_filename
+from client_import import COLUMN_ALIASES, IMPORT_BATCH_ROWS, import_clients
+from synthetic import SCALES, generate, create_load_accounts
+from loadgen import LOAD_ACCOUNTS, LOAD_PASSWORD, BUSY_HEADER
+from bench import BENCH_ENDPOINTS, run_benchmarks, compare_runs
+from api import api
+from data_versions import compact_versions, conditional_get
+from events import occupancy, publish_occupancy, slot_counts
+import perf
+from booking_flow import (
+    BookingError, SCHEDULE_WINDOW_DAYS,
+    money, recalc_booking_total, reserve_slot_seats, release_slot_seats,
+    schedule_query, load_slot, usable_subscriptions, book_slot, pay_booking_due,
+)
+from schedule_series import (
+    WEEKDAY_NAMES, MAX_SERIES_DAYS,
+    weekday_labels, parse_exclusions, format_exclusions, clear_future_slots, generate_slots, shift_series,
+)
 from models import (
-    Base,
     Account,
     ZoneType, ZoneStatus, Zone,
     Position, Employee,
@@ -26,58 +60,59 @@ from models import (
     Visit,
     Payment,
     ScheduleSlot,
+    ScheduleSeries,
     SubscriptionStatus,
     Subscription,
     Notification,
+    RollupZoneDay,
+    RollupPaymentDay,
 )
 
 app = Flask(__name__)
 app.secret_key = "dev-secret-change-me"
-app.config["SEEDED"] = False
+app.config["DB_URL"] = DB_URL
+app.config["SQLITE_PRAGMAS"] = SQLITE_PRAGMAS
+app.register_blueprint(api)
+# до force_auth, чтобы редиректы на вход тоже попадали в замеры
+if perf.PERF_ENABLED:
+    perf.install(app, engine)
 
-@app.before_first_request
-def ensure_seed_data():
-    seed_if_empty()
+login_manager = LoginManager(app)
+login_manager.login_view = "login"
 
 # --- FORCE LOGIN FOR ALL PAGES (кроме /login и статики) ---
-from flask import request
-
-PUBLIC_ENDPOINTS = {"login", "login_post", "client_register", "static"}
+PUBLIC_ENDPOINTS = {"login", "login_post", "client_register", "static", "metrics"}
 
 @app.before_request
 def force_auth():
-    if not app.config.get("SEEDED"):
-        seed_if_empty()
-        app.config["SEEDED"] = True
     if request.endpoint is None:
         return
     if request.endpoint in PUBLIC_ENDPOINTS:
         return
+    # API сам отвечает 401 в JSON вместо редиректа на форму входа
+    if request.blueprint == api.name:
+        return
     if not current_user.is_authenticated:
         return redirect(url_for("login"))
 
 
-
-def db_session() -> Session:
-    return SessionLocal()
-
-
-def money(x) -> Decimal:
-    d = x if isinstance(x, Decimal) else Decimal(str(x))
-    return d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+@app.errorhandler(OperationalError)
+def database_busy(e: OperationalError):
+    """SQLite не дождался блокировки за busy_timeout: 503 «повторите», а не 500."""
+    if "database is locked" not in str(e.orig):
+        raise e
+    app.logger.warning("database is locked: %s %s", request.method, request.path)
+    return Response(
+        "База данных занята, повторите запрос через секунду",
+        status=503,
+        mimetype="text/plain",
+        headers={"Retry-After": "1", BUSY_HEADER: "1"},
+    )
 
 
-def recalc_booking_total(s: Session, booking_id: int) -> None:
-    """Пересчитать total_sum = session_sum + сумма услуг."""
-    b = s.get(Booking, booking_id)
-    if not b:
-        return
-    services_sum = (
-        s.execute(select(func.coalesce(func.sum(BookingService.line_sum), 0)).where(BookingService.booking_id == booking_id))
-        .scalar_one()
-    )
-    b.total_sum = money(Decimal(str(b.session_sum or 0)) + Decimal(str(services_sum or 0)))
 
+def db_session() -> Session:
+    return SessionLocal()
 
 
 def admin_required(fn):
@@ -120,28 +155,261 @@ def parse_dt_local(value: str) -> datetime:
     return datetime.strptime(value, "%Y-%m-%dT%H:%M")
 
 
+def parse_date_arg(value: str):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+    except ValueError:
+        return None
+
+
 @login_manager.user_loader
 def load_user(user_id: str):
+    return principals.get(int(user_id), db_session)
+
+
+def init_db() -> None:
+    """Одноразовый шаг при старте/деплое: миграции схемы + демо-данные.
+
+    Из обработчиков запросов не вызывается — только `flask init-db` / `python app.py`.
+    """
+    run_migrations(engine)
+    seed_if_empty()
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Применить миграции и заполнить справочники/демо-данные."""
+    init_db()
+    click.echo("База данных инициализирована")
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Применить только непримененные миграции схемы."""
+    done = run_migrations(engine)
+    for version, description in done:
+        click.echo(f"  {version:04d} {description}")
+    click.echo(f"Применено миграций: {len(done)}")
+
+
+@app.cli.command("check-indexes")
+def check_indexes_command():
+    """Проверить через EXPLAIN (QUERY PLAN), что горячие запросы идут по индексам."""
+    with engine.connect() as conn:
+        results = check_hot_queries(conn)
+    for r in results:
+        click.echo(f"[{'OK' if r['ok'] else 'FAIL'}] {r['name']} (ожидается {r['index']})")
+        for line in r["plan"]:
+            click.echo(f"      {line}")
+    if not all(r["ok"] for r in results):
+        raise SystemExit(1)
+
+
+@app.cli.command("check-queries")
+@click.option("--seed-rows", type=int, default=0, help="Сначала добавить демо-клиенту столько броней (только демо-база).")
+@click.option("--yes-really", is_flag=True, help="Подтвердить запись --seed-rows: база — учебная или для замеров.")
+def check_queries_command(seed_rows: int, yes_really: bool):
+    """Сверить число SQL-запросов страниц с бюджетами и поискать N+1 (query_budget.py)."""
+    if seed_rows > 0:
+        if not yes_really:
+            # слоты, брони и оплаты остаются в базе и видны клиентам — на рабочей базе нельзя
+            raise click.ClickException(
+                f"--seed-rows навсегда добавит слоты, брони и оплаты в {engine.url.render_as_string(hide_password=True)}; "
+                "если это учебная база или база замеров, добавьте --yes-really"
+            )
+        with db_session() as s:
+            click.echo(f"Добавлено броней: {seed_query_fixture(s, seed_rows)}")
+    results = check_query_budgets(app, engine, db_session)
+    for r in results:
+        click.echo(f"[{'OK' if r.ok else 'FAIL'}] {r.path} ({r.budget.role}): {r.queries} из {r.budget.max_queries}, HTTP {r.status}")
+        for sql, times in r.repeated:
+            click.echo(f"      N+1? {times} раз: {sql[:200]}")
+    if not all(r.ok for r in results):
+        raise SystemExit(1)
+
+
+@app.cli.command("check-concurrency")
+@click.option("--threads", type=int, default=40, show_default=True, help="Сколько записей отправить одновременно.")
+@click.option("--capacity", type=int, default=10, show_default=True, help="Вместимость проверочного слота.")
+def check_concurrency_command(threads: int, capacity: int):
+    """Записать на один слот из параллельных потоков и сверить booked_count с бронями (concurrency_check.py)."""
+    report = check_slot_concurrency(db_session, threads, capacity)
+    click.echo(f"Потоков {report.threads}, мест {report.capacity}: записано {report.booked}, отказано {report.rejected}")
+    for error in report.errors:
+        click.echo(f"      ошибка: {error}")
+    for name, ok in report.checks:
+        click.echo(f"[{'OK' if ok else 'FAIL'}] {name}")
+    if not report.ok:
+        raise SystemExit(1)
+
+
+@app.cli.command("check")
+@click.pass_context
+def check_command(ctx: click.Context):
+    """Все проверки подряд с кодом выхода 1 при любой ошибке — точка входа для CI и pre-deploy."""
+    failed = []
+    for command in (check_indexes_command, check_queries_command, check_triggers_command, check_concurrency_command):
+        click.echo(f"== flask {command.name}")
+        try:
+            ctx.invoke(command)
+        except SystemExit as e:
+            if e.code:
+                failed.append(command.name)
+    with engine.connect() as conn:
+        drift = {"rebuild-stats": len(stats_drift(conn)), "reconcile-payments": len(payment_drift(conn))}
+    for name, count in drift.items():
+        click.echo(f"[{'OK' if not count else 'FAIL'}] {name} --dry-run: расхождений {count}")
+        if count:
+            failed.append(name)
+    if failed:
+        click.echo(f"Не прошли: {', '.join(failed)}")
+        raise SystemExit(1)
+    click.echo("Все проверки пройдены")
+
+
+@app.cli.command("reconcile-payments")
+@click.option("--dry-run", is_flag=True, help="Только показать расхождения, не исправлять.")
+def reconcile_payments_command(dry_run: bool):
+    """Сверить Booking.paid_sum/due_sum с таблицей payment и пересобрать их."""
+    with engine.begin() as conn:
+        drift = payment_drift(conn)
+        for d in drift:
+            click.echo(
+                f"  бронь #{d['booking_id']}: paid_sum {d['paid_sum']} -> {d['actual_paid']}, "
+                f"due_sum {d['due_sum']} -> {d['actual_due']}"
+            )
+        click.echo(f"Расхождений: {len(drift)}")
+        if not dry_run:
+            click.echo(f"Пересчитано броней: {rebuild_payment_totals(conn)}")
+
+
+@app.cli.command("rebuild-stats")
+@click.option("--dry-run", is_flag=True, help="Только показать расхождения, не исправлять.")
+def rebuild_stats_command(dry_run: bool):
+    """Сверить счётчики дашборда (stats_counter) с таблицами и пересчитать их."""
+    with engine.begin() as conn:
+        drift = stats_drift(conn)
+        for d in drift:
+            click.echo(f"  {d['name']}: {d['stored']} -> {d['actual']}")
+        click.echo(f"Расхождений: {len(drift)}")
+        if not dry_run:
+            rebuild_stats(conn)
+            click.echo("Счётчики пересчитаны")
+
+
+@app.cli.command("compact-deltas")
+def compact_deltas_command():
+    """PostgreSQL: перенести журналы stats_delta/cache_version_delta в итоговые строки (по cron раз в минуту)."""
+    with engine.begin() as conn:
+        moved = {"stats_delta": compact_stats(conn), "cache_version_delta": compact_versions(conn)}
+    for name, rows in moved.items():
+        click.echo(f"  {name}: " + ("пропущено, сворачивает другой процесс" if rows is None else f"перенесено строк {rows}"))
+
+
+@app.cli.command("check-triggers")
+def check_triggers_command():
+    """Прогнать вставки/UPDATE/удаления в откатываемой транзакции и сверить триггерные счётчики (trigger_check.py)."""
+    with engine.connect() as conn:
+        with conn.begin() as tx:
+            results = check_triggers(conn)
+            tx.rollback()
+    for r in results:
+        click.echo(f"[{'OK' if r['ok'] else 'FAIL'}] {r['name']}" + (f": {r['detail']}" if r["detail"] else ""))
+    if not all(r["ok"] for r in results):
+        raise SystemExit(1)
+
+
+@app.cli.command("refresh-rollups")
+@click.option("--full", is_flag=True, help="Пересобрать свёртки с нуля, а не только изменившиеся дни.")
+def refresh_rollups_command(full: bool):
+    """Обновить дневные свёртки для отчётов (запускать по расписанию, например cron раз в 5–15 минут)."""
+    with engine.begin() as conn:
+        days = refresh_rollups(conn, full=full)
+    click.echo(f"Пересчитано дней: {days}")
+
+
+@app.cli.command("export")
+@click.argument("kind", type=click.Choice(sorted(EXPORTS)))
+@click.option("--from", "date_from", type=click.DateTime(formats=["%Y-%m-%d"]), help="Начало периода (включительно).")
+@click.option("--to", "date_to", type=click.DateTime(formats=["%Y-%m-%d"]), help="Конец периода (включительно).")
+@click.option("--out", type=click.File("w", encoding="utf-8", lazy=True), default="-", help="Файл (по умолчанию stdout).")
+def export_command(kind: str, date_from, date_to, out):
+    """Выгрузить брони/оплаты/услуги/посещения в CSV потоком, без загрузки всех строк в память."""
+    for chunk in stream_csv(engine, kind, date_from and date_from.date(), date_to and date_to.date()):
+        out.write(chunk)
+
+
+@app.cli.command("import-clients")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--dry-run", is_flag=True, help="Только проверить файл и посчитать дубли, ничего не записывать.")
+@click.option("--batch-size", type=int, default=IMPORT_BATCH_ROWS, show_default=True, help="Строк в одной транзакции.")
+def import_clients_command(path: str, dry_run: bool, batch_size: int):
+    """Импортировать клиентов из CSV (колонки ФИО/full_name, телефон, email, дата рождения, примечание)."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        report = import_clients(db_session, f, dry_run=dry_run, batch_size=batch_size)
+    for r in report.rejected:
+        click.echo(f"  строка {r.line}: {r.reason}")
+    if report.rejected_count > len(report.rejected):
+        click.echo(f"  ... и ещё {report.rejected_count - len(report.rejected)}")
+    click.echo(report.summary())
+
+
+@app.cli.command("gen-data")
+@click.option("--scale", type=click.Choice(list(SCALES)), default="small", show_default=True)
+@click.option("--seed", type=int, default=1, show_default=True)
+def gen_data_command(scale: str, seed: int):
+    """Наполнить базу синтетическими данными для замеров (synthetic.py) — только отдельная база."""
+    init_db()
+    report = generate(db_session, SCALES[scale], seed=seed)
+    click.echo(report.summary())
+
+
+@app.cli.command("gen-accounts")
+@click.option("--clients", type=int, default=LOAD_ACCOUNTS["client"], show_default=True)
+@click.option("--staff", type=int, default=LOAD_ACCOUNTS["staff"], show_default=True)
+@click.option("--coaches", type=int, default=LOAD_ACCOUNTS["coach"], show_default=True)
+@click.option("--password", default=LOAD_PASSWORD, show_default=True)
+def gen_accounts_command(clients: int, staff: int, coaches: int, password: str):
+    """Учётки load-<роль>-<N> для нагрузочного прогона loadgen.py — только база замеров."""
     with db_session() as s:
-        return s.get(Account, int(user_id))
+        created = create_load_accounts(s, {"client": clients, "staff": staff, "coach": coaches}, password)
+    click.echo(", ".join(f"{role}: {n}" for role, n in created.items()))
+
+
+@app.cli.command("bench")
+@click.option("--requests", "-n", type=int, default=200, show_default=True, help="Замеров на страницу.")
+@click.option("--seed", type=int, default=1, show_default=True)
+@click.option("--only", multiple=True, type=click.Choice([ep.name for ep in BENCH_ENDPOINTS]), help="Только эти страницы.")
+@click.option("--out", "out_path", type=click.Path(dir_okay=False), default=None, help="JSON с результатами.")
+@click.option("--compare", "compare_path", type=click.Path(exists=True, dir_okay=False), default=None, help="Сравнить с прошлым прогоном.")
+def bench_command(requests: int, seed: int, only: tuple[str, ...], out_path: Optional[str], compare_path: Optional[str]):
+    """Замерить ключевые страницы через тестовый клиент (bench.py)."""
+    try:
+        result = run_benchmarks(app, engine, db_session, requests=requests, seed=seed, only=set(only))
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for name, r in result["endpoints"].items():
+        click.echo(
+            f"{name:<22} p50 {r['p50_ms']:8.2f} мс  p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f}  "
+            f"SQL {r['queries_per_request']:5.1f}  ошибок {r['errors']}"
+            + (f"  память {r['peak_memory_kib']:.0f} КиБ на {r['response_kib']:.0f} КиБ CSV" if "peak_memory_kib" in r else "")
+        )
+    out_path = out_path or f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    click.echo(f"Результаты: {out_path}")
+    if compare_path:
+        with open(compare_path, encoding="utf-8") as f:
+            for line in compare_runs(json.load(f), result):
+                click.echo(f"  {line}")
 
 
 def seed_if_empty():
-    """Создаёт таблицы и заполняет минимальные справочники/демо-данные.
+    """Заполняет минимальные справочники/демо-данные (схема уже создана миграциями).
 
     Важно: функция *обязательно* делает commit, чтобы учётка admin/admin создавалась.
     """
-    Base.metadata.create_all(engine)
     with db_session() as s:
-        def ensure_column(table: str, column: str, ddl: str) -> None:
-            cols = [row[1] for row in s.execute(text(f"PRAGMA table_info({table})")).fetchall()]
-            if column not in cols:
-                s.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
-
-        ensure_column("client", "status_id", "status_id INTEGER")
-        ensure_column("booking", "schedule_slot_id", "schedule_slot_id INTEGER")
-        ensure_column("booking", "subscription_id", "subscription_id INTEGER")
-
         # учётка администратора по умолчанию
         if not s.execute(select(Account).where(Account.login == "admin")).scalar_one_or_none():
             s.add(Account(login="admin", password_hash=generate_password_hash("admin"), role="admin"))
@@ -258,9 +526,9 @@ def seed_if_empty():
         coach_account = s.execute(select(Account).where(Account.login == "coach")).scalar_one_or_none()
         if trainer_employee:
             if coach_account:
-                coach_account.password_hash = generate_password_hash("coach")
                 coach_account.role = "coach"
                 coach_account.employee_id = trainer_employee.id
+                principals.forget(coach_account.id)
             else:
                 s.add(
                     Account(
@@ -271,6 +539,8 @@ def seed_if_empty():
                     )
                 )
 
+        # справочники могли пополниться — работающие процессы перечитают кэш
+        lookups.invalidate(s)
         s.commit()
 
 # ---- auth ----
@@ -281,13 +551,12 @@ def login():
 
 @app.post("/login")
 def login_post():
-    seed_if_empty()
     login_ = request.form.get("login", "").strip()
     pwd = request.form.get("password", "")
     with db_session() as s:
         acc = s.execute(select(Account).where(Account.login == login_)).scalar_one_or_none()
         if acc and check_password_hash(acc.password_hash, pwd):
-            login_user(acc)
+            login_user(principals.put(acc))
             if acc.role == "client":
                 return redirect(url_for("client_dashboard"))
             if acc.role == "coach":
@@ -329,6 +598,7 @@ def account_password():
 
             acc.password_hash = generate_password_hash(new_pwd)
             s.commit()
+            principals.forget(acc.id)
 
         flash("Пароль обновлён", "success")
         return redirect(url_for("dashboard"))
@@ -361,14 +631,14 @@ def client_register():
             if s.execute(select(Account).where(Account.login == login_)).scalar_one_or_none():
                 flash("Такой логин уже занят", "danger")
                 return redirect(url_for("client_register"))
-            status = s.execute(select(ClientStatus).where(ClientStatus.code == "active")).scalar_one()
-            client = Client(full_name=full_name, phone=phone, email=email, dob=dob, status_id=status.id)
+            status_id = lookups.get(s).client_status_id["active"]
+            client = Client(full_name=full_name, phone=phone, email=email, dob=dob, status_id=status_id)
             s.add(client)
             s.flush()
             acc = Account(login=login_, password_hash=generate_password_hash(pwd), role="client", client_id=client.id)
             s.add(acc)
             s.commit()
-            login_user(acc)
+            login_user(principals.put(acc))
         flash("Учётная запись создана", "success")
         return redirect(url_for("client_dashboard"))
 
@@ -424,6 +694,13 @@ def client_dashboard():
     )
 
 
+def parse_time_arg(value: str):
+    try:
+        return datetime.strptime(value, "%H:%M").time() if value else None
+    except ValueError:
+        return None
+
+
 def _client_schedule_filters():
     date_raw = request.args.get("date", "").strip()
     time_from = request.args.get("time_from", "").strip()
@@ -437,44 +714,29 @@ def _client_schedule_filters():
 @app.get("/client/schedule")
 @login_required
 @client_required
+@conditional_get(engine, "schedule_slot", "booking", "zone", "employee")
 def client_schedule():
     date_raw, time_from, time_to, zone_id, lesson_type, employee_id = _client_schedule_filters()
     with db_session() as s:
-        query = select(ScheduleSlot).options(joinedload(ScheduleSlot.zone), joinedload(ScheduleSlot.employee)).where(
-            ScheduleSlot.is_active.is_(True)
+        query = schedule_query(
+            datetime.now(),
+            day=parse_date_arg(date_raw),
+            time_from=parse_time_arg(time_from),
+            time_to=parse_time_arg(time_to),
+            zone_id=int(zone_id) if zone_id.isdigit() else None,
+            lesson_type=lesson_type or None,
+            employee_id=int(employee_id) if employee_id.isdigit() else None,
         )
-        if date_raw:
-            query = query.where(func.date(ScheduleSlot.datetime_from) == date_raw)
-        if time_from:
-            query = query.where(func.strftime("%H:%M", ScheduleSlot.datetime_from) >= time_from)
-        if time_to:
-            query = query.where(func.strftime("%H:%M", ScheduleSlot.datetime_from) <= time_to)
-        if zone_id and zone_id.isdigit():
-            query = query.where(ScheduleSlot.zone_id == int(zone_id))
-        if lesson_type:
-            query = query.where(ScheduleSlot.lesson_type == lesson_type)
-        if employee_id and employee_id.isdigit():
-            query = query.where(ScheduleSlot.employee_id == int(employee_id))
-
         slots = s.execute(query.order_by(ScheduleSlot.datetime_from.asc())).scalars().all()
-        slot_ids = [slot.id for slot in slots]
-        booked_map = {}
-        if slot_ids:
-            booked_rows = s.execute(
-                select(Booking.schedule_slot_id, func.coalesce(func.sum(Booking.participants_count), 0))
-                .join(Booking.status)
-                .where(Booking.schedule_slot_id.in_(slot_ids), BookingStatus.code != "cancelled")
-                .group_by(Booking.schedule_slot_id)
-            ).all()
-            booked_map = {slot_id: qty for slot_id, qty in booked_rows}
-        zones = s.execute(select(Zone).order_by(Zone.zone_name)).scalars().all()
-        employees = s.execute(select(Employee).order_by(Employee.full_name)).scalars().all()
+        available_map = {slot.id: slot_available(s, slot) for slot in slots}
+        lk = lookups.get(s)
     return render_template(
         "client/schedule.html",
         slots=slots,
-        booked_map=booked_map,
-        zones=zones,
-        employees=employees,
+        available_map=available_map,
+        zones=lk.zones,
+        employees=lk.employees,
+        window_days=SCHEDULE_WINDOW_DAYS,
         filters={
             "date": date_raw,
             "time_from": time_from,
@@ -491,42 +753,15 @@ def client_schedule():
 @client_required
 def client_booking_create(slot_id: int):
     with db_session() as s:
-        slot = (
-            s.execute(
-                select(ScheduleSlot)
-                .options(joinedload(ScheduleSlot.zone), joinedload(ScheduleSlot.employee))
-                .where(ScheduleSlot.id == slot_id)
-            )
-            .scalar_one_or_none()
-        )
+        slot = load_slot(s, slot_id)
         if not slot:
             flash("Слот не найден", "danger")
             return redirect(url_for("client_schedule"))
 
-        booked = (
-            s.execute(
-                select(func.coalesce(func.sum(Booking.participants_count), 0))
-                .join(Booking.status)
-                .where(Booking.schedule_slot_id == slot_id, BookingStatus.code != "cancelled")
-            ).scalar_one()
-            or 0
-        )
-        available = max(slot.capacity - int(booked), 0)
-        services = s.execute(select(Service).order_by(Service.name)).scalars().all()
-        subscriptions = (
-            s.execute(
-                select(Subscription)
-                .options(joinedload(Subscription.status), joinedload(Subscription.service))
-                .where(
-                    Subscription.client_id == current_user.client_id,
-                    Subscription.remaining_visits > 0,
-                    Subscription.end_date >= datetime.utcnow().date(),
-                )
-                .order_by(Subscription.end_date.asc())
-            )
-            .scalars()
-            .all()
-        )
+        available = slot_available(s, slot)
+        lk = lookups.get(s)
+        services = lk.services
+        subscriptions = usable_subscriptions(s, current_user.client_id)
         subscription_map = {sub.id: sub for sub in subscriptions}
 
         if request.method == "POST":
@@ -538,65 +773,31 @@ def client_booking_create(slot_id: int):
                 participants = 1
             if participants <= 0:
                 participants = 1
-            if participants > available:
-                flash("Недостаточно свободных мест", "warning")
-                return redirect(url_for("client_booking_create", slot_id=slot_id))
 
-            status = s.execute(select(BookingStatus).where(BookingStatus.code == "new")).scalar_one()
-            session_sum = money(Decimal(str(slot.price)) * participants)
             subscription = None
             if subscription_id:
                 subscription = subscription_map.get(int(subscription_id)) if subscription_id.isdigit() else None
-                if not subscription or subscription.remaining_visits < participants:
+                if not subscription:
                     flash("Недостаточно посещений в абонементе", "warning")
                     return redirect(url_for("client_booking_create", slot_id=slot_id))
-                subscription.remaining_visits -= participants
-                session_sum = money(0)
-
-            booking = Booking(
-                client_id=current_user.client_id,
-                zone_id=slot.zone_id,
-                schedule_slot_id=slot.id,
-                subscription_id=subscription.id if subscription else None,
-                datetime_from=slot.datetime_from,
-                datetime_to=slot.datetime_to,
-                participants_count=participants,
-                session_sum=session_sum,
-                total_sum=session_sum,
-                status_id=status.id,
-            )
-            s.add(booking)
-            s.flush()
 
+            service_qty = {}
             for service in services:
                 qty_raw = request.form.get(f"service_{service.id}_qty", "").strip()
-                if not qty_raw:
-                    continue
                 try:
-                    qty = int(qty_raw)
+                    service_qty[service.id] = int(qty_raw)
                 except ValueError:
                     continue
-                if qty <= 0:
-                    continue
-                line_sum = money(Decimal(str(service.base_price)) * qty)
-                s.add(
-                    BookingService(
-                        booking_id=booking.id,
-                        service_id=service.id,
-                        qty=qty,
-                        unit_price=service.base_price,
-                        line_sum=line_sum,
-                    )
-                )
 
-            recalc_booking_total(s, booking.id)
-            s.add(
-                Notification(
-                    client_id=current_user.client_id,
-                    message=f"Бронь №{booking.id} создана и ожидает оплаты.",
-                )
-            )
-            s.commit()
+            try:
+                booking = book_slot(s, slot, current_user.client_id, participants, lk, subscription, service_qty)
+            except BookingError as e:
+                flash(str(e), "warning")
+                if e.reason == "no_seats":
+                    return redirect(
+                        url_for("client_schedule", date=slot.datetime_from.date().isoformat(), zone_id=slot.zone_id)
+                    )
+                return redirect(url_for("client_booking_create", slot_id=slot_id))
             flash("Бронь создана", "success")
             return redirect(url_for("client_booking_view", booking_id=booking.id))
 
@@ -629,12 +830,6 @@ def client_bookings():
             .scalars()
             .all()
         )
-        paid_rows = s.execute(
-            select(Payment.booking_id, func.coalesce(func.sum(Payment.amount), 0))
-            .where(Payment.booking_id.in_([b.id for b in bookings] or [0]))
-            .group_by(Payment.booking_id)
-        ).all()
-        paid_map = {bid: total for bid, total in paid_rows}
     now = datetime.utcnow()
     visit_status_map = {}
     for booking in bookings:
@@ -650,7 +845,6 @@ def client_bookings():
     return render_template(
         "client/bookings.html",
         bookings=bookings,
-        paid_map=paid_map,
         visit_status_map=visit_status_map,
     )
 
@@ -666,8 +860,7 @@ def client_booking_view(booking_id: int):
                 .options(
                     joinedload(Booking.zone),
                     joinedload(Booking.status),
-                    joinedload(Booking.services).joinedload(BookingService.service),
-                    joinedload(Booking.payments),
+                    selectinload(Booking.services).selectinload(BookingService.service),
                     joinedload(Booking.subscription).joinedload(Subscription.service),
                 )
                 .where(Booking.id == booking_id, Booking.client_id == current_user.client_id)
@@ -677,8 +870,7 @@ def client_booking_view(booking_id: int):
         if not booking:
             flash("Бронь не найдена", "danger")
             return redirect(url_for("client_bookings"))
-        paid = sum(float(p.amount) for p in booking.payments)
-    return render_template("client/booking_view.html", booking=booking, paid=paid)
+    return render_template("client/booking_view.html", booking=booking, paid=booking.paid_sum)
 
 
 @app.route("/client/bookings/<int:booking_id>/pay", methods=["GET", "POST"])
@@ -689,7 +881,7 @@ def client_booking_pay(booking_id: int):
         booking = (
             s.execute(
                 select(Booking)
-                .options(joinedload(Booking.payments), joinedload(Booking.status))
+                .options(joinedload(Booking.status))
                 .where(Booking.id == booking_id, Booking.client_id == current_user.client_id)
             )
             .scalar_one_or_none()
@@ -697,26 +889,16 @@ def client_booking_pay(booking_id: int):
         if not booking:
             flash("Бронь не найдена", "danger")
             return redirect(url_for("client_bookings"))
-        total_paid = sum(float(p.amount) for p in booking.payments)
-        total_sum = float(booking.total_sum or 0)
-        due = max(total_sum - total_paid, 0.0)
+        total_paid = booking.paid_sum
+        total_sum = money(booking.total_sum or 0)
+        due = max(booking.due_sum, money(0))
 
         if request.method == "POST":
-            method = request.form.get("method", "card")
-            if due <= 0:
-                flash("Бронь уже оплачена", "warning")
+            try:
+                pay_booking_due(s, booking, request.form.get("method", "card"), lookups.get(s))
+            except BookingError as e:
+                flash(str(e), "warning")
                 return redirect(url_for("client_booking_view", booking_id=booking_id))
-            payment = Payment(booking_id=booking.id, amount=money(due), method=method)
-            s.add(payment)
-            status = s.execute(select(BookingStatus).where(BookingStatus.code == "confirmed")).scalar_one()
-            booking.status_id = status.id
-            s.add(
-                Notification(
-                    client_id=current_user.client_id,
-                    message=f"Оплата по брони №{booking.id} принята. Бронь подтверждена.",
-                )
-            )
-            s.commit()
             flash("Оплата прошла успешно", "success")
             return redirect(url_for("client_booking_view", booking_id=booking_id))
 
@@ -771,8 +953,8 @@ def client_subscriptions():
 @client_required
 def client_subscription_purchase():
     with db_session() as s:
-        services = s.execute(select(Service).order_by(Service.name)).scalars().all()
-        status = s.execute(select(SubscriptionStatus).where(SubscriptionStatus.code == "active")).scalar_one()
+        lk = lookups.get(s)
+        services = lk.services
 
         if request.method == "POST":
             service_id = request.form.get("service_id") or None
@@ -796,7 +978,7 @@ def client_subscription_purchase():
                 end_date=end_date,
                 total_visits=visits,
                 remaining_visits=visits,
-                status_id=status.id,
+                status_id=lk.subscription_status_id["active"],
             )
             s.add(subscription)
             s.add(
@@ -819,8 +1001,9 @@ def client_notifications():
     with db_session() as s:
         if request.method == "POST":
             s.execute(
-                text("UPDATE notification SET is_read = 1 WHERE client_id = :cid"),
-                {"cid": current_user.client_id},
+                update(Notification)
+                .where(Notification.client_id == current_user.client_id, Notification.is_read.is_(False))
+                .values(is_read=True)
             )
             s.commit()
             flash("Уведомления отмечены как прочитанные", "success")
@@ -847,6 +1030,7 @@ def _current_coach_employee(s: Session) -> Optional[Employee]:
 @app.get("/coach")
 @login_required
 @coach_required
+@conditional_get(engine, "schedule_slot", "booking", "zone", "employee")
 def coach_dashboard():
     with db_session() as s:
         employee = _current_coach_employee(s)
@@ -863,17 +1047,8 @@ def coach_dashboard():
             .scalars()
             .all()
         )
-        slot_ids = [slot.id for slot in slots]
-        bookings_map = {}
-        if slot_ids:
-            rows = s.execute(
-                select(Booking.schedule_slot_id, func.count(Booking.id))
-                .join(Booking.status)
-                .where(Booking.schedule_slot_id.in_(slot_ids), BookingStatus.code != "cancelled")
-                .group_by(Booking.schedule_slot_id)
-            ).all()
-            bookings_map = {slot_id: count for slot_id, count in rows}
-    return render_template("coach/dashboard.html", employee=employee, slots=slots, bookings_map=bookings_map)
+        counts = slot_counts(s, [slot.id for slot in slots])
+    return render_template("coach/dashboard.html", employee=employee, slots=slots, counts=counts)
 
 
 @app.route("/coach/schedule/create", methods=["GET", "POST"])
@@ -885,7 +1060,7 @@ def coach_schedule_create():
         if not employee:
             flash("Профиль тренера не найден", "danger")
             return redirect(url_for("logout"))
-        zones = s.execute(select(Zone).order_by(Zone.zone_name)).scalars().all()
+        zones = lookups.get(s).zones
 
         if request.method == "POST":
             zone_id_raw = request.form.get("zone_id", "")
@@ -900,7 +1075,7 @@ def coach_schedule_create():
                 flash("Заполните все обязательные поля", "warning")
                 return redirect(url_for("coach_schedule_create"))
 
-            zone = s.get(Zone, int(zone_id_raw))
+            zone = lookups.get(s).zone_by_id.get(int(zone_id_raw))
             if not zone:
                 flash("Зона не найдена", "danger")
                 return redirect(url_for("coach_schedule_create"))
@@ -953,7 +1128,7 @@ def coach_schedule_edit(slot_id: int):
         if not slot:
             flash("Слот не найден", "danger")
             return redirect(url_for("coach_dashboard"))
-        zones = s.execute(select(Zone).order_by(Zone.zone_name)).scalars().all()
+        zones = lookups.get(s).zones
 
         if request.method == "POST":
             zone_id_raw = request.form.get("zone_id", "")
@@ -968,7 +1143,7 @@ def coach_schedule_edit(slot_id: int):
                 flash("Заполните все обязательные поля", "warning")
                 return redirect(url_for("coach_schedule_edit", slot_id=slot_id))
 
-            zone = s.get(Zone, int(zone_id_raw))
+            zone = lookups.get(s).zone_by_id.get(int(zone_id_raw))
             if not zone:
                 flash("Зона не найдена", "danger")
                 return redirect(url_for("coach_schedule_edit", slot_id=slot_id))
@@ -1024,6 +1199,269 @@ def coach_schedule_view(slot_id: int):
             .all()
         )
     return render_template("coach/schedule_view.html", slot=slot, bookings=bookings)
+
+
+# ---- coach: повторяющиеся смены ----
+SERIES_FIELDS = ("zone_id", "time_from", "time_to", "date_from", "date_to", "exclusions", "capacity", "price", "lesson_type")
+
+
+def _series_values(series: Optional[ScheduleSeries] = None) -> dict:
+    """Значения формы серии: из запроса (POST), из серии или пустые."""
+    if request.method == "POST":
+        values = {key: request.form.get(key, "").strip() for key in SERIES_FIELDS}
+        values["weekdays"] = request.form.getlist("weekdays")
+        return values
+    if series is None:
+        return {key: "" for key in SERIES_FIELDS} | {"weekdays": [], "lesson_type": "group"}
+    return {
+        "zone_id": str(series.zone_id),
+        "time_from": series.time_from.strftime("%H:%M"),
+        "time_to": series.time_to.strftime("%H:%M"),
+        "date_from": series.date_from.isoformat(),
+        "date_to": series.date_to.isoformat(),
+        "exclusions": (series.exclusions or "").replace(",", "\n"),
+        "capacity": str(series.capacity),
+        "price": str(series.price),
+        "lesson_type": series.lesson_type,
+        "weekdays": list(series.weekdays),
+    }
+
+
+def _apply_series_values(series: ScheduleSeries, values: dict, lk) -> Optional[str]:
+    """Проверить значения формы и записать их в серию; вернуть текст ошибки или None."""
+    zone = lk.zone_by_id.get(int(values["zone_id"])) if values["zone_id"].isdigit() else None
+    if not zone:
+        return "Зона не найдена"
+    weekdays = sorted({d for d in values["weekdays"] if d in ("0", "1", "2", "3", "4", "5", "6")})
+    if not weekdays:
+        return "Выберите хотя бы один день недели"
+    time_from, time_to = parse_time_arg(values["time_from"]), parse_time_arg(values["time_to"])
+    if not time_from or not time_to or time_to <= time_from:
+        return "Конец должен быть позже начала"
+    date_from, date_to = parse_date_arg(values["date_from"]), parse_date_arg(values["date_to"])
+    if not date_from or not date_to or date_to < date_from:
+        return "Проверьте период дат"
+    if (date_to - date_from).days > MAX_SERIES_DAYS:
+        return f"Период серии — не больше {MAX_SERIES_DAYS} дней"
+    capacity = int(values["capacity"]) if values["capacity"].isdigit() else zone.capacity
+    if capacity <= 0:
+        return "Вместимость должна быть больше 0"
+    try:
+        price = money(values["price"] or zone.base_price)
+    except InvalidOperation:
+        return "Некорректная цена"
+
+    series.zone_id = zone.id
+    series.weekdays = "".join(weekdays)
+    series.time_from, series.time_to = time_from, time_to
+    series.date_from, series.date_to = date_from, date_to
+    series.exclusions = format_exclusions(parse_exclusions(values["exclusions"]))
+    series.capacity = capacity
+    series.price = price
+    series.lesson_type = values["lesson_type"] or "group"
+    return None
+
+
+def _coach_series(s: Session, employee: Employee, series_id: int) -> Optional[ScheduleSeries]:
+    return s.execute(
+        select(ScheduleSeries).where(ScheduleSeries.id == series_id, ScheduleSeries.employee_id == employee.id)
+    ).scalar_one_or_none()
+
+
+def _flash_generated(created: int, kept: int, skipped: int) -> None:
+    message = f"Создано слотов: {created}"
+    if kept:
+        message += f", оставлено слотов с бронями: {kept}"
+    if skipped:
+        message += f", пропущено пересечений: {skipped}"
+    flash(message, "success")
+
+
+@app.get("/coach/series")
+@login_required
+@coach_required
+def coach_series_list():
+    with db_session() as s:
+        employee = _current_coach_employee(s)
+        if not employee:
+            flash("Профиль тренера не найден", "danger")
+            return redirect(url_for("logout"))
+        series_list = (
+            s.execute(
+                select(ScheduleSeries)
+                .options(joinedload(ScheduleSeries.zone))
+                .where(ScheduleSeries.employee_id == employee.id)
+                .order_by(ScheduleSeries.date_from.desc())
+            )
+            .scalars()
+            .all()
+        )
+        upcoming = dict(
+            s.execute(
+                select(ScheduleSlot.series_id, func.count(ScheduleSlot.id))
+                .where(ScheduleSlot.series_id.in_([it.id for it in series_list]), ScheduleSlot.datetime_from >= datetime.now())
+                .group_by(ScheduleSlot.series_id)
+            ).all()
+        )
+    return render_template(
+        "coach/series_list.html",
+        series_list=series_list,
+        upcoming=upcoming,
+        weekday_labels=weekday_labels,
+    )
+
+
+@app.route("/coach/series/create", methods=["GET", "POST"])
+@login_required
+@coach_required
+def coach_series_create():
+    conflicts = []
+    with db_session() as s:
+        employee = _current_coach_employee(s)
+        if not employee:
+            flash("Профиль тренера не найден", "danger")
+            return redirect(url_for("logout"))
+        lk = lookups.get(s)
+        values = _series_values()
+
+        if request.method == "POST":
+            series = ScheduleSeries(employee_id=employee.id)
+            error = _apply_series_values(series, values, lk)
+            if error:
+                flash(error, "warning")
+            else:
+                s.add(series)
+                s.flush()
+                skip = bool(request.form.get("skip_conflicts"))
+                created, conflicts = generate_slots(s, series, datetime.now(), skip_conflicts=skip)
+                if conflicts and not skip:
+                    s.rollback()
+                    flash("Часть смен пересекается с занятиями в этой зоне", "warning")
+                else:
+                    s.commit()
+                    _flash_generated(created, 0, len(conflicts))
+                    return redirect(url_for("coach_series_list"))
+
+    return render_template(
+        "coach/series_form.html",
+        series=None,
+        values=values,
+        zones=lk.zones,
+        conflicts=conflicts,
+        weekday_names=WEEKDAY_NAMES,
+    )
+
+
+@app.route("/coach/series/<int:series_id>/edit", methods=["GET", "POST"])
+@login_required
+@coach_required
+def coach_series_edit(series_id: int):
+    conflicts = []
+    with db_session() as s:
+        employee = _current_coach_employee(s)
+        if not employee:
+            flash("Профиль тренера не найден", "danger")
+            return redirect(url_for("logout"))
+        series = _coach_series(s, employee, series_id)
+        if not series:
+            flash("Серия не найдена", "danger")
+            return redirect(url_for("coach_series_list"))
+        lk = lookups.get(s)
+        values = _series_values(series)
+
+        if request.method == "POST":
+            error = _apply_series_values(series, values, lk)
+            if error:
+                flash(error, "warning")
+            else:
+                # перегенерация: будущие слоты без броней пересоздаются по новому правилу
+                now = datetime.now()
+                kept = clear_future_slots(s, series, now)
+                skip = bool(request.form.get("skip_conflicts"))
+                created, conflicts = generate_slots(s, series, now, skip_conflicts=skip)
+                if conflicts and not skip:
+                    s.rollback()
+                    flash("Часть смен пересекается с занятиями в этой зоне", "warning")
+                else:
+                    s.commit()
+                    _flash_generated(created, kept, len(conflicts))
+                    return redirect(url_for("coach_series_list"))
+        series_info = {"id": series.id, "zone_id": series.zone_id}
+
+    return render_template(
+        "coach/series_form.html",
+        series=series_info,
+        values=values,
+        zones=lk.zones,
+        conflicts=conflicts,
+        weekday_names=WEEKDAY_NAMES,
+    )
+
+
+@app.post("/coach/series/<int:series_id>/shift")
+@login_required
+@coach_required
+def coach_series_shift(series_id: int):
+    try:
+        days = int(request.form.get("days") or 0)
+        minutes = int(request.form.get("minutes") or 0)
+    except ValueError:
+        flash("Сдвиг — целое число дней и минут", "warning")
+        return redirect(url_for("coach_series_edit", series_id=series_id))
+    with db_session() as s:
+        employee = _current_coach_employee(s)
+        if not employee:
+            flash("Профиль тренера не найден", "danger")
+            return redirect(url_for("logout"))
+        series = _coach_series(s, employee, series_id)
+        if not series:
+            flash("Серия не найдена", "danger")
+            return redirect(url_for("coach_series_list"))
+        shift_series(series, days=days, minutes=minutes)
+        if series.time_to <= series.time_from:
+            flash("После сдвига смена переходит через полночь — так нельзя", "warning")
+            return redirect(url_for("coach_series_edit", series_id=series_id))
+        now = datetime.now()
+        kept = clear_future_slots(s, series, now)
+        skip = bool(request.form.get("skip_conflicts"))
+        created, conflicts = generate_slots(s, series, now, skip_conflicts=skip)
+        if conflicts and not skip:
+            s.rollback()
+            first = conflicts[0]
+            flash(
+                f"Сдвиг даёт пересечений: {len(conflicts)} (первое — {first.start.strftime('%d.%m.%Y %H:%M')}). "
+                "Отметьте «пропустить пересечения», чтобы сдвинуть остальные",
+                "warning",
+            )
+            return redirect(url_for("coach_series_edit", series_id=series_id))
+        s.commit()
+        _flash_generated(created, kept, len(conflicts))
+    return redirect(url_for("coach_series_list"))
+
+
+@app.post("/coach/series/<int:series_id>/delete")
+@login_required
+@coach_required
+def coach_series_delete(series_id: int):
+    with db_session() as s:
+        employee = _current_coach_employee(s)
+        if not employee:
+            flash("Профиль тренера не найден", "danger")
+            return redirect(url_for("logout"))
+        series = _coach_series(s, employee, series_id)
+        if series:
+            kept = clear_future_slots(s, series, datetime.now())
+            # прошедшие слоты и слоты с бронями остаются как обычные разовые
+            s.execute(
+                update(ScheduleSlot)
+                .where(ScheduleSlot.series_id == series.id)
+                .values(series_id=None)
+                .execution_options(synchronize_session=False)
+            )
+            s.delete(series)
+            s.commit()
+            flash(f"Серия удалена, будущих слотов с бронями оставлено: {kept}", "success")
+    return redirect(url_for("coach_series_list"))
 # ---- dashboard ----
 @app.get("/")
 @login_required
@@ -1031,35 +1469,240 @@ def dashboard():
     if current_user.role == "client":
         return redirect(url_for("client_dashboard"))
     with db_session() as s:
-        stats = {
-            "zones": s.execute(select(func.count(Zone.id))).scalar_one(),
-            "clients": s.execute(select(func.count(Client.id))).scalar_one(),
-            "bookings": s.execute(select(func.count(Booking.id))).scalar_one(),
-            "payments": s.execute(select(func.count(Payment.id))).scalar_one(),
-        }
+        # счётчики ведут триггеры (stats.py) — вместо COUNT(*) по таблицам
+        stats = read_stats(s)
         latest = (
             s.execute(
                 select(Booking)
-                .options(joinedload(Booking.client), joinedload(Booking.zone), joinedload(Booking.status))
+                .options(joinedload(Booking.client))
                 .order_by(Booking.id.desc())
                 .limit(10)
             )
             .scalars()
             .all()
         )
-    return render_template("dashboard.html", stats=stats, latest=latest)
+        lk = lookups.get(s)
+    return render_template(
+        "dashboard.html",
+        stats=stats,
+        latest=latest,
+        zone_by_id=lk.zone_by_id,
+        status_by_id=lk.booking_status_by_id,
+    )
+
+
+@app.get("/admin/diagnostics")
+@login_required
+@admin_required
+def admin_diagnostics():
+    with engine.connect() as conn:
+        versions = sorted(applied_versions(conn))
+    return render_template(
+        "admin/diagnostics.html",
+        db_url=engine.url.render_as_string(hide_password=True),
+        db_backend=DB_BACKEND,
+        server_version=server_version(),
+        pragmas=sqlite_pragma_status(),
+        pool=pool_status(),
+        schema_version=versions[-1] if versions else None,
+    )
+
+
+@app.route("/admin/perf", methods=["GET", "POST"])
+@login_required
+@admin_required
+def admin_perf():
+    if request.method == "POST":
+        perf.profiler.reset()
+        flash("Статистика профилирования сброшена", "success")
+        return redirect(url_for("admin_perf"))
+    return render_template(
+        "admin/perf.html",
+        profiler=perf.profiler,
+        endpoints=perf.profiler.snapshot(),
+        slow_queries=list(reversed(perf.profiler.slow_queries)),
+        slow_query_ms=perf.SLOW_QUERY_MS,
+    )
+
+
+@app.get("/metrics")
+def metrics():
+    """Метрики профилирования для Prometheus: по токену PERF_METRICS_TOKEN или для вошедшего админа."""
+    token_ok = bool(perf.METRICS_TOKEN) and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {perf.METRICS_TOKEN}".encode()
+    )
+    admin_ok = current_user.is_authenticated and getattr(current_user, "role", "") in ("admin", "staff")
+    if not (token_ok or admin_ok):
+        abort(401)
+    if not perf.profiler.enabled:
+        abort(404)
+    return Response(perf.profiler.prometheus_text(), content_type="text/plain; version=0.0.4; charset=utf-8", headers={"Cache-Control": "no-store"})
+
+
+# ---- живая загрузка слотов (Server-Sent Events) ----
+# пустой комментарий раз в столько секунд не даёт прокси закрыть тихое соединение
+SSE_HEARTBEAT = 15.0
+
+
+@app.get("/events/occupancy")
+@login_required
+def occupancy_stream():
+    """Поток событий загрузки слотов (events.py); ?zone_id= — только одна зона."""
+    zone_raw = request.args.get("zone_id", "").strip()
+    zone_id = int(zone_raw) if zone_raw.isdigit() else None
+
+    def stream():
+        sub = occupancy.subscribe(zone_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = sub.get(timeout=SSE_HEARTBEAT)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: occupancy\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            occupancy.unsubscribe(sub)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---- отчёты (только из свёрток rollup_*) ----
+REPORT_DEFAULT_DAYS = 30
+
+
+@app.get("/reports")
+@login_required
+@admin_required
+def reports():
+    today = datetime.now().date()
+    date_to = parse_date_arg(request.args.get("date_to", "")) or today
+    date_from = parse_date_arg(request.args.get("date_from", "")) or date_to - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    period = (RollupZoneDay.day >= date_from, RollupZoneDay.day <= date_to)
+    metrics = (
+        func.sum(RollupZoneDay.bookings).label("bookings"),
+        func.sum(RollupZoneDay.participants).label("participants"),
+        func.sum(RollupZoneDay.session_revenue).label("session_revenue"),
+        func.sum(RollupZoneDay.service_revenue).label("service_revenue"),
+        func.sum(RollupZoneDay.cancellations).label("cancellations"),
+        func.sum(RollupZoneDay.no_shows).label("no_shows"),
+    )
+
+    with db_session() as s:
+        by_day = s.execute(
+            select(RollupZoneDay.day, *metrics).where(*period).group_by(RollupZoneDay.day).order_by(RollupZoneDay.day.desc())
+        ).all()
+        by_zone = s.execute(
+            select(RollupZoneDay.zone_id, *metrics).where(*period).group_by(RollupZoneDay.zone_id)
+        ).all()
+        by_method = s.execute(
+            select(
+                RollupPaymentDay.method,
+                func.sum(RollupPaymentDay.payments).label("payments"),
+                func.sum(RollupPaymentDay.amount).label("amount"),
+            )
+            .where(RollupPaymentDay.day >= date_from, RollupPaymentDay.day <= date_to)
+            .group_by(RollupPaymentDay.method)
+            .order_by(RollupPaymentDay.method)
+        ).all()
+        refreshed_at = last_refresh(s.connection())
+        lk = lookups.get(s)
+
+    return render_template(
+        "admin/reports.html",
+        filters={"date_from": date_from.isoformat(), "date_to": date_to.isoformat()},
+        by_day=by_day,
+        by_zone=sorted(by_zone, key=lambda r: lk.zone_by_id[r.zone_id].zone_name if r.zone_id in lk.zone_by_id else ""),
+        by_method=by_method,
+        zone_by_id=lk.zone_by_id,
+        refreshed_at=refreshed_at,
+    )
+
+
+@app.get("/exports/<kind>.csv")
+@login_required
+@admin_required
+def export_csv(kind: str):
+    if kind not in EXPORTS:
+        abort(404)
+    date_from = parse_date_arg(request.args.get("date_from", ""))
+    date_to = parse_date_arg(request.args.get("date_to", ""))
+    return Response(
+        stream_csv(engine, kind, date_from, date_to),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={export_filename(kind, date_from, date_to)}"},
+    )
 
 
 # ---- generic render helpers ----
-def render_list(title: str, headers: list[str], rows: list[dict], create_url: str, subtitle: Optional[str] = None, active: str = ''):
-    class R:
-        def __init__(self, cells, edit_url, delete_url):
-            self.cells = cells
-            self.edit_url = edit_url
-            self.delete_url = delete_url
+LIST_PAGE_SIZE = 50
+
+
+def render_list(
+    title: str,
+    headers: list[str],
+    query,
+    row,
+    create_url: str,
+    sort_columns: Optional[list] = None,
+    search_columns: tuple = (),
+    search_filter: Optional[Callable] = None,
+    subtitle: Optional[str] = None,
+    active: str = '',
+    actions: tuple = (),
+):
+    """Список справочника: поиск, сортировка, LIMIT/OFFSET и подсчёт — на стороне SQL.
+
+    query — select() без ORDER BY/LIMIT; row(obj) -> {"cells", "edit_url", "delete_url"};
+    sort_columns — колонки по порядку заголовков (None — столбец без сортировки);
+    search_filter(q) -> условие WHERE — вместо подстроки по search_columns (например, FTS);
+    actions — дополнительные кнопки рядом с «Добавить»: (подпись, url, иконка).
+    Параметры запроса: q, sort (номер столбца), dir (asc/desc), page.
+    """
+    sort_columns = sort_columns or []
+    q = request.args.get("q", "").strip()
+    sort_raw = request.args.get("sort", "0")
+    sort = int(sort_raw) if sort_raw.isdigit() and int(sort_raw) < len(sort_columns) and sort_columns[int(sort_raw)] is not None else 0
+    direction = "asc" if request.args.get("dir") == "asc" else "desc"
+    page_raw = request.args.get("page", "1")
+    page = max(int(page_raw), 1) if page_raw.isdigit() else 1
+
+    if q and search_filter:
+        query = query.where(search_filter(q))
+    elif q and search_columns:
+        # icontains экранирует % и _ из ввода
+        query = query.where(or_(*(col.icontains(q, autoescape=True) for col in search_columns)))
 
-    rlist = [R(**r) for r in rows]
-    return render_template("common/list.html", title=title, subtitle=subtitle, headers=headers, rows=rlist, create_url=create_url, active=active)
+    with db_session() as s:
+        total = s.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar_one()
+        pages = max((total + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE, 1)
+        page = min(page, pages)
+        if sort_columns:
+            col = sort_columns[sort]
+            # второй ключ — первичный ключ, чтобы порядок между страницами был стабильным
+            pk = sort_columns[0]
+            order = (col.asc(), pk.asc()) if direction == "asc" else (col.desc(), pk.desc())
+            query = query.order_by(*order)
+        items = s.execute(query.limit(LIST_PAGE_SIZE).offset((page - 1) * LIST_PAGE_SIZE)).scalars().all()
+        rows = [row(it) for it in items]
+
+    return render_template(
+        "common/list.html",
+        title=title,
+        subtitle=subtitle,
+        headers=headers,
+        sortable=[c is not None for c in sort_columns] or [False] * len(headers),
+        rows=rows,
+        create_url=create_url,
+        active=active,
+        searchable=bool(search_columns or search_filter),
+        actions=actions,
+        list_state={"q": q, "sort": sort, "dir": direction, "page": page, "pages": pages, "total": total},
+    )
 
 
 def render_form(title: str, fields: list[dict], back_url: str, subtitle: Optional[str] = None, active: str = ''):
@@ -1071,14 +1714,17 @@ def render_form(title: str, fields: list[dict], back_url: str, subtitle: Optiona
 @login_required
 @admin_required
 def zone_types_list():
-    with db_session() as s:
-        items = s.execute(select(ZoneType).order_by(ZoneType.id.desc())).scalars().all()
-    rows = [{
+    row = lambda it: {
         "cells": [it.id, it.code, it.name, (it.description or "")],
         "edit_url": url_for("zone_type_edit", item_id=it.id),
         "delete_url": url_for("zone_type_delete", item_id=it.id),
-    } for it in items]
-    return render_list("Типы зон", ["ID", "Код", "Название", "Описание"], rows, url_for("zone_type_create"), active="zone_types")
+    }
+    return render_list(
+        "Типы зон", ["ID", "Код", "Название", "Описание"], select(ZoneType), row, url_for("zone_type_create"),
+        sort_columns=[ZoneType.id, ZoneType.code, ZoneType.name, None],
+        search_columns=(ZoneType.code, ZoneType.name),
+        active="zone_types",
+    )
 
 
 @app.route("/zone-types/create", methods=["GET", "POST"])
@@ -1097,6 +1743,7 @@ def zone_type_create():
                 flash("Такой код уже существует", "danger")
                 return redirect(url_for("zone_type_create"))
             s.add(ZoneType(code=code, name=name, description=desc))
+            lookups.invalidate(s)
             s.commit()
         flash("Тип зоны добавлен", "success")
         return redirect(url_for("zone_types_list"))
@@ -1122,6 +1769,7 @@ def zone_type_edit(item_id: int):
             it.code = request.form.get("code", "").strip()
             it.name = request.form.get("name", "").strip()
             it.description = request.form.get("description", "").strip() or None
+            lookups.invalidate(s)
             s.commit()
             flash("Сохранено", "success")
             return redirect(url_for("zone_types_list"))
@@ -1142,6 +1790,7 @@ def zone_type_delete(item_id: int):
         it = s.get(ZoneType, item_id)
         if it:
             s.delete(it)
+            lookups.invalidate(s)
             s.commit()
             flash("Удалено", "success")
     return redirect(url_for("zone_types_list"))
@@ -1152,14 +1801,17 @@ def zone_type_delete(item_id: int):
 @login_required
 @admin_required
 def zone_statuses_list():
-    with db_session() as s:
-        items = s.execute(select(ZoneStatus).order_by(ZoneStatus.id.desc())).scalars().all()
-    rows = [{
+    row = lambda it: {
         "cells": [it.id, it.code, it.name],
         "edit_url": url_for("zone_status_edit", item_id=it.id),
         "delete_url": url_for("zone_status_delete", item_id=it.id),
-    } for it in items]
-    return render_list("Статусы зон", ["ID", "Код", "Название"], rows, url_for("zone_status_create"), active="zone_statuses")
+    }
+    return render_list(
+        "Статусы зон", ["ID", "Код", "Название"], select(ZoneStatus), row, url_for("zone_status_create"),
+        sort_columns=[ZoneStatus.id, ZoneStatus.code, ZoneStatus.name],
+        search_columns=(ZoneStatus.code, ZoneStatus.name),
+        active="zone_statuses",
+    )
 
 
 @app.route("/zone-statuses/create", methods=["GET", "POST"])
@@ -1177,6 +1829,7 @@ def zone_status_create():
                 flash("Такой код уже существует", "danger")
                 return redirect(url_for("zone_status_create"))
             s.add(ZoneStatus(code=code, name=name))
+            lookups.invalidate(s)
             s.commit()
         flash("Статус зоны добавлен", "success")
         return redirect(url_for("zone_statuses_list"))
@@ -1200,6 +1853,7 @@ def zone_status_edit(item_id: int):
         if request.method == "POST":
             it.code = request.form.get("code", "").strip()
             it.name = request.form.get("name", "").strip()
+            lookups.invalidate(s)
             s.commit()
             flash("Сохранено", "success")
             return redirect(url_for("zone_statuses_list"))
@@ -1219,6 +1873,7 @@ def zone_status_delete(item_id: int):
         it = s.get(ZoneStatus, item_id)
         if it:
             s.delete(it)
+            lookups.invalidate(s)
             s.commit()
             flash("Удалено", "success")
     return redirect(url_for("zone_statuses_list"))
@@ -1229,13 +1884,7 @@ def zone_status_delete(item_id: int):
 @login_required
 @admin_required
 def zones_list():
-    with db_session() as s:
-        items = (
-            s.execute(select(Zone).options(joinedload(Zone.type), joinedload(Zone.status)).order_by(Zone.id.desc()))
-            .scalars()
-            .all()
-        )
-    rows = [{
+    row = lambda it: {
         "cells": [
             it.id,
             it.zone_name,
@@ -1246,8 +1895,14 @@ def zones_list():
         ],
         "edit_url": url_for("zone_edit", item_id=it.id),
         "delete_url": url_for("zone_delete", item_id=it.id),
-    } for it in items]
-    return render_list("Зоны", ["ID", "Название", "Тип", "Вместимость", "Базовая цена", "Статус"], rows, url_for("zone_create"), active="zones")
+    }
+    return render_list(
+        "Зоны", ["ID", "Название", "Тип", "Вместимость", "Базовая цена", "Статус"],
+        select(Zone).options(joinedload(Zone.type), joinedload(Zone.status)), row, url_for("zone_create"),
+        sort_columns=[Zone.id, Zone.zone_name, None, Zone.capacity, Zone.base_price, None],
+        search_columns=(Zone.zone_name,),
+        active="zones",
+    )
 
 
 @app.route("/zones/create", methods=["GET", "POST"])
@@ -1255,8 +1910,7 @@ def zones_list():
 @admin_required
 def zone_create():
     with db_session() as s:
-        ztypes = s.execute(select(ZoneType).order_by(ZoneType.name)).scalars().all()
-        zstats = s.execute(select(ZoneStatus).order_by(ZoneStatus.name)).scalars().all()
+        lk = lookups.get(s)
 
         if request.method == "POST":
             zone_name = request.form.get("zone_name", "").strip()
@@ -1276,6 +1930,7 @@ def zone_create():
 
             s.add(Zone(zone_name=zone_name, type_id=type_id, status_id=status_id,
                        capacity=capacity, base_price=base_price, description=desc))
+            lookups.invalidate(s)
             s.commit()
             flash("Зона добавлена", "success")
             return redirect(url_for("zones_list"))
@@ -1285,9 +1940,9 @@ def zone_create():
         {"name": "capacity", "label": "Вместимость (чел)", "type": "number", "required": True, "col": "col-md-3", "help": "Напр. 10"},
         {"name": "base_price", "label": "Базовая цена (за 1 час)", "type": "number", "required": True, "col": "col-md-3", "help": "Напр. 800.00"},
         {"name": "type_id", "label": "Тип зоны", "type": "select", "required": True, "col": "col-md-6",
-         "options": [{"value": t.id, "label": f"{t.name} ({t.code})"} for t in ztypes]},
+         "options": lk.zone_type_options()},
         {"name": "status_id", "label": "Статус", "type": "select", "required": True, "col": "col-md-6",
-         "options": [{"value": st.id, "label": f"{st.name} ({st.code})"} for st in zstats]},
+         "options": lk.zone_status_options()},
         {"name": "description", "label": "Описание", "type": "textarea", "required": False},
     ]
     return render_form("Добавить зону", fields, url_for("zones_list"), active="zones")
@@ -1303,8 +1958,7 @@ def zone_edit(item_id: int):
             flash("Не найдено", "danger")
             return redirect(url_for("zones_list"))
 
-        ztypes = s.execute(select(ZoneType).order_by(ZoneType.name)).scalars().all()
-        zstats = s.execute(select(ZoneStatus).order_by(ZoneStatus.name)).scalars().all()
+        lk = lookups.get(s)
 
         if request.method == "POST":
             it.zone_name = request.form.get("zone_name", "").strip()
@@ -1313,6 +1967,7 @@ def zone_edit(item_id: int):
             it.type_id = int(request.form.get("type_id"))
             it.status_id = int(request.form.get("status_id"))
             it.description = request.form.get("description", "").strip() or None
+            lookups.invalidate(s)
             s.commit()
             flash("Сохранено", "success")
             return redirect(url_for("zones_list"))
@@ -1322,9 +1977,9 @@ def zone_edit(item_id: int):
             {"name": "capacity", "label": "Вместимость (чел)", "type": "number", "required": True, "value": it.capacity, "col": "col-md-3"},
             {"name": "base_price", "label": "Базовая цена (за 1 час)", "type": "number", "required": True, "value": float(it.base_price), "col": "col-md-3"},
             {"name": "type_id", "label": "Тип зоны", "type": "select", "required": True, "value": it.type_id, "col": "col-md-6",
-             "options": [{"value": t.id, "label": f"{t.name} ({t.code})"} for t in ztypes]},
+             "options": lk.zone_type_options()},
             {"name": "status_id", "label": "Статус", "type": "select", "required": True, "value": it.status_id, "col": "col-md-6",
-             "options": [{"value": st.id, "label": f"{st.name} ({st.code})"} for st in zstats]},
+             "options": lk.zone_status_options()},
             {"name": "description", "label": "Описание", "type": "textarea", "required": False, "value": it.description},
         ]
     return render_form("Редактировать зону", fields, url_for("zones_list"), active="zones")
@@ -1338,6 +1993,7 @@ def zone_delete(item_id: int):
         it = s.get(Zone, item_id)
         if it:
             s.delete(it)
+            lookups.invalidate(s)
             s.commit()
             flash("Удалено", "success")
     return redirect(url_for("zones_list"))
@@ -1348,14 +2004,17 @@ def zone_delete(item_id: int):
 @login_required
 @admin_required
 def booking_statuses_list():
-    with db_session() as s:
-        items = s.execute(select(BookingStatus).order_by(BookingStatus.id.desc())).scalars().all()
-    rows = [{
+    row = lambda it: {
         "cells": [it.id, it.code, it.name],
         "edit_url": url_for("booking_status_edit", item_id=it.id),
         "delete_url": url_for("booking_status_delete", item_id=it.id),
-    } for it in items]
-    return render_list("Статусы брони", ["ID", "Код", "Название"], rows, url_for("booking_status_create"), active="bookings")
+    }
+    return render_list(
+        "Статусы брони", ["ID", "Код", "Название"], select(BookingStatus), row, url_for("booking_status_create"),
+        sort_columns=[BookingStatus.id, BookingStatus.code, BookingStatus.name],
+        search_columns=(BookingStatus.code, BookingStatus.name),
+        active="bookings",
+    )
 
 
 @app.route("/booking-statuses/create", methods=["GET", "POST"])
@@ -1373,6 +2032,7 @@ def booking_status_create():
                 flash("Такой код уже существует", "danger")
                 return redirect(url_for("booking_status_create"))
             s.add(BookingStatus(code=code, name=name))
+            lookups.invalidate(s)
             s.commit()
         flash("Статус брони добавлен", "success")
         return redirect(url_for("booking_statuses_list"))
@@ -1396,6 +2056,7 @@ def booking_status_edit(item_id: int):
         if request.method == "POST":
             it.code = request.form.get("code", "").strip()
             it.name = request.form.get("name", "").strip()
+            lookups.invalidate(s)
             s.commit()
             flash("Сохранено", "success")
             return redirect(url_for("booking_statuses_list"))
@@ -1415,6 +2076,7 @@ def booking_status_delete(item_id: int):
         it = s.get(BookingStatus, item_id)
         if it:
             s.delete(it)
+            lookups.invalidate(s)
             s.commit()
             flash("Удалено", "success")
     return redirect(url_for("booking_statuses_list"))
@@ -1425,14 +2087,17 @@ def booking_status_delete(item_id: int):
 @login_required
 @admin_required
 def services_list():
-    with db_session() as s:
-        items = s.execute(select(Service).order_by(Service.id.desc())).scalars().all()
-    rows = [{
+    row = lambda it: {
         "cells": [it.id, it.name, f"{float(it.base_price):.2f}", (it.description or "")],
         "edit_url": url_for("service_edit", item_id=it.id),
         "delete_url": url_for("service_delete", item_id=it.id),
-    } for it in items]
-    return render_list("Услуги", ["ID", "Название", "Цена", "Описание"], rows, url_for("service_create"), active="services")
+    }
+    return render_list(
+        "Услуги", ["ID", "Название", "Цена", "Описание"], select(Service), row, url_for("service_create"),
+        sort_columns=[Service.id, Service.name, Service.base_price, None],
+        search_columns=(Service.name, Service.description),
+        active="services",
+    )
 
 
 @app.route("/services/create", methods=["GET", "POST"])
@@ -1448,6 +2113,7 @@ def service_create():
             return redirect(url_for("service_create"))
         with db_session() as s:
             s.add(Service(name=name, base_price=base_price, description=desc))
+            lookups.invalidate(s)
             s.commit()
         flash("Услуга добавлена", "success")
         return redirect(url_for("services_list"))
@@ -1473,6 +2139,7 @@ def service_edit(item_id: int):
             it.name = request.form.get("name", "").strip()
             it.base_price = money(request.form.get("base_price", "0"))
             it.description = request.form.get("description", "").strip() or None
+            lookups.invalidate(s)
             s.commit()
             flash("Сохранено", "success")
             return redirect(url_for("services_list"))
@@ -1493,6 +2160,7 @@ def service_delete(item_id: int):
         it = s.get(Service, item_id)
         if it:
             s.delete(it)
+            lookups.invalidate(s)
             s.commit()
             flash("Удалено", "success")
     return redirect(url_for("services_list"))
@@ -1503,14 +2171,45 @@ def service_delete(item_id: int):
 @login_required
 @admin_required
 def clients_list():
-    with db_session() as s:
-        items = s.execute(select(Client).order_by(Client.id.desc())).scalars().all()
-    rows = [{
+    row = lambda it: {
         "cells": [it.id, it.full_name, (it.phone or ""), (it.email or ""), (it.note or "")],
         "edit_url": url_for("client_edit", item_id=it.id),
         "delete_url": url_for("client_delete", item_id=it.id),
-    } for it in items]
-    return render_list("Клиенты", ["ID", "ФИО", "Телефон", "Email", "Примечание"], rows, url_for("client_create"), active="clients")
+    }
+    return render_list(
+        "Клиенты", ["ID", "ФИО", "Телефон", "Email", "Примечание"], select(Client), row, url_for("client_create"),
+        sort_columns=[Client.id, Client.full_name, Client.phone, Client.email, None],
+        # клиентов много — ищем по индексу client_fts (как подсказки), а не LIKE по всей таблице
+        search_filter=lambda q: client_filter(q, engine.dialect.name),
+        active="clients",
+        actions=(("Импорт CSV", url_for("clients_import"), "fa-file-import"),),
+    )
+
+
+@app.get("/clients/search")
+@login_required
+@admin_required
+def clients_search():
+    """Подсказки клиентов для форм: ?q= -> JSON со списком лучших совпадений."""
+    q = request.args.get("q", "").strip()
+    with db_session() as s:
+        return jsonify(search_clients(s, q))
+
+
+@app.route("/clients/import", methods=["GET", "POST"])
+@login_required
+@admin_required
+def clients_import():
+    report = None
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("Выберите CSV-файл", "warning")
+            return redirect(url_for("clients_import"))
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        report = import_clients(db_session, stream, dry_run=bool(request.form.get("dry_run")))
+        flash(report.summary(), "success" if report.inserted else "info")
+    return render_template("clients/import.html", report=report, columns=COLUMN_ALIASES, active="clients")
 
 
 @app.route("/clients/create", methods=["GET", "POST"])
@@ -1581,24 +2280,72 @@ def client_delete(item_id: int):
 
 
 # ---- Bookings ----
+BOOKINGS_PAGE_SIZE = 50
+
+
 @app.get("/bookings")
 @login_required
 @admin_required
+@conditional_get(engine, "booking", "client", "zone", "booking_status")
 def bookings_list():
+    filters = {
+        key: request.args.get(key, "").strip()
+        for key in ("date_from", "date_to", "zone_id", "status_id", "client_id", "sort")
+    }
+    sort = "date" if filters["sort"] == "date" else "id"
+    after = request.args.get("after", "").strip()
+
+    query = select(Booking).options(joinedload(Booking.client), joinedload(Booking.zone), joinedload(Booking.status))
+    date_from = parse_date_arg(filters["date_from"])
+    date_to = parse_date_arg(filters["date_to"])
+    if date_from:
+        query = query.where(Booking.datetime_from >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.where(Booking.datetime_from < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    for key, column in (("zone_id", Booking.zone_id), ("status_id", Booking.status_id), ("client_id", Booking.client_id)):
+        if filters[key].isdigit():
+            query = query.where(column == int(filters[key]))
+
+    # keyset-пагинация: курсор — ключ последней строки предыдущей страницы,
+    # поэтому любая страница стоит как первая (без OFFSET)
+    if sort == "date":
+        if after:
+            try:
+                after_dt, after_id = after.rsplit("_", 1)
+                query = query.where(
+                    tuple_(Booking.datetime_from, Booking.id) < tuple_(datetime.fromisoformat(after_dt), int(after_id))
+                )
+            except ValueError:
+                after = ""
+        query = query.order_by(Booking.datetime_from.desc(), Booking.id.desc())
+    else:
+        if after.isdigit():
+            query = query.where(Booking.id < int(after))
+        else:
+            after = ""
+        query = query.order_by(Booking.id.desc())
+
     with db_session() as s:
-        bookings = (
-            s.execute(
-                select(Booking)
-                .options(joinedload(Booking.client), joinedload(Booking.zone), joinedload(Booking.status))
-                .order_by(Booking.id.desc())
-                .limit(200)
-            )
-            .scalars()
-            .all()
-        )
-        paid = s.execute(select(Payment.booking_id, func.coalesce(func.sum(Payment.amount), 0)).group_by(Payment.booking_id)).all()
-    paid_map = {bid: float(total) for bid, total in paid}
-    return render_template("bookings/list.html", bookings=bookings, paid_map=paid_map)
+        rows = s.execute(query.limit(BOOKINGS_PAGE_SIZE + 1)).scalars().all()
+        lk = lookups.get(s)
+
+    bookings = rows[:BOOKINGS_PAGE_SIZE]
+    next_after = None
+    if len(rows) > BOOKINGS_PAGE_SIZE:
+        last = bookings[-1]
+        next_after = f"{last.datetime_from.isoformat()}_{last.id}" if sort == "date" else str(last.id)
+    active_filters = {k: v for k, v in filters.items() if v}
+    return render_template(
+        "bookings/list.html",
+        bookings=bookings,
+        zones=lk.zones,
+        statuses=lk.booking_statuses,
+        filters=filters,
+        active_filters=active_filters,
+        is_first_page=not after,
+        next_after=next_after,
+        page_size=BOOKINGS_PAGE_SIZE,
+    )
 
 
 @app.route("/bookings/create", methods=["GET", "POST"])
@@ -1606,12 +2353,35 @@ def bookings_list():
 @admin_required
 def booking_create():
     with db_session() as s:
-        clients = s.execute(select(Client).order_by(Client.full_name)).scalars().all()
-        zones = s.execute(select(Zone).options(joinedload(Zone.type)).order_by(Zone.zone_name)).scalars().all()
-        statuses = s.execute(select(BookingStatus).order_by(BookingStatus.id)).scalars().all()
+        has_clients = s.execute(select(Client.id).limit(1)).first() is not None
+        lk = lookups.get(s)
+        zones = lk.zones
+
+        # подбор свободного времени: ?zone_id=&date=&duration=&participants=
+        prefill = {
+            key: request.args.get(key, "").strip()
+            for key in ("client_id", "zone_id", "date", "duration", "participants", "dt_from", "dt_to")
+        }
+        windows = None
+        if prefill["zone_id"].isdigit() and prefill["date"]:
+            zone = lk.zone_by_id.get(int(prefill["zone_id"]))
+            duration = int(prefill["duration"]) if prefill["duration"].isdigit() else 60
+            participants = int(prefill["participants"]) if prefill["participants"].isdigit() else 1
+            try:
+                day = datetime.strptime(prefill["date"], "%Y-%m-%d").date()
+            except ValueError:
+                day = None
+            if zone and day and duration > 0:
+                windows = availability.free_windows(s, zone, day, timedelta(minutes=duration), max(participants, 1))
+        # клиент выбирается поиском (/clients/search), в форму выводим только выбранного
+        client = s.get(Client, int(prefill["client_id"])) if prefill["client_id"].isdigit() else None
 
         if request.method == "POST":
-            client_id = int(request.form.get("client_id"))
+            client_id_raw = request.form.get("client_id", "").strip()
+            if not client_id_raw.isdigit() or not s.get(Client, int(client_id_raw)):
+                flash("Выберите клиента из списка", "danger")
+                return redirect(url_for("booking_create"))
+            client_id = int(client_id_raw)
             zone_id = int(request.form.get("zone_id"))
             dt_from = parse_dt_local(request.form.get("dt_from"))
             dt_to = parse_dt_local(request.form.get("dt_to"))
@@ -1622,7 +2392,7 @@ def booking_create():
                 flash("Конец должен быть позже начала", "danger")
                 return redirect(url_for("booking_create"))
 
-            zone = s.get(Zone, zone_id)
+            zone = lk.zone_by_id.get(zone_id)
             if not zone:
                 flash("Зона не найдена", "danger")
                 return redirect(url_for("booking_create"))
@@ -1631,19 +2401,21 @@ def booking_create():
                 flash(f"Участников должно быть 1..{zone.capacity} (вместимость зоны)", "danger")
                 return redirect(url_for("booking_create"))
 
-            cancelled_id = s.execute(select(BookingStatus.id).where(BookingStatus.code == "cancelled")).scalar_one()
-            overlap = s.execute(
-                select(func.count(Booking.id)).where(
-                    Booking.zone_id == zone_id,
-                    Booking.status_id != cancelled_id,
-                    Booking.datetime_from < dt_to,
-                    Booking.datetime_to > dt_from,
+            lock_zone(s, zone_id)
+            free = db_free_capacity(s, zone, dt_from, dt_to)
+            if participants_count > free:
+                s.rollback()
+                flash(f"В зоне на это время свободно мест: {free} — выберите свободное окно", "danger")
+                return redirect(
+                    url_for(
+                        "booking_create",
+                        client_id=client_id,
+                        zone_id=zone_id,
+                        date=dt_from.date().isoformat(),
+                        duration=int((dt_to - dt_from).total_seconds() // 60),
+                        participants=participants_count,
+                    )
                 )
-            ).scalar_one()
-
-            if overlap and overlap > 0:
-                flash("Есть пересечение по времени для выбранной зоны", "danger")
-                return redirect(url_for("booking_create"))
 
             hours = Decimal((dt_to - dt_from).total_seconds()) / Decimal(3600)
             session_sum = money(Decimal(zone.base_price) * hours)
@@ -1657,21 +2429,33 @@ def booking_create():
                 participants_count=participants_count,
                 session_sum=session_sum,
                 total_sum=total_sum,
+                due_sum=total_sum,
                 status_id=status_id,
             )
             s.add(b)
+            version = availability.pending_version(s)
             s.commit()
+            if status_id != lk.booking_status_id["cancelled"]:
+                availability.add_booking(zone_id, dt_from, dt_to, participants_count, version)
+                publish_occupancy(s, "booked", zone_id, dt_from, dt_to)
             flash("Бронь создана", "success")
             return redirect(url_for("booking_view", booking_id=b.id))
 
-    if not clients:
+    if not has_clients:
         flash("Добавь хотя бы одного клиента (Справочники → Клиенты)", "warning")
         return redirect(url_for("clients_list"))
     if not zones:
         flash("Добавь хотя бы одну зону (Справочники → Зоны)", "warning")
         return redirect(url_for("zones_list"))
 
-    return render_template("bookings/create.html", clients=clients, zones=zones, statuses=statuses)
+    return render_template(
+        "bookings/create.html",
+        client=client,
+        zones=zones,
+        statuses=lk.booking_statuses,
+        prefill=prefill,
+        windows=windows,
+    )
 
 
 
@@ -1708,16 +2492,11 @@ def booking_view(booking_id: int):
             .all()
         )
 
-        paid_dec = s.execute(
-            select(func.coalesce(func.sum(Payment.amount), 0)).where(Payment.booking_id == booking_id)
-        ).scalar_one()
-
-        statuses = s.execute(select(BookingStatus).order_by(BookingStatus.id)).scalars().all()
-        services_all = s.execute(select(Service).order_by(Service.name)).scalars().all()
+        lk = lookups.get(s)
 
     total = float(b.total_sum or 0)
-    paid = float(paid_dec or 0)
-    due = total - paid
+    paid = float(b.paid_sum)
+    due = float(b.due_sum)
 
     payments = [
         {"paid_at": p.paid_at, "method": p.method, "amount": float(p.amount or 0)}
@@ -1755,8 +2534,8 @@ def booking_view(booking_id: int):
         paid=paid,
         total=total,
         due=due,
-        statuses=statuses,
-        services_all=services_all,
+        statuses=lk.booking_statuses,
+        services_all=lk.services,
         service_lines=service_lines,
         services_total=services_total,
         session_total=session_total,
@@ -1772,8 +2551,16 @@ def booking_delete(booking_id: int):
     with db_session() as s:
         b = s.get(Booking, booking_id)
         if b:
+            was_active = b.status_id != lookups.get(s).booking_status_id["cancelled"]
+            period = (b.zone_id, b.datetime_from, b.datetime_to, b.participants_count)
+            if was_active and b.schedule_slot_id:
+                release_slot_seats(s, b.schedule_slot_id, b.participants_count)
             s.delete(b)
+            version = availability.pending_version(s)
             s.commit()
+            if was_active:
+                availability.remove_booking(*period, version)
+                publish_occupancy(s, "deleted", *period[:3])
             flash("Бронь удалена", "success")
     return redirect(url_for("bookings_list"))
 
@@ -1788,8 +2575,36 @@ def booking_status_change(booking_id: int):
         if not b:
             flash("Бронь не найдена", "danger")
             return redirect(url_for("bookings_list"))
+        lk = lookups.get(s)
+        if status_id not in lk.booking_status_by_id:
+            flash("Статус не найден", "danger")
+            return redirect(url_for("booking_view", booking_id=booking_id))
+        was_active = b.status_id != lk.booking_status_id["cancelled"]
+        is_active = status_id != lk.booking_status_id["cancelled"]
+        period = (b.zone_id, b.datetime_from, b.datetime_to, b.participants_count)
+        if b.schedule_slot_id and was_active and not is_active:
+            release_slot_seats(s, b.schedule_slot_id, b.participants_count)
+        elif is_active and not was_active:
+            # восстановление: места в зоне (и в слоте) могли за это время продать
+            lock_zone(s, b.zone_id)
+            if b.schedule_slot_id and not reserve_slot_seats(s, b.schedule_slot_id, b.participants_count):
+                s.rollback()
+                flash("В слоте уже нет мест — бронь нельзя восстановить", "danger")
+                return redirect(url_for("booking_view", booking_id=booking_id))
+            free = db_free_capacity(s, b.zone, b.datetime_from, b.datetime_to)
+            if b.participants_count > free:
+                s.rollback()
+                flash(f"В зоне на это время свободно мест: {free} — бронь нельзя восстановить", "danger")
+                return redirect(url_for("booking_view", booking_id=booking_id))
         b.status_id = status_id
+        version = availability.pending_version(s)
         s.commit()
+        if was_active and not is_active:
+            availability.remove_booking(*period, version)
+            publish_occupancy(s, "cancelled", *period[:3])
+        elif is_active and not was_active:
+            availability.add_booking(*period, version)
+            publish_occupancy(s, "booked", *period[:3])
     flash("Статус обновлён", "success")
     return redirect(url_for("booking_view", booking_id=booking_id))
 
@@ -1810,6 +2625,7 @@ def payment_add(booking_id: int):
             flash("Бронь не найдена", "danger")
             return redirect(url_for("bookings_list"))
         s.add(Payment(booking_id=booking_id, amount=amount, method=method, comment=comment, created_by_employee_id=None))
+        apply_payment(s, booking_id, amount)
         s.commit()
     flash("Оплата добавлена", "success")
     return redirect(url_for("booking_view", booking_id=booking_id))
@@ -1835,7 +2651,7 @@ def booking_service_add(booking_id: int):
             flash("Бронь не найдена", "danger")
             return redirect(url_for("bookings_list"))
 
-        srv = s.get(Service, service_id)
+        srv = lookups.get(s).service_by_id.get(service_id)
         if not srv:
             flash("Услуга не найдена", "danger")
             return redirect(url_for("booking_view", booking_id=booking_id))
@@ -1900,6 +2716,7 @@ def visit_checkin(booking_id: int):
         v.actual_participants_count = apc
         v.opened_by_id = None  # позже свяжем с сотрудником
         s.commit()
+        publish_occupancy(s, "checkin", b.zone_id, b.datetime_from, b.datetime_to)
 
     flash("Вход оформлен", "success")
     return redirect(url_for("booking_view", booking_id=booking_id))
@@ -1927,11 +2744,13 @@ def visit_checkout(booking_id: int):
             v.actual_participants_count = apc
         v.closed_by_id = None  # позже свяжем с сотрудником
         s.commit()
+        b = s.get(Booking, booking_id)
+        publish_occupancy(s, "checkout", b.zone_id, b.datetime_from, b.datetime_to)
 
     flash("Выход оформлен", "success")
     return redirect(url_for("booking_view", booking_id=booking_id))
 
 
 if __name__ == "__main__":
-    seed_if_empty()
+    init_db()
     app.run(debug=True)
@@ -0,0 +1,281 @@
+"""Свободная вместимость зон по времени.
+
+Для каждой зоны в памяти хранится ступенчатая функция загрузки (ZoneTimeline):
+отсортированные моменты изменения и число участников между ними. Позиция во
+времени ищется бинарным поиском, поэтому вопрос «сколько мест свободно в зоне
+на [a, b)» стоит O(log n + k), где k — число точек изменения внутри интервала
+(для интервала в несколько часов это единицы).
+
+Индекс строится из БД при первом обращении и перестраивается, когда наступает
+новый день или версия занятости в cache_version (OCCUPANCY_VERSION, её
+увеличивают триггеры data_versions.py на каждую бронь, изменившую занятость, —
+из любого процесса, API, импорта или `flask gen-data`) расходится с той, что
+ожидает индекс. Свои записи процесс вносит в индекс сам вместе с версией, которую
+произвела его транзакция (pending_version до commit): оплата или подтверждение
+брони занятость не меняют, а своя запись не вызывает перестройку — только чужая.
+Версия сверяется не чаще раза в VERSION_CHECK_SECONDS. Решение при записи
+принимается по БД (db_free_capacity) под блокировкой lock_zone, а индекс в
+памяти используется для подсказок свободного времени.
+"""
+from __future__ import annotations
+from typing import Optional
+
+import bisect
+import threading
+import time as clock
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from data_versions import occupancy_version
+from models import Booking, BookingStatus, ScheduleSlot, Zone
+
+# часы работы центра — в их пределах подбираются свободные окна
+DAY_START = time(9, 0)
+DAY_END = time(22, 0)
+WINDOW_STEP = timedelta(minutes=30)
+# как часто сверять версию броней с БД (один маленький запрос)
+VERSION_CHECK_SECONDS = 1.0
+
+
+class ZoneTimeline:
+    """Загрузка одной зоны: loads[i] участников на [times[i], times[i + 1])."""
+
+    def __init__(self) -> None:
+        self.times: list[datetime] = []
+        self.loads: list[int] = []
+
+    def _load_before(self, i: int) -> int:
+        return self.loads[i - 1] if i > 0 else 0
+
+    def _split(self, t: datetime) -> int:
+        i = bisect.bisect_left(self.times, t)
+        if i < len(self.times) and self.times[i] == t:
+            return i
+        self.times.insert(i, t)
+        self.loads.insert(i, self._load_before(i))
+        return i
+
+    def _compact(self, i: int) -> None:
+        # точка без изменения загрузки не нужна
+        if 0 <= i < len(self.times) and self.loads[i] == self._load_before(i):
+            del self.times[i]
+            del self.loads[i]
+
+    def add(self, start: datetime, end: datetime, qty: int) -> None:
+        if end <= start or qty == 0:
+            return
+        i = self._split(start)
+        j = self._split(end)
+        for k in range(i, j):
+            self.loads[k] += qty
+        self._compact(j)
+        self._compact(i)
+
+    def remove(self, start: datetime, end: datetime, qty: int) -> None:
+        self.add(start, end, -qty)
+
+    def segments(self, start: datetime, end: datetime):
+        """(начало, конец, загрузка) для участков постоянной загрузки внутри [start, end)."""
+        i = bisect.bisect_right(self.times, start)
+        load = self._load_before(i)
+        cur = start
+        while i < len(self.times) and self.times[i] < end:
+            yield cur, self.times[i], load
+            cur, load = self.times[i], self.loads[i]
+            i += 1
+        if cur < end:
+            yield cur, end, load
+
+    def max_load(self, start: datetime, end: datetime) -> int:
+        return max((load for _, _, load in self.segments(start, end)), default=0)
+
+    def free_windows(
+        self,
+        capacity: int,
+        start: datetime,
+        end: datetime,
+        length: timedelta,
+        participants: int = 1,
+        limit: int = 5,
+        step: timedelta = WINDOW_STEP,
+    ) -> list[tuple[datetime, datetime]]:
+        """Первые `limit` окон длины `length` в [start, end), где хватает места на `participants`."""
+        allowed = capacity - participants
+        windows: list[tuple[datetime, datetime]] = []
+        free_from: Optional[datetime] = None
+        free_ranges = []
+        for seg_start, seg_end, load in self.segments(start, end):
+            if load <= allowed:
+                if free_from is None:
+                    free_from = seg_start
+            elif free_from is not None:
+                free_ranges.append((free_from, seg_start))
+                free_from = None
+        if free_from is not None:
+            free_ranges.append((free_from, end))
+
+        for range_start, range_end in free_ranges:
+            t = _align(range_start, step)
+            while t + length <= range_end and len(windows) < limit:
+                windows.append((t, t + length))
+                t += step
+            if len(windows) >= limit:
+                break
+        return windows
+
+
+def _align(t: datetime, step: timedelta) -> datetime:
+    midnight = datetime.combine(t.date(), time())
+    steps = -(-(t - midnight) // step)  # округление вверх
+    return midnight + steps * step
+
+
+def active_bookings(zone_id: Optional[int] = None, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    query = (
+        select(Booking.zone_id, Booking.datetime_from, Booking.datetime_to, Booking.participants_count)
+        .join(Booking.status)
+        .where(BookingStatus.code != "cancelled")
+    )
+    if zone_id is not None:
+        query = query.where(Booking.zone_id == zone_id)
+    if end is not None:
+        query = query.where(Booking.datetime_from < end)
+    if start is not None:
+        query = query.where(Booking.datetime_to > start)
+    return query
+
+
+def lock_zone(s: Session, zone_id: int) -> None:
+    """Блокировка записи до конца транзакции: проверка db_free_capacity и INSERT после неё атомарны.
+
+    SQLite: пустой UPDATE открывает транзакцию записи (блокировка всей базы, без
+    срабатывания триггеров), конкуренты ждут busy_timeout. PostgreSQL: SELECT ...
+    FOR UPDATE строки зоны — записи в другие зоны не ждут.
+    """
+    if s.get_bind().dialect.name == "sqlite":
+        s.execute(text("UPDATE zone SET id = id WHERE 0"))
+    else:
+        s.execute(select(Zone.id).where(Zone.id == zone_id).with_for_update())
+
+
+def db_free_capacity(s: Session, zone: Zone, start: datetime, end: datetime) -> int:
+    """Свободные места в зоне на [start, end) по данным БД — для проверки при записи."""
+    timeline = ZoneTimeline()
+    for _, dt_from, dt_to, qty in s.execute(active_bookings(zone.id, start, end)):
+        timeline.add(dt_from, dt_to, qty)
+    return max(zone.capacity - timeline.max_load(start, end), 0)
+
+
+class AvailabilityIndex:
+    """Загрузка всех зон в памяти процесса начиная с `horizon`."""
+
+    def __init__(self) -> None:
+        self._zones: dict[int, ZoneTimeline] = {}
+        self._horizon: Optional[datetime] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _db_version(s: Session) -> Optional[int]:
+        return occupancy_version(s.connection())
+
+    def pending_version(self, s: Session) -> Optional[int]:
+        """Версия занятости, которую зафиксирует текущая транзакция s: вызывать после записи брони, до commit.
+
+        Транзакция уже держит блокировку записи (lock_zone / INSERT), поэтому чужие
+        записи не попадут между этим чтением и commit незамеченными: они дадут
+        другую версию, и индекс перестроится.
+        """
+        s.flush()
+        return self._db_version(s)
+
+    def rebuild(self, s: Session) -> None:
+        horizon = datetime.combine(date.today(), time())
+        # версия читается до броней: запись между двумя запросами вызовет ещё одну перестройку
+        version = self._db_version(s)
+        zones: dict[int, ZoneTimeline] = {}
+        for zone_id, dt_from, dt_to, qty in s.execute(active_bookings(start=horizon)):
+            zones.setdefault(zone_id, ZoneTimeline()).add(dt_from, dt_to, qty)
+        with self._lock:
+            self._zones = zones
+            self._horizon = horizon
+            self._version = version
+            self._checked_at = clock.monotonic()
+
+    def _refresh(self, s: Session) -> None:
+        """Перестроить индекс, если он пуст, устарел по дате или брони изменились в БД."""
+        if self._horizon is None or date.today() > self._horizon.date():
+            self.rebuild(s)
+            return
+        if clock.monotonic() - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        if self._version is None or self._db_version(s) != self._version:
+            self.rebuild(s)
+        else:
+            self._checked_at = clock.monotonic()
+
+    def _timeline(self, s: Session, zone_id: int, start: datetime, end: datetime) -> ZoneTimeline:
+        self._refresh(s)
+        if start < self._horizon:
+            # прошлое в памяти не держим — собираем загрузку из БД
+            timeline = ZoneTimeline()
+            for _, dt_from, dt_to, qty in s.execute(active_bookings(zone_id, start, end)):
+                timeline.add(dt_from, dt_to, qty)
+            return timeline
+        return self._zones.get(zone_id) or ZoneTimeline()
+
+    def _apply(self, zone_id: int, start: datetime, end: datetime, qty: int, version: Optional[int]) -> None:
+        with self._lock:
+            if self._horizon is None:
+                return
+            if self._version is not None and version is not None and version <= self._version:
+                # индекс перестроен уже после commit этой записи и учёл её
+                return
+            timeline = self._zones.get(zone_id) if qty < 0 else self._zones.setdefault(zone_id, ZoneTimeline())
+            if timeline is not None and end > self._horizon:
+                timeline.add(start, end, qty)
+            # своя запись — следующая версия; иначе между ними писал другой процесс
+            expected = self._version is not None and version == self._version + 1
+            self._version = version if expected else None
+
+    def add_booking(self, zone_id: int, start: datetime, end: datetime, qty: int, version: Optional[int]) -> None:
+        self._apply(zone_id, start, end, qty, version)
+
+    def remove_booking(self, zone_id: int, start: datetime, end: datetime, qty: int, version: Optional[int]) -> None:
+        self._apply(zone_id, start, end, -qty, version)
+
+    def free_capacity(self, s: Session, zone: Zone, start: datetime, end: datetime) -> int:
+        timeline = self._timeline(s, zone.id, start, end)
+        with self._lock:
+            return max(zone.capacity - timeline.max_load(start, end), 0)
+
+    def free_windows(
+        self,
+        s: Session,
+        zone: Zone,
+        day: date,
+        length: timedelta,
+        participants: int = 1,
+        limit: int = 5,
+    ) -> list[tuple[datetime, datetime]]:
+        start = datetime.combine(day, DAY_START)
+        end = datetime.combine(day, DAY_END)
+        if day == date.today():
+            start = max(start, datetime.now())
+        timeline = self._timeline(s, zone.id, start, end)
+        with self._lock:
+            return timeline.free_windows(zone.capacity, start, end, length, participants, limit)
+
+
+availability = AvailabilityIndex()
+
+
+def slot_available(s: Session, slot: ScheduleSlot) -> int:
+    """Мест в слоте не больше, чем свободно в самой зоне на это время."""
+    return min(
+        max(slot.capacity - slot.booked_count, 0),
+        availability.free_capacity(s, slot.zone, slot.datetime_from, slot.datetime_to),
+    )
@@ -0,0 +1,220 @@
+"""Воспроизводимые замеры ключевых страниц на синтетической базе (synthetic.py).
+
+run_benchmarks(...) гоняет через тестовый клиент Flask (без сети и WSGI-сервера)
+страницы из BENCH_ENDPOINTS — каждую `requests` раз после BENCH_WARMUP
+прогревочных — и для каждой считает перцентили времени ответа и число
+SQL-запросов на запрос (QueryRecorder из query_budget.py). Параметры запросов
+(id броней, даты, слоты) выбираются из базы генератором случайных чисел с
+заданным seed, поэтому прогон повторяем.
+
+Результат — словарь, который `flask bench` сохраняет в JSON; compare_runs(...)
+сравнивает два таких файла.
+
+client_booking_create действительно создаёт брони — запускать только на базе замеров.
+
+export_bookings выгружает все брони (не больше EXPORT_RUNS раз за прогон) и
+для каждой выгрузки пишет пик памяти Python (tracemalloc) и объём CSV: при
+потоковой выгрузке пик не растёт вместе с объёмом, сравнивать — прогоны на
+базах разного масштаба (`gen-data --scale small|medium|large`).
+"""
+from __future__ import annotations
+from typing import Callable, NamedTuple, Optional
+
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import select, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from db import server_version
+from query_budget import QueryRecorder, test_client_as
+from models import Account, Booking, Client, Payment, ScheduleSlot
+
+BENCH_WARMUP = 5
+# сколько кандидатов (броней, слотов) выбирать из базы для параметров запросов
+BENCH_SAMPLE = 500
+BENCH_FORMAT = 1
+# полная выгрузка долгая — столько раз за прогон, независимо от -n
+EXPORT_RUNS = 3
+
+
+class BenchContext(NamedTuple):
+    admin_id: int
+    client_account_id: int
+    booking_ids: list[int]
+    slot_ids: list[int]
+    days: list[str]
+
+
+class Endpoint(NamedTuple):
+    name: str
+    role: str  # admin | client
+    method: str
+    # (rng, контекст) -> (путь, данные формы)
+    request: Callable[[random.Random, BenchContext], tuple[str, Optional[dict]]]
+    # потоковый ответ: читать по кускам и мерить пик памяти; runs — предел запросов за прогон
+    stream: bool = False
+    runs: Optional[int] = None
+
+
+BENCH_ENDPOINTS = (
+    Endpoint("dashboard", "admin", "GET", lambda rng, ctx: ("/", None)),
+    Endpoint("bookings_list", "admin", "GET", lambda rng, ctx: (rng.choice(("/bookings", "/bookings?sort=date")), None)),
+    Endpoint("booking_view", "admin", "GET", lambda rng, ctx: (f"/bookings/{rng.choice(ctx.booking_ids)}", None)),
+    Endpoint("client_schedule", "client", "GET", lambda rng, ctx: (rng.choice(("/client/schedule", f"/client/schedule?date={rng.choice(ctx.days)}")), None)),
+    Endpoint(
+        "client_booking_create", "client", "POST",
+        lambda rng, ctx: (f"/client/schedule/{rng.choice(ctx.slot_ids)}/book", {"participants_count": "1"}),
+    ),
+    Endpoint("export_bookings", "admin", "GET", lambda rng, ctx: ("/exports/bookings.csv", None), stream=True, runs=EXPORT_RUNS),
+)
+
+
+def _context(s: Session, seed: int) -> Optional[BenchContext]:
+    rng = random.Random(seed)
+    admin_id = s.execute(select(Account.id).where(Account.role == "admin").order_by(Account.id)).scalars().first()
+    client_account_id = s.execute(
+        select(Account.id).where(Account.role == "client", Account.client_id.is_not(None)).order_by(Account.id)
+    ).scalars().first()
+    max_booking = s.execute(select(func.max(Booking.id))).scalar_one()
+    now = datetime.now()
+    slot_ids = list(s.execute(
+        select(ScheduleSlot.id)
+        .where(ScheduleSlot.datetime_from > now, ScheduleSlot.is_active.is_(True), ScheduleSlot.booked_count < ScheduleSlot.capacity)
+        .order_by(ScheduleSlot.datetime_from)
+        .limit(BENCH_SAMPLE)
+    ).scalars())
+    if admin_id is None or client_account_id is None or not max_booking or not slot_ids:
+        return None
+    booking_ids = [rng.randint(1, max_booking) for _ in range(BENCH_SAMPLE)]
+    days = [(now + timedelta(days=d)).date().isoformat() for d in range(7)]
+    return BenchContext(admin_id, client_account_id, booking_ids, slot_ids, days)
+
+
+def _percentile(data: list[float], q: float) -> float:
+    return data[min(len(data) - 1, int(q * len(data)))] if data else 0.0
+
+
+def dataset_counts(s: Session) -> dict[str, int]:
+    return {
+        name: s.execute(select(func.count()).select_from(model)).scalar_one()
+        for name, model in (("clients", Client), ("slots", ScheduleSlot), ("bookings", Booking), ("payments", Payment))
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_benchmarks(
+    app: Flask,
+    engine: Engine,
+    session_factory: Callable[[], Session],
+    requests: int = 200,
+    seed: int = 1,
+    only: Optional[set[str]] = None,
+) -> dict:
+    """Прогнать BENCH_ENDPOINTS и вернуть результаты (структура файла `flask bench --out`)."""
+    with session_factory() as s:
+        ctx = _context(s, seed)
+        counts = dataset_counts(s)
+    if ctx is None:
+        raise RuntimeError("В базе нет данных для замеров — сначала `flask init-db` и `flask gen-data`")
+
+    results = {}
+    for ep in BENCH_ENDPOINTS:
+        if only and ep.name not in only:
+            continue
+        rng = random.Random(f"{seed}:{ep.name}")
+        client = test_client_as(app, ctx.admin_id if ep.role == "admin" else ctx.client_account_id)
+        runs = min(requests, ep.runs) if ep.runs else requests
+        warmup = 1 if ep.runs else BENCH_WARMUP
+        timings: list[float] = []
+        queries: list[int] = []
+        peaks: list[int] = []
+        sizes: list[int] = []
+        errors = 0
+        for i in range(warmup + runs):
+            path, data = ep.request(rng, ctx)
+            # свой app context на запрос — см. query_budget.check_query_budgets
+            with app.app_context(), QueryRecorder(engine) as rec:
+                if ep.stream:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                response = client.open(path, method=ep.method, data=data)
+                if ep.stream:
+                    # по кускам, как читает браузер: get_data() собрал бы весь ответ в памяти
+                    size = sum(len(chunk) for chunk in response.response)
+                    response.close()
+                elapsed = (time.perf_counter() - started) * 1000
+                if ep.stream:
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                    sizes.append(size)
+                    tracemalloc.stop()
+            if i < warmup:
+                peaks.clear()
+                sizes.clear()
+                continue
+            timings.append(elapsed)
+            queries.append(rec.count)
+            errors += response.status_code >= 400
+        timings.sort()
+        results[ep.name] = {
+            "requests": runs,
+            "errors": errors,
+            "mean_ms": round(sum(timings) / len(timings), 3) if timings else 0.0,
+            "p50_ms": round(_percentile(timings, 0.50), 3),
+            "p95_ms": round(_percentile(timings, 0.95), 3),
+            "p99_ms": round(_percentile(timings, 0.99), 3),
+            "max_ms": round(timings[-1], 3) if timings else 0.0,
+            "queries_per_request": round(sum(queries) / len(queries), 2) if queries else 0.0,
+            "max_queries": max(queries, default=0),
+        }
+        if ep.stream:
+            results[ep.name]["peak_memory_kib"] = round(max(peaks, default=0) / 1024, 1)
+            results[ep.name]["response_kib"] = round(max(sizes, default=0) / 1024, 1)
+
+    return {
+        "format": BENCH_FORMAT,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "db": engine.dialect.name,
+        "db_version": server_version(),
+        "db_url": engine.url.render_as_string(hide_password=True),
+        "seed": seed,
+        "warmup": BENCH_WARMUP,
+        "dataset": counts,
+        "endpoints": results,
+    }
+
+
+def compare_runs(old: dict, new: dict) -> list[str]:
+    """Строки сравнения двух прогонов: p50/p95 и запросы на запрос, изменение в процентах."""
+    lines = []
+    for name, cur in new["endpoints"].items():
+        prev = old.get("endpoints", {}).get(name)
+        if prev is None:
+            lines.append(f"{name}: нет в прошлом прогоне")
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "queries_per_request", "peak_memory_kib"):
+            if key not in cur or key not in prev:
+                continue
+            before, after = prev[key], cur[key]
+            delta = f"{(after - before) / before * 100:+.0f}%" if before else "—"
+            parts.append(f"{key} {before} -> {after} ({delta})")
+        lines.append(f"{name}: " + "; ".join(parts))
+    if old.get("dataset") != new.get("dataset"):
+        lines.append(f"внимание: разные наборы данных {old.get('dataset')} / {new.get('dataset')}")
+    return lines
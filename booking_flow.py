@@ -0,0 +1,250 @@
+"""Общая логика расписания, записи и оплаты клиента.
+
+Используется и HTML-страницами клиента (app.py), и JSON API (api.py), чтобы
+фильтры расписания, проверка мест, списание абонемента и расчёт сумм были
+одними и теми же. Места и посещения абонемента занимаются условными UPDATE —
+проверка и запись атомарны.
+"""
+from __future__ import annotations
+from typing import Optional
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import select, func, update, case, or_, and_, false
+from sqlalchemy.orm import Session, joinedload
+
+from availability import availability, db_free_capacity, lock_zone
+from events import publish_occupancy
+from ledger import apply_payment
+from lookups import LookupSnapshot
+from models import Booking, BookingService, Notification, Payment, ScheduleSlot, Subscription
+
+
+class BookingError(Exception):
+    """Запись или оплата не прошла; reason — машинный код, str(exc) — текст для клиента."""
+
+    def __init__(self, reason: str, message: str) -> None:
+        super().__init__(message)
+        self.reason = reason
+
+
+def money(x) -> Decimal:
+    d = x if isinstance(x, Decimal) else Decimal(str(x))
+    return d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def recalc_booking_total(s: Session, booking_id: int) -> None:
+    """Пересчитать total_sum = session_sum + сумма услуг и due_sum одним UPDATE.
+
+    paid_sum читается самим UPDATE, поэтому оплата, закоммиченная параллельно
+    (ledger.apply_payment), не затирается устаревшим значением из сессии.
+    """
+    # сессия без autoflush: изменённые строки услуг должны попасть в БД до подсчёта суммы
+    s.flush()
+    services_sum = (
+        select(func.coalesce(func.sum(BookingService.line_sum), 0))
+        .where(BookingService.booking_id == booking_id)
+        .scalar_subquery()
+    )
+    total = func.round(func.coalesce(Booking.session_sum, 0) + services_sum, 2)
+    s.execute(
+        update(Booking)
+        .where(Booking.id == booking_id)
+        .values(total_sum=total, due_sum=func.round(total - Booking.paid_sum, 2))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reserve_slot_seats(s: Session, slot_id: int, qty: int) -> bool:
+    """Занять места в слоте одним условным UPDATE: проверка вместимости и запись атомарны."""
+    res = s.execute(
+        update(ScheduleSlot)
+        .where(ScheduleSlot.id == slot_id, ScheduleSlot.booked_count + qty <= ScheduleSlot.capacity)
+        .values(booked_count=ScheduleSlot.booked_count + qty)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
+
+
+def release_slot_seats(s: Session, slot_id: int, qty: int) -> None:
+    s.execute(
+        update(ScheduleSlot)
+        .where(ScheduleSlot.id == slot_id)
+        .values(booked_count=case((ScheduleSlot.booked_count > qty, ScheduleSlot.booked_count - qty), else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def consume_subscription_visits(s: Session, subscription_id: int, qty: int) -> bool:
+    """Списать посещения абонемента, только если их хватает (условный UPDATE)."""
+    res = s.execute(
+        update(Subscription)
+        .where(Subscription.id == subscription_id, Subscription.remaining_visits >= qty)
+        .values(remaining_visits=Subscription.remaining_visits - qty)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
+
+
+# без выбранной даты расписание показывается на столько дней вперёд
+SCHEDULE_WINDOW_DAYS = 14
+
+def schedule_period_filter(column, day, time_from, time_to, now: datetime):
+    """Фильтры даты и времени суток -> диапазоны [начало, конец) по самой колонке.
+
+    Колонка не оборачивается в date()/strftime(), поэтому условие идёт по индексу.
+    Без даты берётся окно SCHEDULE_WINDOW_DAYS дней от текущего момента; фильтр
+    по времени суток в таком окне — отдельный диапазон на каждый день.
+    """
+    days = [day] if day else [now.date() + timedelta(days=i) for i in range(SCHEDULE_WINDOW_DAYS)]
+    ranges = []
+    for d in days:
+        midnight = datetime.combine(d, time())
+        start = datetime.combine(d, time_from) if time_from else midnight
+        # «до 18:00» включает слоты, начинающиеся в 18:00
+        end = datetime.combine(d, time_to) + timedelta(minutes=1) if time_to else midnight + timedelta(days=1)
+        if not day:
+            start = max(start, now)
+        if start < end:
+            ranges.append((start, end))
+    if ranges and not time_from and not time_to:
+        # сутки подряд — один диапазон
+        ranges = [(ranges[0][0], ranges[-1][1])]
+    if not ranges:
+        return false()
+    return or_(*(and_(column >= start, column < end) for start, end in ranges))
+
+
+def schedule_query(
+    now: datetime,
+    day=None,
+    time_from=None,
+    time_to=None,
+    zone_id: Optional[int] = None,
+    lesson_type: Optional[str] = None,
+    employee_id: Optional[int] = None,
+):
+    """Активные слоты расписания клиента по фильтрам (без ORDER BY)."""
+    query = (
+        select(ScheduleSlot)
+        .options(joinedload(ScheduleSlot.zone), joinedload(ScheduleSlot.employee))
+        .where(
+            ScheduleSlot.is_active.is_(True),
+            schedule_period_filter(ScheduleSlot.datetime_from, day, time_from, time_to, now),
+        )
+    )
+    if zone_id:
+        query = query.where(ScheduleSlot.zone_id == zone_id)
+    if lesson_type:
+        query = query.where(ScheduleSlot.lesson_type == lesson_type)
+    if employee_id:
+        query = query.where(ScheduleSlot.employee_id == employee_id)
+    return query
+
+
+def load_slot(s: Session, slot_id: int) -> Optional[ScheduleSlot]:
+    return s.execute(
+        select(ScheduleSlot)
+        .options(joinedload(ScheduleSlot.zone), joinedload(ScheduleSlot.employee))
+        .where(ScheduleSlot.id == slot_id)
+    ).scalar_one_or_none()
+
+
+def usable_subscriptions(s: Session, client_id: int) -> list[Subscription]:
+    """Абонементы клиента, которыми можно оплатить запись сейчас."""
+    return (
+        s.execute(
+            select(Subscription)
+            .options(joinedload(Subscription.status), joinedload(Subscription.service))
+            .where(
+                Subscription.client_id == client_id,
+                Subscription.remaining_visits > 0,
+                Subscription.end_date >= datetime.utcnow().date(),
+            )
+            .order_by(Subscription.end_date.asc())
+        )
+        .scalars()
+        .all()
+    )
+
+
+def book_slot(
+    s: Session,
+    slot: ScheduleSlot,
+    client_id: int,
+    participants: int,
+    lk: LookupSnapshot,
+    subscription: Optional[Subscription] = None,
+    service_qty: Optional[dict[int, int]] = None,
+) -> Booking:
+    """Записать клиента на слот и закоммитить; при нехватке мест или посещений — BookingError (после rollback).
+
+    service_qty — {id услуги: количество}; неизвестные услуги и количество <= 0 пропускаются.
+    """
+    # места в слоте занимаются условным UPDATE, а lock_zone не даёт параллельной
+    # записи в ту же зону пройти проверку db_free_capacity одновременно с нами
+    lock_zone(s, slot.zone_id)
+    if not reserve_slot_seats(s, slot.id, participants) or participants > db_free_capacity(
+        s, slot.zone, slot.datetime_from, slot.datetime_to
+    ):
+        s.rollback()
+        raise BookingError("no_seats", "Недостаточно свободных мест — выберите другой слот")
+
+    session_sum = money(Decimal(str(slot.price)) * participants)
+    if subscription is not None:
+        if not consume_subscription_visits(s, subscription.id, participants):
+            s.rollback()
+            raise BookingError("subscription", "Недостаточно посещений в абонементе")
+        session_sum = money(0)
+
+    booking = Booking(
+        client_id=client_id,
+        zone_id=slot.zone_id,
+        schedule_slot_id=slot.id,
+        subscription_id=subscription.id if subscription else None,
+        datetime_from=slot.datetime_from,
+        datetime_to=slot.datetime_to,
+        participants_count=participants,
+        session_sum=session_sum,
+        total_sum=session_sum,
+        status_id=lk.booking_status_id["new"],
+    )
+    s.add(booking)
+    s.flush()
+
+    for service_id, qty in (service_qty or {}).items():
+        service = lk.service_by_id.get(service_id)
+        if service is None or qty <= 0:
+            continue
+        s.add(
+            BookingService(
+                booking_id=booking.id,
+                service_id=service.id,
+                qty=qty,
+                unit_price=service.base_price,
+                line_sum=money(Decimal(str(service.base_price)) * qty),
+            )
+        )
+
+    recalc_booking_total(s, booking.id)
+    s.add(Notification(client_id=client_id, message=f"Бронь №{booking.id} создана и ожидает оплаты."))
+    version = availability.pending_version(s)
+    s.commit()
+    availability.add_booking(slot.zone_id, slot.datetime_from, slot.datetime_to, participants, version)
+    publish_occupancy(s, "booked", slot.zone_id, slot.datetime_from, slot.datetime_to)
+    return booking
+
+
+def pay_booking_due(s: Session, booking: Booking, method: str, lk: LookupSnapshot) -> Payment:
+    """Оплатить остаток по брони, подтвердить её и закоммитить; если платить нечего — BookingError."""
+    due = max(booking.due_sum, money(0))
+    if due <= 0 or not apply_payment(s, booking.id, due, require_due=True):
+        s.rollback()
+        raise BookingError("already_paid", "Бронь уже оплачена")
+    payment = Payment(booking_id=booking.id, amount=due, method=method)
+    s.add(payment)
+    booking.status_id = lk.booking_status_id["confirmed"]
+    s.add(Notification(client_id=booking.client_id, message=f"Оплата по брони №{booking.id} принята. Бронь подтверждена."))
+    s.commit()
+    return payment
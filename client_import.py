@@ -0,0 +1,198 @@
+"""Массовый импорт клиентов из CSV (перенос из старой CRM).
+
+Файл читается построчно (csv.DictReader поверх потока), строки собираются в
+пачки по IMPORT_BATCH_ROWS. На пачку:
+
+- телефоны и email нормализуются (contacts.py), строки без ФИО или с
+  непохожими на телефон/email значениями отклоняются;
+- дубли ищутся одним запросом по индексам client.phone_norm / client.email_norm
+  для ключей всей пачки, плюс среди уже прочитанных строк файла;
+- новые клиенты вставляются одним executemany и пачка коммитится отдельно —
+  при ошибке в середине файла уже загруженные пачки остаются в базе.
+
+FTS-индекс и счётчики дашборда обновляют триггеры, отдельно их трогать не нужно.
+"""
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, TextIO
+
+import csv
+import itertools
+import time
+from datetime import date, datetime
+
+from sqlalchemy import select, insert, or_
+from sqlalchemy.orm import Session
+
+from contacts import normalize_phone, normalize_email
+from lookups import lookups
+from models import Client
+
+IMPORT_BATCH_ROWS = 1000
+# сколько отклонённых строк держать в отчёте
+MAX_REJECTED_IN_REPORT = 200
+
+# колонка клиента -> допустимые заголовки в файле (без учёта регистра)
+COLUMN_ALIASES = {
+    "full_name": ("full_name", "фио", "имя", "клиент"),
+    "phone": ("phone", "телефон", "тел"),
+    "email": ("email", "e-mail", "почта"),
+    "dob": ("dob", "дата рождения"),
+    "note": ("note", "примечание", "комментарий"),
+}
+DOB_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+
+class Rejected(NamedTuple):
+    line: int
+    reason: str
+
+
+class ImportReport:
+    def __init__(self) -> None:
+        self.read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected_count = 0
+        self.rejected: list[Rejected] = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line: int, reason: str) -> None:
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_REJECTED_IN_REPORT:
+            self.rejected.append(Rejected(line, reason))
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Прочитано строк: {self.read}, добавлено: {self.inserted}, дублей: {self.duplicates}, "
+            f"отклонено: {self.rejected_count}; {self.elapsed:.1f} с, {self.rows_per_second:.0f} строк/с"
+        )
+
+
+def _column_map(fieldnames: Optional[list[str]]) -> dict[str, str]:
+    """Заголовок файла -> колонка клиента."""
+    mapping = {}
+    for header in fieldnames or []:
+        key = header.strip().lower()
+        for column, aliases in COLUMN_ALIASES.items():
+            if key in aliases:
+                mapping[header] = column
+    return mapping
+
+
+def _parse_dob(value: str) -> Optional[date]:
+    for fmt in DOB_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _clean_row(raw: dict, columns: dict[str, str]) -> tuple[Optional[dict], Optional[str]]:
+    """Строка файла -> значения для INSERT или причина отказа."""
+    values = {column: (raw.get(header) or "").strip() for header, column in columns.items()}
+    full_name = " ".join(values.get("full_name", "").split())
+    if not full_name:
+        return None, "нет ФИО"
+    phone = values.get("phone") or None
+    email = values.get("email") or None
+    phone_norm = normalize_phone(phone)
+    email_norm = normalize_email(email)
+    if phone and not phone_norm:
+        return None, f"некорректный телефон: {phone}"
+    if email and not email_norm:
+        return None, f"некорректный email: {email}"
+    dob = None
+    if values.get("dob"):
+        dob = _parse_dob(values["dob"])
+        if dob is None:
+            return None, f"некорректная дата рождения: {values['dob']}"
+    return {
+        "full_name": full_name,
+        "phone": phone,
+        "email": email,
+        "phone_norm": phone_norm,
+        "email_norm": email_norm,
+        "dob": dob,
+        "note": values.get("note") or None,
+    }, None
+
+
+def _existing_keys(s: Session, rows: list[dict]) -> tuple[set[str], set[str]]:
+    phones = {r["phone_norm"] for r in rows if r["phone_norm"]}
+    emails = {r["email_norm"] for r in rows if r["email_norm"]}
+    if not phones and not emails:
+        return set(), set()
+    found = s.execute(
+        select(Client.phone_norm, Client.email_norm).where(
+            or_(Client.phone_norm.in_(phones), Client.email_norm.in_(emails))
+        )
+    ).all()
+    return {p for p, _ in found if p in phones}, {e for _, e in found if e in emails}
+
+
+def _batches(rows: Iterable, size: int) -> Iterator[list]:
+    it = iter(rows)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+def import_clients(
+    session_factory: Callable[[], Session],
+    stream: TextIO,
+    dry_run: bool = False,
+    batch_size: int = IMPORT_BATCH_ROWS,
+) -> ImportReport:
+    """Импортировать клиентов из CSV-потока (разделитель «,» или «;» определяется по заголовку)."""
+    report = ImportReport()
+    header = stream.readline()
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    fieldnames = next(csv.reader([header], delimiter=delimiter), [])
+    columns = _column_map(fieldnames)
+    if "full_name" not in columns.values():
+        report.reject(1, "в заголовке нет колонки ФИО (full_name)")
+        report.elapsed = time.perf_counter() - report.started
+        return report
+
+    reader = csv.DictReader(stream, fieldnames=fieldnames, delimiter=delimiter)
+    seen_phones: set[str] = set()
+    seen_emails: set[str] = set()
+    with session_factory() as s:
+        status_id = lookups.get(s).client_status_id.get("active")
+        # строка 1 — заголовок; reader.line_num считает с начала потока после него
+        for batch in _batches(((reader.line_num + 1, raw) for raw in reader), batch_size):
+            report.read += len(batch)
+            clean = []
+            for line, raw in batch:
+                row, error = _clean_row(raw, columns)
+                if error:
+                    report.reject(line, error)
+                else:
+                    clean.append(row)
+
+            db_phones, db_emails = _existing_keys(s, clean)
+            rows = []
+            for row in clean:
+                phone, email = row["phone_norm"], row["email_norm"]
+                if (phone and (phone in db_phones or phone in seen_phones)) or (
+                    email and (email in db_emails or email in seen_emails)
+                ):
+                    report.duplicates += 1
+                    continue
+                if phone:
+                    seen_phones.add(phone)
+                if email:
+                    seen_emails.add(email)
+                rows.append({**row, "status_id": status_id})
+
+            if rows and not dry_run:
+                s.execute(insert(Client), rows)
+                s.commit()
+            report.inserted += len(rows)
+    report.elapsed = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,129 @@
+"""Полнотекстовый поиск клиентов (SQLite FTS5).
+
+client_fts — FTS5-таблица с внешним содержимым (content='client'): текст
+хранится только в client, а в client_fts лежит инвертированный индекс по ФИО,
+телефону, email и примечанию. Триггеры держат индекс в синхроне с таблицей
+client при любых INSERT/UPDATE/DELETE, в том числе мимо ORM.
+
+Каждое слово запроса ищется как префикс ("иван" найдёт «Иванов», "900" —
+номер «+7 (900) …»), все слова должны совпасть; результат упорядочен по bm25
+с большим весом у ФИО.
+
+FTS5 есть только в SQLite; на других СУБД (PostgreSQL) индекс не создаётся, а
+search_clients ищет те же префиксы через ILIKE по четырём столбцам — без
+ранжирования, по алфавиту.
+"""
+from __future__ import annotations
+
+import re
+
+from sqlalchemy import select, and_, or_, false, literal_column, table, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import Client
+
+SEARCH_LIMIT = 20
+
+# веса столбцов для bm25: full_name, phone, email, note
+_BM25_WEIGHTS = "10.0, 5.0, 5.0, 1.0"
+
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS client_fts USING fts5(
+        full_name, phone, email, note,
+        content='client', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_fts_ai AFTER INSERT ON client BEGIN
+        INSERT INTO client_fts(rowid, full_name, phone, email, note)
+        VALUES (new.id, new.full_name, new.phone, new.email, new.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_fts_ad AFTER DELETE ON client BEGIN
+        INSERT INTO client_fts(client_fts, rowid, full_name, phone, email, note)
+        VALUES ('delete', old.id, old.full_name, old.phone, old.email, old.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_fts_au AFTER UPDATE ON client BEGIN
+        INSERT INTO client_fts(client_fts, rowid, full_name, phone, email, note)
+        VALUES ('delete', old.id, old.full_name, old.phone, old.email, old.note);
+        INSERT INTO client_fts(rowid, full_name, phone, email, note)
+        VALUES (new.id, new.full_name, new.phone, new.email, new.note);
+    END
+    """,
+]
+
+
+def create_client_fts(conn: Connection) -> None:
+    """Создать client_fts с триггерами и проиндексировать уже существующих клиентов."""
+    if conn.dialect.name != "sqlite":
+        return
+    for ddl in FTS_DDL:
+        conn.execute(text(ddl))
+    conn.execute(text("INSERT INTO client_fts(client_fts) VALUES ('rebuild')"))
+
+
+def fts_query(q: str) -> str:
+    """Строка поиска -> выражение MATCH: каждое слово как префикс, слова через AND.
+
+    Берутся только буквы и цифры, поэтому синтаксис FTS5 (кавычки, NEAR, *)
+    из пользовательского ввода не проходит.
+    """
+    terms = re.findall(r"\w+", q.lower())
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def _like_filter(terms: list[str]):
+    columns = (Client.full_name, Client.phone, Client.email, Client.note)
+    return and_(*(or_(*(c.icontains(t, autoescape=True) for c in columns)) for t in terms))
+
+
+def client_filter(q: str, dialect: str):
+    """Условие WHERE для select(Client) по строке поиска — для постраничного списка клиентов."""
+    terms = re.findall(r"\w+", q.lower())
+    if not terms:
+        return false()
+    if dialect != "sqlite":
+        return _like_filter(terms)
+    matched = (
+        select(literal_column("rowid"))
+        .select_from(table("client_fts"))
+        .where(text("client_fts MATCH :match").bindparams(match=fts_query(q)))
+    )
+    return Client.id.in_(matched)
+
+
+def _search_like(s: Session, terms: list[str], limit: int):
+    return s.execute(
+        select(Client.id, Client.full_name, Client.phone, Client.email)
+        .where(_like_filter(terms))
+        .order_by(Client.full_name, Client.id)
+        .limit(limit)
+    ).all()
+
+
+def search_clients(s: Session, q: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+    match = fts_query(q)
+    if not match:
+        return []
+    if s.get_bind().dialect.name != "sqlite":
+        rows = _search_like(s, re.findall(r"\w+", q.lower()), limit)
+        return [{"id": r.id, "full_name": r.full_name, "phone": r.phone, "email": r.email} for r in rows]
+    rows = s.execute(
+        text(f"""
+            SELECT c.id, c.full_name, c.phone, c.email
+            FROM client_fts
+            JOIN client c ON c.id = client_fts.rowid
+            WHERE client_fts MATCH :match
+            ORDER BY bm25(client_fts, {_BM25_WEIGHTS})
+            LIMIT :limit
+        """),
+        {"match": match, "limit": limit},
+    ).all()
+    return [{"id": r.id, "full_name": r.full_name, "phone": r.phone, "email": r.email} for r in rows]
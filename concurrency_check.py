@@ -0,0 +1,150 @@
+"""Стресс-проверка записи на слот из параллельных потоков (`flask check-concurrency`).
+
+Создаёт скрытый (is_active = false) слот далеко в будущем в первой зоне и
+одновременно отправляет в book_slot `threads` записей по одному участнику — каждая
+в своей сессии, как параллельные запросы. После прогона сверяет:
+
+- booked_count слота не больше его вместимости;
+- booked_count равен сумме участников неотменённых броней слота;
+- участников на это время не больше вместимости зоны;
+- записалось ровно min(вместимость, потоки) — лишние получили отказ, а не ошибку.
+
+Слот и его брони (с уведомлениями) в конце удаляются. Ошибки БД (`database is
+locked` — SQLite не дождался busy_timeout, нет свободного соединения в пуле)
+считаются отдельно и проверку не проходят.
+"""
+from __future__ import annotations
+from typing import Callable
+
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from booking_flow import BookingError, book_slot, load_slot
+from lookups import lookups
+from models import Booking, BookingStatus, Client, Notification, ScheduleSlot, Zone
+
+
+@dataclass
+class ConcurrencyReport:
+    threads: int
+    capacity: int
+    booked: int = 0
+    rejected: int = 0
+    errors: list[str] = field(default_factory=list)
+    booked_count: int = 0
+    bookings_participants: int = 0
+    checks: list[tuple[str, bool]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.checks) and all(ok for _, ok in self.checks)
+
+
+def _create_slot(s: Session, capacity: int) -> ScheduleSlot | None:
+    zone = s.execute(select(Zone).order_by(Zone.id)).scalars().first()
+    if zone is None:
+        return None
+    # после всех броней зоны: чужие брони не влияют на проверку вместимости зоны
+    last = s.execute(select(func.max(Booking.datetime_to)).where(Booking.zone_id == zone.id)).scalar()
+    start = max(last or datetime.now(), datetime.now()).replace(minute=0, second=0, microsecond=0) + timedelta(days=365)
+    slot = ScheduleSlot(
+        zone_id=zone.id,
+        datetime_from=start,
+        datetime_to=start + timedelta(hours=1),
+        capacity=min(capacity, zone.capacity),
+        price=zone.base_price,
+        lesson_type="group",
+        is_active=False,
+    )
+    s.add(slot)
+    s.commit()
+    return slot
+
+
+def _cleanup(s: Session, slot_id: int) -> None:
+    bookings = s.execute(select(Booking.id, Booking.client_id).where(Booking.schedule_slot_id == slot_id)).all()
+    for booking_id, client_id in bookings:
+        s.execute(delete(Notification).where(
+            Notification.client_id == client_id, Notification.message.like(f"Бронь №{booking_id} %")
+        ))
+    s.execute(delete(Booking).where(Booking.schedule_slot_id == slot_id))
+    s.execute(delete(ScheduleSlot).where(ScheduleSlot.id == slot_id))
+    s.commit()
+
+
+def check_slot_concurrency(session_factory: Callable[[], Session], threads: int = 40, capacity: int = 10) -> ConcurrencyReport:
+    with session_factory() as s:
+        client_id = s.execute(select(Client.id).order_by(Client.id)).scalars().first()
+        slot = _create_slot(s, capacity) if client_id is not None else None
+        if slot is None:
+            report = ConcurrencyReport(threads, capacity)
+            report.errors.append("нет зон или клиентов — сначала flask init-db")
+            return report
+        slot_id = slot.id
+        report = ConcurrencyReport(threads, slot.capacity)
+
+    barrier = threading.Barrier(threads)
+    mutex = threading.Lock()
+
+    def worker() -> None:
+        # старт одновременно, но до первого запроса: соединений в пуле меньше, чем потоков,
+        # и поток с соединением не должен ждать у барьера тех, кто ждёт соединение
+        barrier.wait()
+        with session_factory() as s:
+            try:
+                # как обработчик записи: слот прочитан в той же сессии, затем book_slot
+                lk = lookups.get(s)
+                book_slot(s, load_slot(s, slot_id), client_id, 1, lk)
+                outcome = "booked"
+            except BookingError:
+                outcome = "rejected"
+            except SQLAlchemyError as e:
+                s.rollback()
+                outcome = str(getattr(e, "orig", None) or e)
+        with mutex:
+            if outcome == "booked":
+                report.booked += 1
+            elif outcome == "rejected":
+                report.rejected += 1
+            else:
+                report.errors.append(outcome)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    with session_factory() as s:
+        try:
+            slot = load_slot(s, slot_id)
+            report.booked_count = slot.booked_count
+            report.bookings_participants = s.execute(
+                select(func.coalesce(func.sum(Booking.participants_count), 0))
+                .join(Booking.status)
+                .where(Booking.schedule_slot_id == slot_id, BookingStatus.code != "cancelled")
+            ).scalar_one()
+            report.checks = [
+                (f"booked_count {report.booked_count} <= вместимость {slot.capacity}", report.booked_count <= slot.capacity),
+                (
+                    f"booked_count {report.booked_count} = участники броней {report.bookings_participants}",
+                    report.booked_count == report.bookings_participants,
+                ),
+                (
+                    f"участники броней {report.bookings_participants} <= вместимость зоны {slot.zone.capacity}",
+                    report.bookings_participants <= slot.zone.capacity,
+                ),
+                (
+                    f"записано {report.booked} = min(вместимость, потоки) {min(slot.capacity, threads)}",
+                    report.booked == min(slot.capacity, threads),
+                ),
+                (f"ошибок {len(report.errors)}", not report.errors),
+            ]
+        finally:
+            _cleanup(s, slot_id)
+    return report
@@ -0,0 +1,26 @@
+"""Нормализация телефонов и email для поиска дублей клиентов.
+
+Ключи хранятся в client.phone_norm / client.email_norm (с индексами) и
+заполняются автоматически при присвоении Client.phone / Client.email.
+"""
+from __future__ import annotations
+from typing import Optional
+
+import re
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Только цифры, российские номера — к виду 7XXXXXXXXXX; None, если номер не похож на телефон."""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    elif len(digits) == 10:
+        digits = "7" + digits
+    return digits if 11 <= len(digits) <= 15 else None
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    email = (email or "").strip().lower()
+    return email if EMAIL_RE.match(email) else None
@@ -0,0 +1,224 @@
+"""Версии данных по таблицам и условный GET (ETag / 304) для часто опрашиваемых страниц.
+
+Триггеры на INSERT/UPDATE/DELETE (SQLite или PostgreSQL) увеличивают счётчик таблицы в
+cache_version (строка «table:<имя>»), так что версию меняет любой путь записи.
+Отдельная версия OCCUPANCY_VERSION меняется только при изменении занятости зон
+бронями — по ней перестраивается индекс свободных мест (availability.py).
+ETag страницы — хеш версий нужных ей таблиц, пользователя, адреса с
+параметрами и текущей минуты (в расписании и статусах броней участвует «сейчас»).
+
+Декоратор conditional_get(...) сверяет If-None-Match до того, как обработчик
+выполнит свои запросы: неизменившаяся страница стоит одного чтения маленькой
+таблицы и ответа 304 без рендеринга шаблона.
+"""
+from __future__ import annotations
+from typing import Callable
+
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import select, func, table, column, text
+from sqlalchemy.engine import Connection, Engine
+
+from models import CacheVersion
+
+VERSIONED_TABLES = ("schedule_slot", "booking", "zone", "employee", "client", "booking_status")
+VERSION_PREFIX = "table:"
+# занятость зон бронями (см. create_occupancy_triggers); последняя колонка — статус
+OCCUPANCY_VERSION = "booking:occupancy"
+OCCUPANCY_COLUMNS = ("zone_id", "datetime_from", "datetime_to", "participants_count", "status_id")
+# кэш браузера хранит страницу, но каждый раз сверяет её по ETag
+CACHE_CONTROL = "private, no-cache"
+# PostgreSQL: ключ pg_try_advisory_xact_lock, чтобы журнал сворачивал один процесс за раз
+COMPACT_LOCK_KEY = 0x4356_4552  # "CVER"
+
+
+def version_name(table: str) -> str:
+    return f"{VERSION_PREFIX}{table}"
+
+
+def create_data_version_triggers(conn: Connection) -> None:
+    """Строки счётчиков и триггеры для VERSIONED_TABLES (повторный вызов безопасен)."""
+    existing = set(conn.execute(select(CacheVersion.name)).scalars())
+    sqlite = conn.dialect.name == "sqlite"
+    if not sqlite:
+        # PostgreSQL: UPDATE строки cache_version из триггера держал бы её блокировку до commit
+        # и выстраивал пишущие транзакции в очередь — триггер только дописывает строку журнала,
+        # а версия = cache_version.version + число строк журнала (см. read_versions)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS cache_version_delta (
+                id BIGSERIAL PRIMARY KEY,
+                name VARCHAR NOT NULL
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cache_version_delta_name ON cache_version_delta (name)"))
+        conn.execute(text("""
+            CREATE OR REPLACE FUNCTION dv_bump() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO cache_version_delta (name) VALUES (TG_ARGV[0]);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """))
+    for tbl in VERSIONED_TABLES:
+        name = version_name(tbl)
+        if name not in existing:
+            conn.execute(CacheVersion.__table__.insert().values(name=name, version=0))
+        if not sqlite:
+            # триггер на оператор: массовый UPDATE увеличит версию один раз
+            conn.execute(text(f"DROP TRIGGER IF EXISTS dv_{tbl} ON {tbl}"))
+            conn.execute(text(f"""
+                CREATE TRIGGER dv_{tbl} AFTER INSERT OR UPDATE OR DELETE ON {tbl}
+                FOR EACH STATEMENT EXECUTE FUNCTION dv_bump('{name}')
+            """))
+            continue
+        for event, suffix in (("INSERT", "ai"), ("UPDATE", "au"), ("DELETE", "ad")):
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS dv_{tbl}_{suffix} AFTER {event} ON {tbl} BEGIN
+                    UPDATE cache_version SET version = version + 1 WHERE name = '{name}';
+                END
+            """))
+
+
+def compact_versions(conn: Connection) -> int | None:
+    """PostgreSQL: перенести строки cache_version_delta в cache_version; сумма версий не меняется.
+
+    Возвращает число перенесённых строк или None, если журнал сворачивает другой процесс.
+    """
+    if conn.dialect.name == "sqlite":
+        return 0
+    if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": COMPACT_LOCK_KEY}).scalar_one():
+        return None
+    return conn.execute(text("""
+        WITH moved AS (DELETE FROM cache_version_delta RETURNING name),
+             sums AS (SELECT name, COUNT(*) AS n FROM moved GROUP BY name),
+             applied AS (
+                 UPDATE cache_version c SET version = c.version + sums.n FROM sums WHERE c.name = sums.name
+             )
+        SELECT CAST(COALESCE(SUM(n), 0) AS BIGINT) FROM sums
+    """)).scalar_one()
+
+
+def create_occupancy_triggers(conn: Connection) -> None:
+    """Версия OCCUPANCY_VERSION: растёт на 1 за каждую строку booking, изменившую занятость зон.
+
+    Занятость меняют вставка и удаление неотменённой брони, отмена и восстановление,
+    перенос по зоне/времени и смена числа участников; оплата, услуги и переход
+    «новая → подтверждена» её не трогают (см. availability.AvailabilityIndex).
+    """
+    if not conn.execute(select(CacheVersion.name).where(CacheVersion.name == OCCUPANCY_VERSION)).first():
+        conn.execute(CacheVersion.__table__.insert().values(name=OCCUPANCY_VERSION, version=0))
+    cols = ", ".join(OCCUPANCY_COLUMNS)
+    if conn.dialect.name != "sqlite":
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION dv_occupancy() RETURNS trigger AS $$
+            DECLARE
+                old_active boolean := false;
+                new_active boolean := false;
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    old_active := NOT EXISTS (SELECT 1 FROM booking_status WHERE id = OLD.status_id AND code = 'cancelled');
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    new_active := NOT EXISTS (SELECT 1 FROM booking_status WHERE id = NEW.status_id AND code = 'cancelled');
+                END IF;
+                IF NOT (old_active OR new_active) THEN
+                    RETURN NULL;
+                END IF;
+                IF TG_OP = 'UPDATE' AND old_active = new_active
+                   AND (OLD.{", OLD.".join(OCCUPANCY_COLUMNS[:-1])}) IS NOT DISTINCT FROM (NEW.{", NEW.".join(OCCUPANCY_COLUMNS[:-1])}) THEN
+                    RETURN NULL;
+                END IF;
+                INSERT INTO cache_version_delta (name) VALUES ('{OCCUPANCY_VERSION}');
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """))
+        conn.execute(text("DROP TRIGGER IF EXISTS dv_occupancy ON booking"))
+        # триггер на строку: версия считает записи по одной, как их вносит в индекс процесс-автор
+        conn.execute(text(f"""
+            CREATE TRIGGER dv_occupancy AFTER INSERT OR DELETE OR UPDATE OF {cols} ON booking
+            FOR EACH ROW EXECUTE FUNCTION dv_occupancy()
+        """))
+        conn.execute(text("DROP TRIGGER IF EXISTS dv_occupancy_status ON booking_status"))
+        conn.execute(text(f"""
+            CREATE TRIGGER dv_occupancy_status AFTER UPDATE OF code ON booking_status
+            FOR EACH ROW WHEN ((OLD.code = 'cancelled') IS DISTINCT FROM (NEW.code = 'cancelled'))
+            EXECUTE FUNCTION dv_bump('{OCCUPANCY_VERSION}')
+        """))
+        return
+    bump = f"UPDATE cache_version SET version = version + 1 WHERE name = '{OCCUPANCY_VERSION}';"
+
+    def active(ref: str) -> str:
+        return f"{ref}.status_id NOT IN (SELECT id FROM booking_status WHERE code = 'cancelled')"
+
+    moved = " OR ".join(f"old.{c} IS NOT new.{c}" for c in OCCUPANCY_COLUMNS[:-1])
+    for suffix, event, when in (
+        ("ai", "INSERT", active("new")),
+        ("ad", "DELETE", active("old")),
+        ("au", f"UPDATE OF {cols}",
+         f"({active('old')} OR {active('new')}) AND (({active('old')}) <> ({active('new')}) OR {moved})"),
+    ):
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS dv_occupancy_{suffix} AFTER {event} ON booking WHEN {when} BEGIN
+                {bump}
+            END
+        """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS dv_occupancy_status_au AFTER UPDATE OF code ON booking_status
+        WHEN (old.code = 'cancelled') <> (new.code = 'cancelled') BEGIN
+            {bump}
+        END
+    """))
+
+
+def _read_named(conn: Connection, names: list[str]) -> dict[str, int]:
+    if conn.dialect.name == "sqlite":
+        return dict(conn.execute(select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(names))).all())
+    delta = table("cache_version_delta", column("name"))
+    pending = select(func.count()).select_from(delta).where(delta.c.name == CacheVersion.name).scalar_subquery()
+    rows = conn.execute(select(CacheVersion.name, CacheVersion.version, pending).where(CacheVersion.name.in_(names))).all()
+    return {name: version + n for name, version, n in rows}
+
+
+def read_versions(conn: Connection, tables: tuple[str, ...]) -> dict[str, int]:
+    return _read_named(conn, [version_name(t) for t in tables])
+
+
+def occupancy_version(conn: Connection) -> int | None:
+    """Текущая версия занятости; внутри транзакции записи — вместе с её собственными изменениями."""
+    return _read_named(conn, [OCCUPANCY_VERSION]).get(OCCUPANCY_VERSION)
+
+
+def page_etag(versions: dict[str, int], now: datetime) -> str:
+    user = current_user.get_id() if current_user.is_authenticated else "-"
+    parts = [user, request.full_path, now.strftime("%Y-%m-%dT%H:%M")]
+    parts += [f"{name}={versions[name]}" for name in sorted(versions)]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def conditional_get(engine: Engine, *tables: str) -> Callable:
+    """ETag из версий tables; на совпавший If-None-Match — 304 без вызова обработчика."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            # непоказанные flash-сообщения должны попасть в свежую страницу
+            if request.method != "GET" or session.get("_flashes"):
+                return fn(*args, **kwargs)
+            with engine.connect() as conn:
+                etag = page_etag(read_versions(conn, tables), datetime.now())
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = CACHE_CONTROL
+            response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
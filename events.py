@@ -0,0 +1,195 @@
+"""Живая загрузка слотов для табло и планшетов (Server-Sent Events).
+
+Обработчики, которые меняют занятость (запись, отмена, удаление брони, вход и
+выход посетителя), после commit вызывают publish_occupancy(...). Для каждого
+затронутого слота собирается компактное событие — занято мест, броней,
+свободно, на месте — и рассылается подписчикам /events/occupancy.
+
+Доставка (EVENTS_BACKEND):
+- memory (по умолчанию) — очереди в памяти процесса; подходит, когда сервер
+  один процесс (потоки);
+- db — события пишутся в таблицу occupancy_event, а фоновый поток каждого
+  процесса раз в EVENT_POLL_INTERVAL секунд забирает новые и раздаёт своим
+  подписчикам. Так события доходят до табло, подключённых к любому воркеру.
+
+Медленный подписчик не тормозит остальных: при переполненной очереди его
+события отбрасываются (следующее событие по слоту всё равно несёт полное состояние).
+"""
+from __future__ import annotations
+from typing import Optional
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func, case, and_
+from sqlalchemy.orm import Session, joinedload
+
+from availability import slot_available
+from db import engine
+from models import Booking, BookingStatus, OccupancyEvent, ScheduleSlot, Visit
+
+EVENTS_BACKEND = os.environ.get("EVENTS_BACKEND", "memory")
+EVENT_POLL_INTERVAL = 1.0
+EVENT_RETENTION = timedelta(minutes=10)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscriber:
+    def __init__(self, zone_id: Optional[int]) -> None:
+        self.zone_id = zone_id
+        self.queue: queue.Queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class OccupancyHub:
+    def __init__(self, backend: str = EVENTS_BACKEND) -> None:
+        self.backend = backend
+        self._subscribers: set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._poller: Optional[threading.Thread] = None
+
+    # ---- подписчики ----
+    def subscribe(self, zone_id: Optional[int] = None) -> Subscriber:
+        sub = Subscriber(zone_id)
+        with self._lock:
+            self._subscribers.add(sub)
+            if self.backend == "db" and self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="occupancy-events", daemon=True)
+                self._poller.start()
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _deliver(self, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.zone_id is not None and sub.zone_id != event["zone_id"]:
+                continue
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                pass
+
+    # ---- публикация ----
+    def publish(self, events: list[dict]) -> None:
+        if not events:
+            return
+        if self.backend == "db":
+            with engine.begin() as conn:
+                conn.execute(
+                    OccupancyEvent.__table__.insert(),
+                    [{"zone_id": e["zone_id"], "payload": json.dumps(e, ensure_ascii=False)} for e in events],
+                )
+            return
+        for event in events:
+            self._deliver({"id": next(self._ids), **event})
+
+    def _poll(self) -> None:
+        last_id: Optional[int] = None
+        pruned_at = 0.0
+        while True:
+            rows = []
+            try:
+                with engine.begin() as conn:
+                    if last_id is None or not self._subscribers:
+                        # без подписчиков только двигаем позицию: первый подписчик
+                        # после затишья не должен получить накопившиеся события
+                        last_id = conn.execute(select(func.max(OccupancyEvent.id))).scalar_one() or 0
+                    else:
+                        rows = conn.execute(
+                            select(OccupancyEvent.id, OccupancyEvent.payload)
+                            .where(OccupancyEvent.id > last_id)
+                            .order_by(OccupancyEvent.id)
+                        ).all()
+                    if time.monotonic() - pruned_at > 60:
+                        conn.execute(delete(OccupancyEvent).where(OccupancyEvent.created_at < datetime.utcnow() - EVENT_RETENTION))
+                        pruned_at = time.monotonic()
+            except Exception:
+                # база занята или недоступна — попробуем на следующем круге
+                pass
+            for event_id, payload in rows:
+                self._deliver({"id": event_id, **json.loads(payload)})
+                last_id = event_id
+            time.sleep(EVENT_POLL_INTERVAL)
+
+
+occupancy = OccupancyHub()
+
+
+def slot_counts(s: Session, slot_ids: list[int]) -> dict[int, tuple[int, int]]:
+    """{id слота: (не отменённых броней, участников на месте — вход есть, выхода нет)}."""
+    if not slot_ids:
+        return {}
+    present = and_(Visit.checkin_at.is_not(None), Visit.checkout_at.is_(None))
+    rows = s.execute(
+        select(
+            Booking.schedule_slot_id,
+            func.count(Booking.id),
+            func.coalesce(
+                func.sum(case((present, func.coalesce(Visit.actual_participants_count, Booking.participants_count)), else_=0)),
+                0,
+            ),
+        )
+        .join(BookingStatus, BookingStatus.id == Booking.status_id)
+        .outerjoin(Visit, Visit.booking_id == Booking.id)
+        .where(Booking.schedule_slot_id.in_(slot_ids), BookingStatus.code != "cancelled")
+        .group_by(Booking.schedule_slot_id)
+    ).all()
+    return {slot_id: (bookings, int(on_site)) for slot_id, bookings, on_site in rows}
+
+
+def occupancy_events(s: Session, reason: str, zone_id: int, start: datetime, end: datetime) -> list[dict]:
+    """Состояние активных слотов зоны, пересекающихся с [start, end)."""
+    slots = s.execute(
+        select(ScheduleSlot)
+        .options(joinedload(ScheduleSlot.zone))
+        .where(
+            ScheduleSlot.zone_id == zone_id,
+            ScheduleSlot.is_active.is_(True),
+            # слоты длиннее суток не заводят — нижняя граница по datetime_from идёт по индексу
+            ScheduleSlot.datetime_from >= start - timedelta(days=1),
+            ScheduleSlot.datetime_from < end,
+            ScheduleSlot.datetime_to > start,
+        )
+    ).scalars().all()
+    if not slots:
+        return []
+
+    counts = slot_counts(s, [slot.id for slot in slots])
+    events = []
+    for slot in slots:
+        bookings, on_site = counts.get(slot.id, (0, 0))
+        events.append({
+            "reason": reason,
+            "slot_id": slot.id,
+            "zone_id": slot.zone_id,
+            "capacity": slot.capacity,
+            "booked": slot.booked_count,
+            "bookings": bookings,
+            "present": on_site,
+            "available": slot_available(s, slot),
+        })
+    return events
+
+
+def publish_occupancy(s: Session, reason: str, zone_id: int, start: datetime, end: datetime) -> None:
+    """Разослать новое состояние слотов после commit изменения брони или посещения."""
+    occupancy.publish(occupancy_events(s, reason, zone_id, start, end))
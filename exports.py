@@ -0,0 +1,161 @@
+"""Потоковые CSV-выгрузки для бухгалтерии: брони, оплаты, услуги в бронях, посещения.
+
+Строки читаются Core-запросом с yield_per (порциями по EXPORT_BATCH_ROWS, без
+ORM-объектов и без .all()) и сразу пишутся в CSV; наружу отдаётся генератор
+кусков текста. Память не зависит от числа строк — ответ Flask и команда
+`flask export` пишут куски по мере чтения.
+
+CSV — с BOM и разделителем «;», чтобы русский Excel открывал файл без мастера
+импорта. Период задаётся полуинтервалом [date_from, date_to + 1 день): брони,
+услуги и посещения — по началу занятия, оплаты — по дате оплаты.
+"""
+from __future__ import annotations
+from typing import Iterator, Optional
+
+import csv
+import io
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select, func
+from sqlalchemy.engine import Engine
+
+from models import Booking, BookingStatus, BookingService, Client, Payment, Service, Visit, Zone
+
+EXPORT_BATCH_ROWS = 1000
+# сколько строк CSV копить перед отдачей куска клиенту
+EXPORT_CHUNK_ROWS = 500
+
+
+def _bookings_query():
+    services_sum = (
+        select(func.coalesce(func.sum(BookingService.line_sum), 0))
+        .where(BookingService.booking_id == Booking.id)
+        .scalar_subquery()
+    )
+    checkin = select(func.min(Visit.checkin_at)).where(Visit.booking_id == Booking.id).scalar_subquery()
+    checkout = select(func.max(Visit.checkout_at)).where(Visit.booking_id == Booking.id).scalar_subquery()
+    return (
+        select(
+            Booking.id, Booking.created_at, Booking.datetime_from, Booking.datetime_to,
+            Booking.client_id, Client.full_name, Zone.zone_name, BookingStatus.name,
+            Booking.participants_count, Booking.session_sum, services_sum, Booking.total_sum,
+            Booking.paid_sum, Booking.due_sum, checkin, checkout,
+        )
+        .join(Client, Client.id == Booking.client_id)
+        .join(Zone, Zone.id == Booking.zone_id)
+        .join(BookingStatus, BookingStatus.id == Booking.status_id)
+    ), Booking.datetime_from, (Booking.datetime_from, Booking.id)
+
+
+def _payments_query():
+    return (
+        select(
+            Payment.id, Payment.paid_at, Payment.booking_id, Client.full_name, Zone.zone_name,
+            Payment.amount, Payment.method, Payment.comment,
+        )
+        .join(Booking, Booking.id == Payment.booking_id)
+        .join(Client, Client.id == Booking.client_id)
+        .join(Zone, Zone.id == Booking.zone_id)
+    ), Payment.paid_at, (Payment.paid_at, Payment.id)
+
+
+def _services_query():
+    return (
+        select(
+            BookingService.booking_id, Booking.datetime_from, Zone.zone_name, Service.name,
+            BookingService.qty, BookingService.unit_price, BookingService.line_sum,
+        )
+        .join(Booking, Booking.id == BookingService.booking_id)
+        .join(Zone, Zone.id == Booking.zone_id)
+        .join(Service, Service.id == BookingService.service_id)
+    ), Booking.datetime_from, (Booking.datetime_from, Booking.id, BookingService.service_id)
+
+
+def _visits_query():
+    return (
+        select(
+            Visit.id, Visit.booking_id, Booking.datetime_from, Client.full_name, Zone.zone_name,
+            Booking.participants_count, Visit.actual_participants_count, Visit.checkin_at, Visit.checkout_at,
+        )
+        .join(Booking, Booking.id == Visit.booking_id)
+        .join(Client, Client.id == Booking.client_id)
+        .join(Zone, Zone.id == Booking.zone_id)
+    ), Booking.datetime_from, (Booking.datetime_from, Visit.id)
+
+
+# вид выгрузки -> (заголовки, построитель запроса: (select, колонка периода, порядок))
+EXPORTS = {
+    "bookings": (
+        ["ID брони", "Создана", "Начало", "Окончание", "ID клиента", "Клиент", "Зона", "Статус",
+         "Участников", "Сумма сеанса", "Сумма услуг", "Итого", "Оплачено", "Остаток", "Вход", "Выход"],
+        _bookings_query,
+    ),
+    "payments": (
+        ["ID оплаты", "Дата оплаты", "ID брони", "Клиент", "Зона", "Сумма", "Способ", "Комментарий"],
+        _payments_query,
+    ),
+    "services": (
+        ["ID брони", "Начало", "Зона", "Услуга", "Кол-во", "Цена", "Сумма"],
+        _services_query,
+    ),
+    "visits": (
+        ["ID посещения", "ID брони", "Начало", "Клиент", "Зона", "Участников (бронь)",
+         "Участников (факт)", "Вход", "Выход"],
+        _visits_query,
+    ),
+}
+
+
+def export_query(kind: str, date_from: Optional[date], date_to: Optional[date]):
+    headers, build = EXPORTS[kind]
+    query, period_column, order = build()
+    if date_from:
+        query = query.where(period_column >= datetime.combine(date_from, time()))
+    if date_to:
+        query = query.where(period_column < datetime.combine(date_to + timedelta(days=1), time()))
+    return headers, query.order_by(*order)
+
+
+# с этих символов Excel начинает формулу — текст из базы (ФИО, примечания) ею быть не должен
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, str):
+        return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+    return str(value)
+
+
+def stream_csv(
+    engine: Engine,
+    kind: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Iterator[str]:
+    """Генератор кусков CSV; соединение держится открытым, пока генератор читают."""
+    headers, query = export_query(kind, date_from, date_to)
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+    buf.write("\ufeff")
+    writer.writerow(headers)
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH_ROWS).execute(query)
+        pending = 0
+        for row in result:
+            writer.writerow([_cell(v) for v in row])
+            pending += 1
+            if pending >= EXPORT_CHUNK_ROWS:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+                pending = 0
+    yield buf.getvalue()
+
+
+def export_filename(kind: str, date_from: Optional[date], date_to: Optional[date]) -> str:
+    period = "_".join(d.isoformat() for d in (date_from, date_to) if d)
+    return f"{kind}_{period}.csv" if period else f"{kind}.csv"
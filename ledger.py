@@ -0,0 +1,81 @@
+"""Денормализованные суммы оплат по брони: Booking.paid_sum и Booking.due_sum.
+
+paid_sum = сумма Payment.amount по брони, due_sum = total_sum - paid_sum.
+Обе колонки меняются в той же транзакции, что и запись оплаты или пересчёт
+итога; `flask reconcile-payments` пересобирает их из таблицы payment.
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+
+from sqlalchemy import select, func, update, or_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import Booking, Payment
+
+# расхождение меньше копейки — погрешность хранения NUMERIC в SQLite
+TOLERANCE = Decimal("0.005")
+
+
+def apply_payment(s: Session, booking_id: int, amount: Decimal, require_due: bool = False) -> bool:
+    """Учесть новую оплату в paid_sum/due_sum одним UPDATE (без чтения-изменения-записи).
+
+    С require_due=True оплата проходит, только если остаток не меньше суммы, —
+    так две одновременные оплаты одной брони не спишут долг дважды.
+    """
+    query = update(Booking).where(Booking.id == booking_id)
+    if require_due:
+        query = query.where(Booking.due_sum >= amount - TOLERANCE)
+    res = s.execute(
+        query
+        .values(
+            paid_sum=func.round(Booking.paid_sum + amount, 2),
+            due_sum=func.round(func.coalesce(Booking.total_sum, 0) - Booking.paid_sum - amount, 2),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
+
+
+def _actual_paid():
+    return (
+        select(func.coalesce(func.sum(Payment.amount), 0))
+        .where(Payment.booking_id == Booking.id)
+        .scalar_subquery()
+    )
+
+
+def payment_drift(conn: Connection) -> list[dict]:
+    """Брони, у которых paid_sum/due_sum разошлись с таблицей payment."""
+    actual = _actual_paid()
+    rows = conn.execute(
+        select(Booking.id, Booking.paid_sum, Booking.due_sum, Booking.total_sum, actual.label("actual_paid")).where(
+            or_(
+                func.abs(Booking.paid_sum - actual) > TOLERANCE,
+                func.abs(Booking.due_sum - (func.coalesce(Booking.total_sum, 0) - actual)) > TOLERANCE,
+            )
+        )
+    ).all()
+    return [
+        {
+            "booking_id": r.id,
+            "paid_sum": r.paid_sum,
+            "actual_paid": Decimal(str(r.actual_paid)),
+            "due_sum": r.due_sum,
+            "actual_due": Decimal(str(r.total_sum or 0)) - Decimal(str(r.actual_paid)),
+        }
+        for r in rows
+    ]
+
+
+def rebuild_payment_totals(conn: Connection) -> int:
+    """Пересобрать paid_sum/due_sum всех броней из таблицы payment; вернуть число строк."""
+    actual = _actual_paid()
+    res = conn.execute(
+        update(Booking).values(
+            paid_sum=actual,
+            due_sum=func.coalesce(Booking.total_sum, 0) - actual,
+        )
+    )
+    return res.rowcount
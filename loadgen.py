@@ -0,0 +1,312 @@
+"""Нагрузочный прогон «час пик» против запущенного сервера (замкнутый цикл).
+
+Каждый виртуальный пользователь — поток со своей cookie-сессией: входит под
+своей учёткой и по кругу выполняет сценарии своей роли, выбирая их по весам
+и выдерживая между шагами паузу «на подумать» (экспоненциальную со средним
+--think). Новый шаг начинается только после ответа на предыдущий, поэтому
+число одновременных запросов не больше числа пользователей, а пропускная
+способность показывает, сколько сервер реально успевает.
+
+Роли и сценарии (ROLE_MIX, FLOWS):
+- client — расписание → форма записи → запись → оплата; просмотр своих броней;
+- staff — ресепшен: брони на сегодня → вход → выход; листание списка броней и клиентов;
+- coach — своё расписание → слот.
+
+Учётки load-<роль>-<N> с паролем LOAD_PASSWORD создаёт `flask gen-accounts`
+(на базе после `flask gen-data`). Ответ 503 с заголовком X-Database-Busy сервер
+отдаёт, когда SQLite не дождался блокировки («database is locked») — такие
+ошибки считаются отдельно.
+
+Отчёт: по интервалам (--interval) — запросы/с, ошибки, блокировки и p50/p95/p99;
+в конце — итог по шагам сценариев. Только стандартная библиотека:
+
+    python loadgen.py --base-url http://127.0.0.1:5000 --users 50 --duration 120 --out run.json
+"""
+from __future__ import annotations
+from typing import Callable, Optional
+
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date
+
+LOAD_PASSWORD = "load"
+# сколько учёток каждой роли заводит `flask gen-accounts` по умолчанию
+LOAD_ACCOUNTS = {"client": 200, "staff": 10, "coach": 10}
+ROLE_MIX = {"client": 0.7, "staff": 0.2, "coach": 0.1}
+REQUEST_TIMEOUT = 30.0
+BUSY_HEADER = "X-Database-Busy"
+
+_BOOK_LINK = re.compile(r'href="(/client/schedule/\d+/book)"\s*>')
+_CLIENT_BOOKING = re.compile(r"/client/bookings/(\d+)$")
+_BOOKING_LINK = re.compile(r'href="/bookings/(\d+)"')
+_NEXT_PAGE = re.compile(r'href="(/bookings\?[^"]*after=[^"]*)"')
+_COACH_SLOT = re.compile(r'href="(/coach/schedule/\d+)"')
+
+
+def load_login(role: str, n: int) -> str:
+    return f"load-{role}-{n}"
+
+
+class Sample:
+    __slots__ = ("at", "step", "status", "ms", "kind")
+
+    def __init__(self, at: float, step: str, status: int, ms: float, kind: str) -> None:
+        self.at = at
+        self.step = step
+        self.status = status
+        self.ms = ms
+        self.kind = kind  # ok | error | busy | timeout
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.samples: list[Sample] = []
+        self._lock = threading.Lock()
+
+    def add(self, step: str, status: int, ms: float, kind: str) -> None:
+        sample = Sample(time.perf_counter() - self.started, step, status, ms, kind)
+        with self._lock:
+            self.samples.append(sample)
+
+
+class VirtualUser:
+    """Браузер одного пользователя: cookie, переходы по редиректам, замер каждого шага."""
+
+    def __init__(self, base_url: str, recorder: Recorder, rng: random.Random, think: float) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.rng = rng
+        self.think_mean = think
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, step: str, path: str, form: Optional[dict] = None) -> tuple[int, str, str]:
+        """(статус, конечный путь после редиректов, тело); ошибки тоже записываются в отчёт."""
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        started = time.perf_counter()
+        status, final, body, kind = 0, path, "", "error"
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=REQUEST_TIMEOUT) as resp:
+                status, body = resp.status, resp.read().decode("utf-8", "replace")
+                final = urllib.parse.urlsplit(resp.geturl()).path
+                kind = "ok"
+        except urllib.error.HTTPError as e:
+            status = e.code
+            kind = "busy" if e.headers.get(BUSY_HEADER) else "error"
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            kind = "timeout"
+        self.recorder.add(step, status, (time.perf_counter() - started) * 1000, kind)
+        return status, final, body
+
+    def think(self) -> None:
+        if self.think_mean > 0:
+            time.sleep(self.rng.expovariate(1 / self.think_mean))
+
+    def login(self, login: str, password: str) -> bool:
+        status, final, _ = self.request("login", "/login", {"login": login, "password": password})
+        return status == 200 and final != "/login"
+
+
+# ---- сценарии: fn(user) ----
+def flow_client_book(u: VirtualUser) -> None:
+    _, _, body = u.request("client_schedule", "/client/schedule")
+    links = _BOOK_LINK.findall(body)
+    if not links:
+        return
+    link = u.rng.choice(links)
+    u.think()
+    u.request("client_booking_form", link)
+    u.think()
+    status, final, _ = u.request("client_booking_create", link, {"participants_count": str(u.rng.choice((1, 1, 2)))})
+    m = _CLIENT_BOOKING.search(final)
+    if status != 200 or not m:
+        return
+    u.think()
+    u.request("client_booking_pay", f"/client/bookings/{m.group(1)}/pay", {"method": u.rng.choice(("card", "cash"))})
+
+
+def flow_client_browse(u: VirtualUser) -> None:
+    u.request("client_dashboard", "/client")
+    u.think()
+    _, _, body = u.request("client_bookings", "/client/bookings")
+    ids = re.findall(r'href="/client/bookings/(\d+)"', body)
+    if ids:
+        u.think()
+        u.request("client_booking_view", f"/client/bookings/{u.rng.choice(ids)}")
+
+
+def flow_staff_checkin(u: VirtualUser) -> None:
+    today = date.today().isoformat()
+    _, _, body = u.request("bookings_today", f"/bookings?date_from={today}&date_to={today}")
+    ids = _BOOKING_LINK.findall(body)
+    if not ids:
+        return
+    booking_id = u.rng.choice(ids)
+    u.think()
+    u.request("visit_checkin", f"/bookings/{booking_id}/visit/checkin", {})
+    u.think()
+    u.request("visit_checkout", f"/bookings/{booking_id}/visit/checkout", {})
+
+
+def flow_staff_browse(u: VirtualUser) -> None:
+    u.request("dashboard", "/")
+    u.think()
+    _, _, body = u.request("bookings_list", "/bookings")
+    for _ in range(u.rng.randint(0, 3)):
+        m = _NEXT_PAGE.search(body)
+        if not m:
+            break
+        u.think()
+        _, _, body = u.request("bookings_list_next", m.group(1).replace("&amp;", "&"))
+    ids = _BOOKING_LINK.findall(body)
+    if ids:
+        u.think()
+        u.request("booking_view", f"/bookings/{u.rng.choice(ids)}")
+    u.think()
+    u.request("clients_list", "/clients")
+
+
+def flow_coach(u: VirtualUser) -> None:
+    _, _, body = u.request("coach_dashboard", "/coach")
+    slots = _COACH_SLOT.findall(body)
+    if slots:
+        u.think()
+        u.request("coach_slot_view", u.rng.choice(slots))
+
+
+# роль -> [(сценарий, вес)]
+FLOWS: dict[str, list[tuple[Callable[[VirtualUser], None], int]]] = {
+    "client": [(flow_client_book, 5), (flow_client_browse, 3)],
+    "staff": [(flow_staff_checkin, 2), (flow_staff_browse, 2)],
+    "coach": [(flow_coach, 1)],
+}
+
+
+def _roles(users: int) -> list[str]:
+    """Распределить пользователей по ROLE_MIX (не меньше одного на роль, если пользователей хватает)."""
+    roles = []
+    for role, share in ROLE_MIX.items():
+        roles += [role] * max(1 if users >= len(ROLE_MIX) else 0, round(users * share))
+    return roles[:users] + ["client"] * (users - len(roles))
+
+
+def _user_loop(base_url: str, role: str, n: int, args, recorder: Recorder, deadline: float, seed: int) -> None:
+    rng = random.Random(seed)
+    user = VirtualUser(base_url, recorder, rng, args.think)
+    if not user.login(load_login(role, n), args.password):
+        return
+    flows, weights = zip(*FLOWS[role])
+    while time.perf_counter() < deadline:
+        rng.choices(flows, weights)[0](user)
+        user.think()
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _stats(samples: list[Sample], seconds: float) -> dict:
+    ms = sorted(s.ms for s in samples)
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+        "errors": sum(s.kind in ("error", "timeout") for s in samples),
+        "busy": sum(s.kind == "busy" for s in samples),
+        "p50_ms": round(_pct(ms, 0.50), 1),
+        "p95_ms": round(_pct(ms, 0.95), 1),
+        "p99_ms": round(_pct(ms, 0.99), 1),
+    }
+
+
+def summarize(recorder: Recorder, duration: float, interval: float) -> dict:
+    samples = list(recorder.samples)
+    timeline = []
+    t = 0.0
+    while t < duration:
+        chunk = [s for s in samples if t <= s.at < t + interval]
+        timeline.append({"t": round(t, 1), **_stats(chunk, interval)})
+        t += interval
+    steps = {}
+    for step in sorted({s.step for s in samples}):
+        steps[step] = _stats([s for s in samples if s.step == step], duration)
+    return {"total": _stats(samples, duration), "timeline": timeline, "steps": steps}
+
+
+def run(args) -> dict:
+    roles = _roles(args.users)
+    counters = {role: 0 for role in ROLE_MIX}
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration
+    threads = []
+    for i, role in enumerate(roles):
+        counters[role] += 1
+        n = (counters[role] - 1) % args.accounts.get(role, LOAD_ACCOUNTS[role]) + 1
+        t = threading.Thread(
+            target=_user_loop, args=(args.base_url, role, n, args, recorder, deadline, args.seed * 100_003 + i), daemon=True
+        )
+        threads.append(t)
+        t.start()
+        # пользователи подключаются постепенно, а не одной волной
+        time.sleep(args.ramp_up / max(1, len(roles)))
+    for t in threads:
+        t.join(timeout=args.duration + REQUEST_TIMEOUT + args.ramp_up)
+    elapsed = time.perf_counter() - recorder.started
+    result = summarize(recorder, elapsed, args.interval)
+    result["config"] = {
+        "base_url": args.base_url, "users": args.users, "roles": {r: roles.count(r) for r in ROLE_MIX},
+        "duration": args.duration, "think": args.think, "ramp_up": args.ramp_up, "seed": args.seed,
+    }
+    return result
+
+
+def print_report(result: dict) -> None:
+    cfg = result["config"]
+    print(f"Пользователей: {cfg['users']} {cfg['roles']}, {cfg['duration']} с, пауза ~{cfg['think']} с")
+    print(f"{'t, с':>6} {'зап/с':>7} {'ошибок':>7} {'locked':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for row in result["timeline"]:
+        print(f"{row['t']:>6} {row['rps']:>7} {row['errors']:>7} {row['busy']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+    print()
+    print(f"{'шаг':<24} {'запросов':>9} {'ошибок':>7} {'locked':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for step, row in result["steps"].items():
+        print(f"{step:<24} {row['requests']:>9} {row['errors']:>7} {row['busy']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+    total = result["total"]
+    print()
+    print(
+        f"Итого: {total['requests']} запросов, {total['rps']} зап/с, ошибок {total['errors']}, "
+        f"database is locked {total['busy']}, p50 {total['p50_ms']} мс, p95 {total['p95_ms']} мс, p99 {total['p99_ms']} мс"
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон против запущенного сервера.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--duration", type=float, default=60, help="длительность, с")
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза между шагами, с (0 — без пауз)")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="за сколько секунд подключить всех пользователей")
+    parser.add_argument("--interval", type=float, default=5.0, help="шаг временного ряда в отчёте, с")
+    parser.add_argument("--password", default=LOAD_PASSWORD)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="сохранить результаты в JSON")
+    for role, count in LOAD_ACCOUNTS.items():
+        parser.add_argument(f"--{role}-accounts", type=int, default=count, help=f"учёток load-{role}-N на сервере")
+    args = parser.parse_args(argv)
+    args.accounts = {role: getattr(args, f"{role}_accounts") for role in LOAD_ACCOUNTS}
+
+    result = run(args)
+    print_report(result)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Кэш небольших справочников в памяти процесса.
+
+Статусы, типы зон, зоны, услуги и тренеры меняются редко, а читаются почти в
+каждом запросе (id статуса по коду, списки для выпадающих меню). Снимок этих
+таблиц строится одним проходом и хранится в памяти, пока не изменится версия.
+
+Версия лежит в таблице cache_version (строка LOOKUPS). Обработчики, которые
+меняют справочники, вызывают invalidate(s) до commit — версия растёт в той же
+транзакции, и другие процессы замечают это при следующей сверке (не чаще раза
+в VERSION_CHECK_INTERVAL секунд).
+"""
+from __future__ import annotations
+from typing import NamedTuple, Optional
+
+import threading
+import time
+from decimal import Decimal
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from models import (
+    BookingStatus, ClientStatus, SubscriptionStatus,
+    ZoneType, ZoneStatus, Zone,
+    Position, Employee,
+    Service,
+    CacheVersion,
+)
+
+LOOKUPS = "lookups"
+VERSION_CHECK_INTERVAL = 2.0
+
+
+class CodeOption(NamedTuple):
+    id: int
+    code: str
+    name: str
+
+
+class ZoneOption(NamedTuple):
+    id: int
+    zone_name: str
+    capacity: int
+    base_price: Decimal
+    type: CodeOption
+    status: CodeOption
+
+
+class ServiceOption(NamedTuple):
+    id: int
+    name: str
+    base_price: Decimal
+    description: Optional[str]
+
+
+class EmployeeOption(NamedTuple):
+    id: int
+    full_name: str
+    position_id: int
+
+
+class LookupSnapshot:
+    """Неизменяемый снимок справочников; списки уже отсортированы для форм."""
+
+    def __init__(self, s: Session, version: int) -> None:
+        self.version = version
+        self.booking_statuses = self._codes(s, BookingStatus, BookingStatus.id)
+        self.client_statuses = self._codes(s, ClientStatus, ClientStatus.id)
+        self.subscription_statuses = self._codes(s, SubscriptionStatus, SubscriptionStatus.id)
+        self.zone_types = self._codes(s, ZoneType, ZoneType.name)
+        self.zone_statuses = self._codes(s, ZoneStatus, ZoneStatus.name)
+        self.positions = self._codes(s, Position, Position.name)
+
+        types = {t.id: t for t in self.zone_types}
+        statuses = {st.id: st for st in self.zone_statuses}
+        self.zones = [
+            ZoneOption(z.id, z.zone_name, z.capacity, Decimal(z.base_price), types[z.type_id], statuses[z.status_id])
+            for z in s.execute(select(Zone).order_by(Zone.zone_name)).scalars()
+        ]
+        self.services = [
+            ServiceOption(it.id, it.name, Decimal(it.base_price), it.description)
+            for it in s.execute(select(Service).order_by(Service.name)).scalars()
+        ]
+        self.employees = [
+            EmployeeOption(e.id, e.full_name, e.position_id)
+            for e in s.execute(select(Employee).order_by(Employee.full_name)).scalars()
+        ]
+
+        self.booking_status_id = {st.code: st.id for st in self.booking_statuses}
+        self.client_status_id = {st.code: st.id for st in self.client_statuses}
+        self.subscription_status_id = {st.code: st.id for st in self.subscription_statuses}
+        self.booking_status_by_id = {st.id: st for st in self.booking_statuses}
+        self.zone_by_id = {z.id: z for z in self.zones}
+        self.service_by_id = {it.id: it for it in self.services}
+
+    @staticmethod
+    def _codes(s: Session, model, order) -> list[CodeOption]:
+        return [CodeOption(*row) for row in s.execute(select(model.id, model.code, model.name).order_by(order))]
+
+    def zone_type_options(self) -> list[dict]:
+        return [{"value": t.id, "label": f"{t.name} ({t.code})"} for t in self.zone_types]
+
+    def zone_status_options(self) -> list[dict]:
+        return [{"value": st.id, "label": f"{st.name} ({st.code})"} for st in self.zone_statuses]
+
+
+def _read_version(s: Session) -> int:
+    return s.execute(select(CacheVersion.version).where(CacheVersion.name == LOOKUPS)).scalar_one_or_none() or 0
+
+
+class LookupCache:
+    def __init__(self) -> None:
+        self._snapshot: Optional[LookupSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, s: Session) -> LookupSnapshot:
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return snapshot
+        version = _read_version(s)
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = LookupSnapshot(s, version)
+            self._checked_at = now
+            return self._snapshot
+
+    def invalidate(self, s: Session) -> None:
+        """Увеличить версию в текущей транзакции и сбросить локальный снимок."""
+        s.execute(update(CacheVersion).where(CacheVersion.name == LOOKUPS).values(version=CacheVersion.version + 1))
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = 0.0
+
+
+lookups = LookupCache()
@@ -0,0 +1,220 @@
+"""Версионированные миграции схемы БД.
+
+Каждая миграция — функция от Connection с уникальным номером версии.
+Применённые версии хранятся в таблице schema_version, поэтому
+`flask migrate` выполняет только то, чего ещё нет в базе.
+"""
+from __future__ import annotations
+from typing import Callable
+
+from datetime import datetime
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from models import Base
+from client_search import create_client_fts
+from lookups import LOOKUPS
+from stats import create_stats_triggers, rebuild_stats
+from rollups import refresh_rollups
+from contacts import normalize_phone, normalize_email
+from data_versions import create_data_version_triggers, create_occupancy_triggers
+
+
+version_meta = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    version_meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    def decorator(fn: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> None:
+    cols = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in cols:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def create_missing_indexes(conn: Connection) -> None:
+    """Создать индексы, объявленные в models.py, которых ещё нет в базе.
+
+    Индексы по колонкам, которые добавит более поздняя миграция, пропускаются —
+    та миграция вызывает эту функцию повторно.
+    """
+    insp = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        cols = {c["name"] for c in insp.get_columns(table.name)}
+        for index in table.indexes:
+            if all(c.name in cols for c in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+def applied_versions(conn: Connection) -> set[int]:
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def run_migrations(engine: Engine) -> list[tuple[int, str]]:
+    """Применить все ещё не применённые миграции, вернуть список (версия, описание)."""
+    done: list[tuple[int, str]] = []
+    version_meta.create_all(engine)
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        # каждая миграция — в своей транзакции вместе с отметкой о применении
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(
+                schema_version.insert().values(version=version, description=description, applied_at=datetime.utcnow())
+            )
+        done.append((version, description))
+    return done
+
+
+# ---- migrations ----
+@migration(1, "initial schema")
+def m0001_initial(conn: Connection) -> None:
+    Base.metadata.create_all(conn)
+
+
+@migration(2, "client.status_id, booking.schedule_slot_id, booking.subscription_id")
+def m0002_legacy_columns(conn: Connection) -> None:
+    # старые базы создавались до появления этих колонок
+    add_column_if_missing(conn, "client", "status_id", "status_id INTEGER")
+    add_column_if_missing(conn, "booking", "schedule_slot_id", "schedule_slot_id INTEGER")
+    add_column_if_missing(conn, "booking", "subscription_id", "subscription_id INTEGER")
+
+
+@migration(3, "indexes for foreign keys and hot filter columns")
+def m0003_indexes(conn: Connection) -> None:
+    create_missing_indexes(conn)
+
+
+@migration(4, "schedule_slot.booked_count")
+def m0004_slot_booked_count(conn: Connection) -> None:
+    add_column_if_missing(conn, "schedule_slot", "booked_count", "booked_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute(text("""
+        UPDATE schedule_slot SET booked_count = COALESCE((
+            SELECT SUM(b.participants_count)
+            FROM booking b JOIN booking_status bs ON bs.id = b.status_id
+            WHERE b.schedule_slot_id = schedule_slot.id AND bs.code != 'cancelled'
+        ), 0)
+    """))
+
+
+@migration(5, "booking.paid_sum, booking.due_sum")
+def m0005_booking_payment_totals(conn: Connection) -> None:
+    add_column_if_missing(conn, "booking", "paid_sum", "paid_sum NUMERIC(10, 2) NOT NULL DEFAULT 0")
+    add_column_if_missing(conn, "booking", "due_sum", "due_sum NUMERIC(10, 2) NOT NULL DEFAULT 0")
+    # SQL по схеме этой версии: update(Booking) из ledger.py добавил бы колонки более поздних миграций
+    conn.execute(text("""
+        UPDATE booking SET
+            paid_sum = COALESCE((SELECT SUM(p.amount) FROM payment p WHERE p.booking_id = booking.id), 0),
+            due_sum = COALESCE(total_sum, 0) - COALESCE((SELECT SUM(p.amount) FROM payment p WHERE p.booking_id = booking.id), 0)
+    """))
+
+
+@migration(6, "booking(datetime_from, id) index for the bookings list")
+def m0006_booking_list_index(conn: Connection) -> None:
+    create_missing_indexes(conn)
+
+
+@migration(7, "client_fts full-text index with sync triggers")
+def m0007_client_fts(conn: Connection) -> None:
+    create_client_fts(conn)
+
+
+@migration(8, "cache_version table for the lookup cache")
+def m0008_cache_version(conn: Connection) -> None:
+    table = Base.metadata.tables["cache_version"]
+    table.create(conn, checkfirst=True)
+    conn.execute(table.insert().values(name=LOOKUPS, version=0))
+
+
+@migration(9, "schedule_slot(is_active, datetime_from) index for the client schedule")
+def m0009_schedule_active_index(conn: Connection) -> None:
+    create_missing_indexes(conn)
+
+
+@migration(10, "schedule_series and schedule_slot.series_id")
+def m0010_schedule_series(conn: Connection) -> None:
+    Base.metadata.tables["schedule_series"].create(conn, checkfirst=True)
+    add_column_if_missing(conn, "schedule_slot", "series_id", "series_id INTEGER REFERENCES schedule_series(id)")
+    create_missing_indexes(conn)
+
+
+@migration(11, "stats_counter table maintained by triggers")
+def m0011_stats_counter(conn: Connection) -> None:
+    Base.metadata.tables["stats_counter"].create(conn, checkfirst=True)
+    create_stats_triggers(conn)
+    rebuild_stats(conn)
+
+
+@migration(12, "daily rollup tables for reports")
+def m0012_rollups(conn: Connection) -> None:
+    for name in ("rollup_zone_day", "rollup_payment_day", "rollup_state"):
+        Base.metadata.tables[name].create(conn, checkfirst=True)
+    create_missing_indexes(conn)
+    # свёртки заполняет миграция 16, когда в booking уже есть updated_at
+
+
+@migration(13, "client.phone_norm, client.email_norm for duplicate checks")
+def m0013_client_contact_keys(conn: Connection) -> None:
+    add_column_if_missing(conn, "client", "phone_norm", "phone_norm VARCHAR")
+    add_column_if_missing(conn, "client", "email_norm", "email_norm VARCHAR")
+    rows = [
+        {"cid": cid, "phone_norm": normalize_phone(phone), "email_norm": normalize_email(email)}
+        for cid, phone, email in conn.execute(text("SELECT id, phone, email FROM client"))
+    ]
+    if rows:
+        conn.execute(
+            text("UPDATE client SET phone_norm = :phone_norm, email_norm = :email_norm WHERE id = :cid"),
+            rows,
+        )
+    create_missing_indexes(conn)
+
+
+@migration(14, "per-table data versions in cache_version for conditional GET")
+def m0014_data_versions(conn: Connection) -> None:
+    create_data_version_triggers(conn)
+
+
+@migration(15, "occupancy_event table for cross-process live updates")
+def m0015_occupancy_event(conn: Connection) -> None:
+    Base.metadata.tables["occupancy_event"].create(conn, checkfirst=True)
+
+
+@migration(16, "booking.updated_at for incremental rollup refresh")
+def m0016_booking_updated_at(conn: Connection) -> None:
+    add_column_if_missing(conn, "booking", "updated_at", "updated_at TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00'")
+    conn.execute(text("UPDATE booking SET updated_at = created_at"))
+    create_missing_indexes(conn)
+    # отметка теперь по updated_at — пересобрать свёртки с нуля
+    refresh_rollups(conn, full=True)
+
+
+@migration(17, "PostgreSQL: append-only delta tables for stats and data-version triggers")
+def m0017_counter_deltas(conn: Connection) -> None:
+    # в SQLite триггеры не меняются (IF NOT EXISTS), в PostgreSQL заменяются на журналы
+    create_stats_triggers(conn)
+    create_data_version_triggers(conn)
+
+
+@migration(18, "occupancy version for the in-memory availability index")
+def m0018_occupancy_version(conn: Connection) -> None:
+    create_occupancy_triggers(conn)
@@ -1,12 +1,14 @@
 from __future__ import annotations
 from typing import Optional
 
-from datetime import datetime, date
+from datetime import datetime, date, time
 from decimal import Decimal
 
 from flask_login import UserMixin
-from sqlalchemy import String, Integer, Date, DateTime, Text, Numeric, ForeignKey, Boolean
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import String, Integer, Date, DateTime, Time, Text, Numeric, ForeignKey, Boolean, Index
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, validates
+
+from contacts import normalize_phone, normalize_email
 
 
 class Base(DeclarativeBase):
@@ -59,7 +61,10 @@ class Client(Base):
     phone: Mapped[Optional[str]] = mapped_column(String)
     email: Mapped[Optional[str]] = mapped_column(String)
     note: Mapped[Optional[str]] = mapped_column(Text)
-    status_id: Mapped[Optional[int]] = mapped_column(ForeignKey("client_status.id"))
+    status_id: Mapped[Optional[int]] = mapped_column(ForeignKey("client_status.id"), index=True)
+    # ключи поиска дублей (см. contacts.py), заполняются валидаторами ниже
+    phone_norm: Mapped[Optional[str]] = mapped_column(String, index=True)
+    email_norm: Mapped[Optional[str]] = mapped_column(String, index=True)
 
     bookings: Mapped[list["Booking"]] = relationship(back_populates="client")
     accounts: Mapped[list["Account"]] = relationship(back_populates="client")
@@ -67,12 +72,22 @@ class Client(Base):
     subscriptions: Mapped[list["Subscription"]] = relationship(back_populates="client")
     notifications: Mapped[list["Notification"]] = relationship(back_populates="client")
 
+    @validates("phone")
+    def _set_phone_norm(self, key: str, value: Optional[str]) -> Optional[str]:
+        self.phone_norm = normalize_phone(value)
+        return value
+
+    @validates("email")
+    def _set_email_norm(self, key: str, value: Optional[str]) -> Optional[str]:
+        self.email_norm = normalize_email(value)
+        return value
+
 
 class Employee(Base):
     __tablename__ = "employee"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     full_name: Mapped[str] = mapped_column(String, nullable=False)
-    position_id: Mapped[int] = mapped_column(ForeignKey("position.id"), nullable=False)
+    position_id: Mapped[int] = mapped_column(ForeignKey("position.id"), nullable=False, index=True)
     phone: Mapped[Optional[str]] = mapped_column(String)
     email: Mapped[Optional[str]] = mapped_column(String)
     note: Mapped[Optional[str]] = mapped_column(Text)
@@ -99,8 +114,8 @@ class Account(Base, UserMixin):
     password_hash: Mapped[str] = mapped_column(String, nullable=False)
     role: Mapped[str] = mapped_column(String, nullable=False, default="admin")
 
-    client_id: Mapped[Optional[int]] = mapped_column(ForeignKey("client.id"))
-    employee_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True)
+    client_id: Mapped[Optional[int]] = mapped_column(ForeignKey("client.id"), index=True)
+    employee_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True, index=True)
     email_recovery: Mapped[Optional[str]] = mapped_column(String)
 
     client: Mapped[Optional["Client"]] = relationship(back_populates="accounts")
@@ -111,10 +126,10 @@ class Zone(Base):
     __tablename__ = "zone"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     zone_name: Mapped[str] = mapped_column(String, unique=True, nullable=False)
-    type_id: Mapped[int] = mapped_column(ForeignKey("zone_type.id"), nullable=False)
+    type_id: Mapped[int] = mapped_column(ForeignKey("zone_type.id"), nullable=False, index=True)
     capacity: Mapped[int] = mapped_column(Integer, nullable=False)
     base_price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
-    status_id: Mapped[int] = mapped_column(ForeignKey("zone_status.id"), nullable=False)
+    status_id: Mapped[int] = mapped_column(ForeignKey("zone_status.id"), nullable=False, index=True)
     description: Mapped[Optional[str]] = mapped_column(Text)
 
     type: Mapped["ZoneType"] = relationship(back_populates="zones")
@@ -134,11 +149,21 @@ class Service(Base):
 
 class Booking(Base):
     __tablename__ = "booking"
+    __table_args__ = (
+        # пересечения по зоне: zone_id = ? AND datetime_from < ? AND datetime_to > ?
+        Index("ix_booking_zone_period", "zone_id", "datetime_from", "datetime_to"),
+        Index("ix_booking_client_datetime_from", "client_id", "datetime_from"),
+        # keyset-пагинация списка броней по (datetime_from, id)
+        Index("ix_booking_datetime_from_id", "datetime_from", "id"),
+        Index("ix_booking_created_at", "created_at"),
+        # инкрементальное обновление свёрток: updated_at > отметка
+        Index("ix_booking_updated_at", "updated_at"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), nullable=False)
     zone_id: Mapped[int] = mapped_column(ForeignKey("zone.id"), nullable=False)
-    schedule_slot_id: Mapped[Optional[int]] = mapped_column(ForeignKey("schedule_slot.id"))
-    subscription_id: Mapped[Optional[int]] = mapped_column(ForeignKey("subscription.id"))
+    schedule_slot_id: Mapped[Optional[int]] = mapped_column(ForeignKey("schedule_slot.id"), index=True)
+    subscription_id: Mapped[Optional[int]] = mapped_column(ForeignKey("subscription.id"), index=True)
 
     datetime_from: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     datetime_to: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -147,9 +172,14 @@ class Booking(Base):
 
     session_sum: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 2))
     total_sum: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 2))
+    # денормализовано из payment, см. ledger.py
+    paid_sum: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False, default=Decimal("0.00"), server_default="0")
+    due_sum: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False, default=Decimal("0.00"), server_default="0")
 
-    status_id: Mapped[int] = mapped_column(ForeignKey("booking_status.id"), nullable=False)
+    status_id: Mapped[int] = mapped_column(ForeignKey("booking_status.id"), nullable=False, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    # любое изменение через ORM или update(Booking) — смена статуса, услуги, оплата
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     client: Mapped["Client"] = relationship(back_populates="bookings")
     zone: Mapped["Zone"] = relationship(back_populates="bookings")
@@ -165,7 +195,7 @@ class Booking(Base):
 class BookingService(Base):
     __tablename__ = "booking_service"
     booking_id: Mapped[int] = mapped_column(ForeignKey("booking.id"), primary_key=True)
-    service_id: Mapped[int] = mapped_column(ForeignKey("service.id"), primary_key=True)
+    service_id: Mapped[int] = mapped_column(ForeignKey("service.id"), primary_key=True, index=True)
 
     qty: Mapped[int] = mapped_column(Integer, nullable=False)
     unit_price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
@@ -179,11 +209,11 @@ class BookingService(Base):
 class Visit(Base):
     __tablename__ = "visit"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    booking_id: Mapped[int] = mapped_column(ForeignKey("booking.id"), nullable=False)
+    booking_id: Mapped[int] = mapped_column(ForeignKey("booking.id"), nullable=False, index=True)
     checkin_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     checkout_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
-    opened_by_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True)
-    closed_by_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True)
+    opened_by_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True, index=True)
+    closed_by_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True, index=True)
     actual_participants_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     booking: Mapped["Booking"] = relationship(back_populates="visit")
@@ -199,13 +229,17 @@ class Visit(Base):
     )
 class Payment(Base):
     __tablename__ = "payment"
+    __table_args__ = (
+        # свёртки по дням: paid_at > отметка и paid_at в пределах дня
+        Index("ix_payment_paid_at", "paid_at"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    booking_id: Mapped[int] = mapped_column(ForeignKey("booking.id"), nullable=False)
+    booking_id: Mapped[int] = mapped_column(ForeignKey("booking.id"), nullable=False, index=True)
     paid_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
     amount: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
     method: Mapped[str] = mapped_column(String, nullable=False)
     comment: Mapped[Optional[str]] = mapped_column(Text)
-    created_by_employee_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True)
+    created_by_employee_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"), nullable=True, index=True)
 
     booking: Mapped["Booking"] = relationship(back_populates="payments")
 
@@ -221,19 +255,53 @@ class ClientStatus(Base):
 
 class ScheduleSlot(Base):
     __tablename__ = "schedule_slot"
+    __table_args__ = (
+        Index("ix_schedule_slot_employee_datetime_from", "employee_id", "datetime_from"),
+        Index("ix_schedule_slot_zone_datetime_from", "zone_id", "datetime_from"),
+        Index("ix_schedule_slot_active_datetime_from", "is_active", "datetime_from"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     zone_id: Mapped[int] = mapped_column(ForeignKey("zone.id"), nullable=False)
     employee_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employee.id"))
     datetime_from: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     datetime_to: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     capacity: Mapped[int] = mapped_column(Integer, nullable=False)
+    # занято мест (без отменённых броней); меняется только условным UPDATE — см. reserve_slot_seats
+    booked_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
     lesson_type: Mapped[str] = mapped_column(String, nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    # серия, из которой слот сгенерирован (None — слот создан вручную)
+    series_id: Mapped[Optional[int]] = mapped_column(ForeignKey("schedule_series.id"), index=True)
 
     zone: Mapped["Zone"] = relationship()
     employee: Mapped[Optional["Employee"]] = relationship()
     bookings: Mapped[list["Booking"]] = relationship(back_populates="schedule_slot")
+    series: Mapped[Optional["ScheduleSeries"]] = relationship(back_populates="slots")
+
+
+class ScheduleSeries(Base):
+    """Правило повторения смен тренера: дни недели, время, период дат и исключения."""
+    __tablename__ = "schedule_series"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    employee_id: Mapped[int] = mapped_column(ForeignKey("employee.id"), nullable=False, index=True)
+    zone_id: Mapped[int] = mapped_column(ForeignKey("zone.id"), nullable=False, index=True)
+    # дни недели цифрами, понедельник = 0: "024" — пн, ср, пт
+    weekdays: Mapped[str] = mapped_column(String, nullable=False)
+    time_from: Mapped[time] = mapped_column(Time, nullable=False)
+    time_to: Mapped[time] = mapped_column(Time, nullable=False)
+    date_from: Mapped[date] = mapped_column(Date, nullable=False)
+    date_to: Mapped[date] = mapped_column(Date, nullable=False)
+    # пропускаемые даты в ISO-формате через запятую
+    exclusions: Mapped[Optional[str]] = mapped_column(Text)
+    capacity: Mapped[int] = mapped_column(Integer, nullable=False)
+    price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    lesson_type: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    zone: Mapped["Zone"] = relationship()
+    employee: Mapped["Employee"] = relationship()
+    slots: Mapped[list["ScheduleSlot"]] = relationship(back_populates="series")
 
 
 class SubscriptionStatus(Base):
@@ -248,13 +316,13 @@ class SubscriptionStatus(Base):
 class Subscription(Base):
     __tablename__ = "subscription"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), nullable=False)
-    service_id: Mapped[Optional[int]] = mapped_column(ForeignKey("service.id"))
+    client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), nullable=False, index=True)
+    service_id: Mapped[Optional[int]] = mapped_column(ForeignKey("service.id"), index=True)
     start_date: Mapped[date] = mapped_column(Date, nullable=False)
     end_date: Mapped[date] = mapped_column(Date, nullable=False)
     total_visits: Mapped[int] = mapped_column(Integer, nullable=False)
     remaining_visits: Mapped[int] = mapped_column(Integer, nullable=False)
-    status_id: Mapped[int] = mapped_column(ForeignKey("subscription_status.id"), nullable=False)
+    status_id: Mapped[int] = mapped_column(ForeignKey("subscription_status.id"), nullable=False, index=True)
 
     client: Mapped["Client"] = relationship(back_populates="subscriptions")
     service: Mapped[Optional["Service"]] = relationship()
@@ -264,6 +332,9 @@ class Subscription(Base):
 
 class Notification(Base):
     __tablename__ = "notification"
+    __table_args__ = (
+        Index("ix_notification_client_created_at", "client_id", "created_at"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), nullable=False)
     message: Mapped[str] = mapped_column(String, nullable=False)
@@ -271,3 +342,57 @@ class Notification(Base):
     is_read: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
 
     client: Mapped["Client"] = relationship(back_populates="notifications")
+
+
+class CacheVersion(Base):
+    """Счётчик версии кэша в памяти процессов: кто изменил данные — увеличивает version."""
+    __tablename__ = "cache_version"
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class StatsCounter(Base):
+    """Счётчик для дашборда; значения меняют триггеры — см. stats.py."""
+    __tablename__ = "stats_counter"
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+
+
+class RollupZoneDay(Base):
+    """Дневная свёртка броней по зоне; заполняет rollups.refresh_rollups."""
+    __tablename__ = "rollup_zone_day"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    zone_id: Mapped[int] = mapped_column(ForeignKey("zone.id"), primary_key=True)
+    bookings: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    participants: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    session_revenue: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    service_revenue: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    cancellations: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    no_shows: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class RollupPaymentDay(Base):
+    """Дневная свёртка оплат по зоне и способу оплаты."""
+    __tablename__ = "rollup_payment_day"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    zone_id: Mapped[int] = mapped_column(ForeignKey("zone.id"), primary_key=True)
+    method: Mapped[str] = mapped_column(String, primary_key=True)
+    payments: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    amount: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+
+
+class RollupState(Base):
+    """Отметки (high-water mark) инкрементального обновления свёрток."""
+    __tablename__ = "rollup_state"
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    high_water: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    refreshed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+class OccupancyEvent(Base):
+    """Событие загрузки слота для доставки между процессами (EVENTS_BACKEND=db, см. events.py)."""
+    __tablename__ = "occupancy_event"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    zone_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
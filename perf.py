@@ -0,0 +1,246 @@
+"""Профилирование запросов: время обработчиков и SQL по эндпоинтам.
+
+Включается переменной окружения PERF_PROFILING=1 (по умолчанию выключено):
+install(app, engine) вешает таймер на before/after_request и счётчики на
+before/after_cursor_execute движка SQLAlchemy. На каждый запрос считаются
+время ответа, число SQL-запросов, время в базе и строки; итоги копятся по
+эндпоинтам Flask:
+
+- гистограмма времени ответа с фиксированными корзинами (для /metrics);
+- последние PERF_SAMPLES замеров — по ним страница /admin/perf считает p50/p95/p99.
+
+SQL дольше PERF_SLOW_QUERY_MS пишется в лог «perf.slow_query» вместе с
+эндпоинтом и хранится в памяти (последние SLOW_QUERY_KEEP) для страницы.
+
+Для потоковых ответов (выгрузки, SSE) учитывается время до начала отдачи тела.
+Данные живут в памяти процесса и сбрасываются при перезапуске.
+"""
+from __future__ import annotations
+from typing import Optional
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+PERF_ENABLED = os.environ.get("PERF_PROFILING", "0") == "1"
+SLOW_QUERY_MS = float(os.environ.get("PERF_SLOW_QUERY_MS", "100"))
+# если задан — /metrics отдаётся по заголовку Authorization: Bearer <токен> без входа
+METRICS_TOKEN = os.environ.get("PERF_METRICS_TOKEN", "")
+PERF_SAMPLES = 1000
+SLOW_QUERY_KEEP = 100
+SLOW_STATEMENT_CHARS = 2000
+# верхние границы корзин гистограммы времени ответа, мс
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+log = logging.getLogger("perf.slow_query")
+
+
+class RequestStats:
+    """Замер одного HTTP-запроса (лежит в flask.g.perf)."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.rows = 0
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(DURATION_BUCKETS_MS) + 1)
+        self.samples: deque[float] = deque(maxlen=PERF_SAMPLES)
+
+    def add(self, duration_ms: float, rs: RequestStats, status: int) -> None:
+        self.count += 1
+        self.errors += status >= 500
+        self.total_ms += duration_ms
+        self.queries += rs.queries
+        self.max_queries = max(self.max_queries, rs.queries)
+        self.db_ms += rs.db_ms
+        self.rows += rs.rows
+        self.buckets[_bucket_index(duration_ms)] += 1
+        self.samples.append(duration_ms)
+
+    def percentile(self, q: float) -> float:
+        data = sorted(self.samples)
+        if not data:
+            return 0.0
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+
+class SlowQuery:
+    def __init__(self, at: datetime, endpoint: str, duration_ms: float, statement: str) -> None:
+        self.at = at
+        self.endpoint = endpoint
+        self.duration_ms = duration_ms
+        self.statement = statement
+
+
+def _bucket_index(duration_ms: float) -> int:
+    for i, bound in enumerate(DURATION_BUCKETS_MS):
+        if duration_ms <= bound:
+            return i
+    return len(DURATION_BUCKETS_MS)
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+        self._endpoints: dict[str, EndpointStats] = {}
+        self.slow_queries: deque[SlowQuery] = deque(maxlen=SLOW_QUERY_KEEP)
+
+    # ---- приём замеров ----
+    def record_request(self, endpoint: str, duration_ms: float, rs: RequestStats, status: int) -> None:
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.add(duration_ms, rs, status)
+
+    def record_slow_query(self, endpoint: str, duration_ms: float, statement: str) -> None:
+        statement = " ".join(statement.split())[:SLOW_STATEMENT_CHARS]
+        self.slow_queries.append(SlowQuery(datetime.now(), endpoint, duration_ms, statement))
+        log.warning("%.1f мс [%s] %s", duration_ms, endpoint, statement)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self.slow_queries.clear()
+            self.started_at = datetime.now()
+
+    # ---- чтение ----
+    def snapshot(self) -> list[dict]:
+        """Сводка по эндпоинтам, самые дорогие по суммарному времени — первыми."""
+        with self._lock:
+            items = list(self._endpoints.items())
+            rows = []
+            for name, st in items:
+                rows.append({
+                    "endpoint": name,
+                    "count": st.count,
+                    "errors": st.errors,
+                    "total_ms": st.total_ms,
+                    "avg_ms": st.total_ms / st.count,
+                    "p50": st.percentile(0.50),
+                    "p95": st.percentile(0.95),
+                    "p99": st.percentile(0.99),
+                    "avg_queries": st.queries / st.count,
+                    "max_queries": st.max_queries,
+                    "avg_db_ms": st.db_ms / st.count,
+                    "avg_rows": st.rows / st.count,
+                })
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows
+
+    def prometheus_text(self) -> str:
+        """Метрики в текстовом формате Prometheus (exposition format 0.0.4)."""
+        lines = [
+            "# HELP app_request_duration_seconds Время обработки запроса по эндпоинтам.",
+            "# TYPE app_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted(self._endpoints.items())
+            for name, st in items:
+                label = _label(name)
+                cumulative = 0
+                for bound, n in zip(DURATION_BUCKETS_MS, st.buckets):
+                    cumulative += n
+                    lines.append(f'app_request_duration_seconds_bucket{{endpoint="{label}",le="{bound / 1000:g}"}} {cumulative}')
+                lines.append(f'app_request_duration_seconds_bucket{{endpoint="{label}",le="+Inf"}} {st.count}')
+                lines.append(f'app_request_duration_seconds_sum{{endpoint="{label}"}} {st.total_ms / 1000:.6f}')
+                lines.append(f'app_request_duration_seconds_count{{endpoint="{label}"}} {st.count}')
+            counters = (
+                ("app_request_errors_total", "Ответы 5xx.", lambda st: st.errors),
+                ("app_db_queries_total", "SQL-запросы, выполненные обработчиками.", lambda st: st.queries),
+                ("app_db_seconds_total", "Время в базе данных.", lambda st: f"{st.db_ms / 1000:.6f}"),
+                ("app_db_rows_total", "Строки: прочитанные ORM и изменённые INSERT/UPDATE/DELETE.", lambda st: st.rows),
+            )
+            for metric, help_text, value in counters:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for name, st in items:
+                    lines.append(f'{metric}{{endpoint="{_label(name)}"}} {value(st)}')
+        lines.append("# HELP app_slow_queries_recent Медленные запросы в памяти процесса.")
+        lines.append("# TYPE app_slow_queries_recent gauge")
+        lines.append(f"app_slow_queries_recent {len(self.slow_queries)}")
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+profiler = Profiler()
+
+
+def _current() -> Optional[RequestStats]:
+    if not has_request_context():
+        return None
+    return g.get("perf")
+
+
+def install(app: Flask, engine: Engine) -> None:
+    """Подключить профилирование к приложению и движку (один раз при старте)."""
+    profiler.enabled = True
+
+    @app.before_request
+    def perf_start() -> None:
+        g.perf = RequestStats()
+
+    @app.after_request
+    def perf_finish(response):
+        rs = g.pop("perf", None)
+        if rs is None:
+            return response
+        duration_ms = (time.perf_counter() - rs.started) * 1000
+        endpoint = request.endpoint or "<нет маршрута>"
+        profiler.record_request(endpoint, duration_ms, rs, response.status_code)
+        response.headers["Server-Timing"] = f"db;dur={rs.db_ms:.1f}, app;dur={duration_ms:.1f}"
+        return response
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def perf_query_start(conn, cursor, statement, parameters, context, executemany) -> None:
+        # начало — в контексте выполнения, а не в стеке на соединении: упавший запрос
+        # не доходит до after_cursor_execute, и стек сдвинул бы замеры следующих
+        if context is not None:
+            context._perf_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def perf_query_finish(conn, cursor, statement, parameters, context, executemany) -> None:
+        started = getattr(context, "_perf_started", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        rs = _current()
+        if rs is not None:
+            rs.queries += 1
+            rs.db_ms += duration_ms
+            # у SELECT в sqlite3 rowcount = -1; прочитанные строки считает обработчик load ниже
+            if cursor.rowcount > 0:
+                rs.rows += cursor.rowcount
+        if duration_ms >= SLOW_QUERY_MS:
+            endpoint = (request.endpoint or "-") if has_request_context() else "<вне запроса>"
+            profiler.record_slow_query(endpoint, duration_ms, statement)
+
+    @event.listens_for(Mapper, "load")
+    def perf_row_loaded(target, context) -> None:
+        rs = _current()
+        if rs is not None:
+            rs.rows += 1
@@ -0,0 +1,69 @@
+"""Лёгкий объект текущего пользователя для Flask-Login.
+
+load_user вызывается на каждый запрос с сессией. Вместо ORM-объекта Account
+возвращается Principal — только то, что нужно обработчикам и шаблонам (id,
+логин, роль, client_id, employee_id). Он хранится в памяти процесса до
+PRINCIPAL_TTL секунд, так что обычный просмотр страниц не читает таблицу account.
+
+Смена пароля или роли вызывает principals.forget(account_id); другие процессы
+увидят изменение не позже чем через PRINCIPAL_TTL.
+"""
+from __future__ import annotations
+from typing import Callable, Optional
+
+import threading
+import time
+
+from flask_login import UserMixin
+from sqlalchemy.orm import Session
+
+from models import Account
+
+PRINCIPAL_TTL = 60.0
+
+
+class Principal(UserMixin):
+    def __init__(self, id: int, login: str, role: str, client_id: Optional[int], employee_id: Optional[int]) -> None:
+        self.id = id
+        self.login = login
+        self.role = role
+        self.client_id = client_id
+        self.employee_id = employee_id
+
+    @classmethod
+    def from_account(cls, acc: Account) -> "Principal":
+        return cls(acc.id, acc.login, acc.role, acc.client_id, acc.employee_id)
+
+
+class PrincipalCache:
+    """Principal по id учётки с истечением через PRINCIPAL_TTL."""
+
+    def __init__(self, ttl: float = PRINCIPAL_TTL) -> None:
+        self.ttl = ttl
+        self._items: dict[int, tuple[float, Principal]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, account_id: int, session_factory: Callable[[], Session]) -> Optional[Principal]:
+        now = time.monotonic()
+        item = self._items.get(account_id)
+        if item is not None and item[0] > now:
+            return item[1]
+        with session_factory() as s:
+            acc = s.get(Account, account_id)
+            if acc is None:
+                self.forget(account_id)
+                return None
+            return self.put(acc)
+
+    def put(self, acc: Account) -> Principal:
+        principal = Principal.from_account(acc)
+        with self._lock:
+            self._items[acc.id] = (time.monotonic() + self.ttl, principal)
+        return principal
+
+    def forget(self, account_id: int) -> None:
+        with self._lock:
+            self._items.pop(account_id, None)
+
+
+principals = PrincipalCache()
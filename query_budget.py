@@ -0,0 +1,192 @@
+"""Бюджеты SQL-запросов по страницам и поиск N+1.
+
+QueryRecorder — контекстный менеджер, который пишет все SQL-запросы движка,
+выполненные внутри блока. Повтор одного и того же запроса с разными
+параметрами (после нормализации текста) N_PLUS_ONE_REPEATS и более раз —
+признак N+1: кто-то убрал joinedload/selectinload, и шаблон дочитывает
+b.client, b.zone, b.status по одной строке.
+
+QUERY_BUDGETS задаёт для страниц предельное число запросов. Команда
+`flask check-queries` обходит страницы тестовым клиентом под нужной ролью и
+падает, если бюджет превышен или найден N+1. Бюджет не зависит от числа
+строк, поэтому проверять стоит на базе, где в списках больше пары записей:
+`--seed-rows N --yes-really` добавит демо-клиенту N броней с услугой, оплатой
+и посещением; они остаются в базе, поэтому без --yes-really команда не пишет.
+"""
+from __future__ import annotations
+from typing import Callable, NamedTuple, Optional
+
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.testing import FlaskClient
+from sqlalchemy import event, select, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from booking_flow import book_slot, pay_booking_due
+from lookups import lookups
+from models import Account, Booking, ScheduleSlot, Visit, Zone
+
+N_PLUS_ONE_REPEATS = 3
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+# именованные параметры драйверов PostgreSQL: %(id_1_1)s, %(id_1_2)s, ...
+_PYFORMAT_PARAM = re.compile(r"%\(\w+\)s")
+_PARAM_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Текст запроса без значений: литералы и списки IN (?, ?, ...) сводятся к «?»."""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _PYFORMAT_PARAM.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM_LIST.sub("?", sql)
+    return " ".join(sql.split())
+
+
+class QueryRecorder:
+    """Записывает SQL движка внутри блока `with QueryRecorder(engine) as rec:`."""
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        self.statements: list[str] = []
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+    def __enter__(self) -> "QueryRecorder":
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._before)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = N_PLUS_ONE_REPEATS) -> list[tuple[str, int]]:
+        """Запросы, повторённые threshold и более раз, — кандидаты в N+1."""
+        counts = Counter(normalize_statement(sql) for sql in self.statements)
+        return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+
+class Budget(NamedTuple):
+    role: str
+    path: str  # {booking_id}, {client_booking_id}, {slot_id} подставляются из базы
+    max_queries: int
+
+
+# страница -> не больше стольких SQL-запросов при прогретых кэшах (lookups, principals);
+# запас — один запрос к замеренному, рост на каждую строку списка сюда не влезет
+QUERY_BUDGETS = (
+    Budget("admin", "/", 3),
+    Budget("admin", "/bookings", 3),
+    Budget("admin", "/bookings/{booking_id}", 5),
+    Budget("admin", "/clients", 3),
+    Budget("admin", "/zones", 3),
+    Budget("admin", "/services", 3),
+    Budget("admin", "/reports", 5),
+    Budget("client", "/client", 5),
+    Budget("client", "/client/schedule", 3),
+    Budget("client", "/client/bookings", 2),
+    Budget("client", "/client/bookings/{client_booking_id}", 4),
+    Budget("client", "/client/profile", 3),
+    Budget("client", "/client/subscriptions", 2),
+    Budget("client", "/client/notifications", 2),
+    Budget("coach", "/coach", 5),
+    Budget("coach", "/coach/schedule/{slot_id}", 4),
+    Budget("coach", "/coach/series", 4),
+)
+
+
+class BudgetResult(NamedTuple):
+    budget: Budget
+    path: str
+    status: int
+    queries: int
+    repeated: list[tuple[str, int]]
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200 and self.queries <= self.budget.max_queries and not self.repeated
+
+
+def seed_query_fixture(s: Session, rows: int) -> int:
+    """Записать демо-клиента на rows новых слотов (с услугой), оплатить брони и отметить вход."""
+    account = s.execute(select(Account).where(Account.role == "client", Account.client_id.is_not(None))).scalars().first()
+    coach = s.execute(select(Account).where(Account.role == "coach")).scalars().first()
+    zone = s.execute(select(Zone).order_by(Zone.id)).scalars().first()
+    if account is None or zone is None:
+        return 0
+    lk = lookups.get(s)
+    services = {service_id: 1 for service_id in list(lk.service_by_id)[:1]}
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    for i in range(rows):
+        dt_from = start + timedelta(hours=i)
+        slot = ScheduleSlot(
+            zone_id=zone.id,
+            employee_id=coach.employee_id if coach else None,
+            datetime_from=dt_from,
+            datetime_to=dt_from + timedelta(hours=1),
+            capacity=zone.capacity,
+            price=zone.base_price,
+            lesson_type="group",
+        )
+        s.add(slot)
+        s.commit()
+        booking = book_slot(s, slot, account.client_id, 1, lk, service_qty=services)
+        pay_booking_due(s, booking, "cash", lk)
+        s.add(Visit(booking_id=booking.id, checkin_at=dt_from))
+        s.commit()
+    return rows
+
+
+def _path_params(s: Session) -> dict[str, Optional[int]]:
+    client_id = s.execute(select(Account.client_id).where(Account.role == "client", Account.client_id.is_not(None))).scalars().first()
+    employee_id = s.execute(select(Account.employee_id).where(Account.role == "coach")).scalars().first()
+    return {
+        "booking_id": s.execute(select(func.max(Booking.id))).scalar_one(),
+        "client_booking_id": s.execute(select(func.max(Booking.id)).where(Booking.client_id == client_id)).scalar_one(),
+        "slot_id": s.execute(select(func.max(ScheduleSlot.id)).where(ScheduleSlot.employee_id == employee_id)).scalar_one(),
+    }
+
+
+def test_client_as(app: Flask, account_id: int) -> FlaskClient:
+    """Тестовый клиент с уже выполненным входом под учёткой account_id (без пароля)."""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(account_id)
+        sess["_fresh"] = True
+    return client
+
+
+def check_query_budgets(app: Flask, engine: Engine, session_factory: Callable[[], Session]) -> list[BudgetResult]:
+    """Обойти страницы QUERY_BUDGETS и посчитать запросы; страницы без данных пропускаются."""
+    with session_factory() as s:
+        params = _path_params(s)
+        accounts = {
+            role: s.execute(select(Account.id).where(Account.role == role).order_by(Account.id)).scalars().first()
+            for role in {b.role for b in QUERY_BUDGETS}
+        }
+
+    results = []
+    for budget in QUERY_BUDGETS:
+        needed = re.findall(r"\{(\w+)\}", budget.path)
+        if accounts.get(budget.role) is None or any(params.get(name) is None for name in needed):
+            continue
+        path = budget.path.format(**params)
+        client = test_client_as(app, accounts[budget.role])
+        # первый заход прогревает кэши справочников и учётки, считаем второй;
+        # свой app context на запрос — иначе flask-login возьмёт пользователя из g
+        # прошлого запроса (под `flask ...` контекст приложения уже открыт)
+        with app.app_context():
+            client.get(path)
+        with app.app_context(), QueryRecorder(engine) as rec:
+            response = client.get(path)
+        results.append(BudgetResult(budget, path, response.status_code, rec.count, rec.repeated()))
+    return results
@@ -0,0 +1,105 @@
+"""Проверка планов горячих запросов через EXPLAIN QUERY PLAN (в PostgreSQL — EXPLAIN).
+
+Запросы повторяют фильтры обработчиков из app.py (занятость зоны — тот же
+запрос, что db_free_capacity); для каждого указан индекс, которым СУБД обязана
+воспользоваться. Запускается командой `flask check-indexes`.
+На почти пустой базе PostgreSQL предпочтёт Seq Scan — проверять на данных
+(`flask gen-data`) после ANALYZE.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.engine import Connection
+
+from availability import active_bookings
+from models import Booking, Payment, Notification, ScheduleSlot, Subscription
+
+
+def hot_queries() -> list[tuple[str, object, str]]:
+    """Список (название, запрос, ожидаемый индекс)."""
+    # окно там, куда записываются: на дату до всех броней PostgreSQL выберет другой индекс
+    dt_from = datetime.combine(date.today() + timedelta(days=1), time(10, 0))
+    dt_to = dt_from + timedelta(hours=1)
+    # места в слоте (reserve_slot_seats) занимает UPDATE по первичному ключу — его не проверяем
+    return [
+        (
+            "booking_create, client_booking_create: занятость зоны (db_free_capacity)",
+            active_bookings(1, dt_from, dt_to),
+            "ix_booking_zone_period",
+        ),
+        (
+            "coach_schedule_view: брони слота",
+            select(Booking).where(Booking.schedule_slot_id == 1).order_by(Booking.datetime_from.asc()),
+            "ix_booking_schedule_slot_id",
+        ),
+        (
+            "client_bookings: брони клиента",
+            select(Booking).where(Booking.client_id == 1).order_by(Booking.datetime_from.desc()),
+            "ix_booking_client_datetime_from",
+        ),
+        (
+            "bookings_list: следующая страница по дате",
+            select(Booking)
+            .where(tuple_(Booking.datetime_from, Booking.id) < tuple_(dt_from, 100))
+            .order_by(Booking.datetime_from.desc(), Booking.id.desc())
+            .limit(51),
+            "ix_booking_datetime_from_id",
+        ),
+        (
+            "booking_view: сумма оплат",
+            select(func.coalesce(func.sum(Payment.amount), 0)).where(Payment.booking_id == 1),
+            "ix_payment_booking_id",
+        ),
+        (
+            "client_dashboard: уведомления",
+            select(Notification)
+            .where(Notification.client_id == 1)
+            .order_by(Notification.created_at.desc())
+            .limit(5),
+            "ix_notification_client_created_at",
+        ),
+        (
+            "coach_dashboard: слоты тренера",
+            select(ScheduleSlot).where(ScheduleSlot.employee_id == 1).order_by(ScheduleSlot.datetime_from.asc()),
+            "ix_schedule_slot_employee_datetime_from",
+        ),
+        (
+            "client_schedule: активные слоты в окне дат",
+            select(ScheduleSlot)
+            .where(
+                ScheduleSlot.is_active.is_(True),
+                ScheduleSlot.datetime_from >= dt_from,
+                ScheduleSlot.datetime_from < dt_from + timedelta(days=14),
+            )
+            .order_by(ScheduleSlot.datetime_from.asc()),
+            "ix_schedule_slot_active_datetime_from",
+        ),
+        (
+            "client_subscriptions: абонементы клиента",
+            select(Subscription).where(Subscription.client_id == 1),
+            "ix_subscription_client_id",
+        ),
+    ]
+
+
+def explain(conn: Connection, stmt) -> list[str]:
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    prefix = "EXPLAIN QUERY PLAN" if conn.dialect.name == "sqlite" else "EXPLAIN"
+    # последний столбец — текст шага плана и у SQLite (detail), и у PostgreSQL (QUERY PLAN)
+    return [row[-1] for row in conn.exec_driver_sql(f"{prefix} {compiled}")]
+
+
+def check_hot_queries(conn: Connection) -> list[dict]:
+    """Выполнить EXPLAIN для каждого горячего запроса и сверить индекс."""
+    results = []
+    for name, stmt, index in hot_queries():
+        plan = explain(conn, stmt)
+        results.append({
+            "name": name,
+            "index": index,
+            "plan": plan,
+            "ok": any(index in line for line in plan),
+        })
+    return results
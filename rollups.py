@@ -0,0 +1,178 @@
+"""Дневные свёртки для отчётов: день × зона и оплаты день × зона × способ.
+
+Отчёты (/reports) читают только таблицы rollup_*, поэтому сырые booking и
+payment сканирует лишь обновление свёрток. Обновление инкрементальное:
+
+- по отметкам (high-water mark) на Booking.updated_at и Payment.paid_at
+  находятся новые и изменённые брони (отмена, услуги, оплата — в любой день)
+  и новые оплаты, а с ними дни, которых они касаются. Отметка берётся с
+  запасом MARK_LAG: строка, закоммиченная позже с более ранней меткой
+  времени, всё равно попадёт в следующее обновление;
+- дополнительно всегда пересчитываются последние REFRESH_WINDOW_DAYS дней —
+  там отмечаются посещения (неявки);
+- затронутые дни пересчитываются целиком (все зоны) запросами по диапазону дат.
+
+Отметки и updated_at/paid_at — по часам UTC (datetime.utcnow, как умолчания
+в models.py); `now` — местное время расписания, с ним сравниваются только
+datetime_from/datetime_to. Отметка не уходит дальше текущего момента UTC,
+даже если в базе есть строки с метками из будущего.
+
+`flask refresh-rollups --full` пересобирает всё с нуля (например, после
+удаления старых броней).
+
+День брони — дата начала занятия (datetime_from), день оплаты — дата paid_at.
+Неявка — не отменённая бронь, которая уже закончилась, а вход по ней не отмечен.
+"""
+from __future__ import annotations
+from typing import Optional
+
+from collections import defaultdict
+from datetime import datetime, date, time, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, func, delete, and_
+from sqlalchemy.engine import Connection
+
+from models import (
+    Booking, BookingStatus, BookingService, Payment, Visit,
+    RollupZoneDay, RollupPaymentDay, RollupState,
+)
+
+REFRESH_WINDOW_DAYS = 3
+
+MARK_LAG = timedelta(minutes=5)
+
+BOOKINGS_MARK = "booking.updated_at"
+PAYMENTS_MARK = "payment.paid_at"
+
+
+def _day_range(day: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(day, time())
+    return start, start + timedelta(days=1)
+
+
+def _marks(conn: Connection) -> dict[str, Optional[datetime]]:
+    return dict(conn.execute(select(RollupState.name, RollupState.high_water)).all())
+
+
+def _set_mark(conn: Connection, name: str, value: datetime) -> None:
+    table = RollupState.__table__
+    conn.execute(table.delete().where(table.c.name == name))
+    conn.execute(table.insert().values(name=name, high_water=value, refreshed_at=datetime.utcnow()))
+
+
+def _changed_since(conn: Connection, day_column, mark_column, mark: Optional[datetime], utc_now: datetime):
+    """Дни строк с mark_column > mark - MARK_LAG и новая отметка (не позже utc_now)."""
+    query = select(day_column, mark_column)
+    if mark:
+        query = query.where(mark_column > mark - MARK_LAG)
+    days: set[date] = set()
+    for day_value, changed_at in conn.execute(query):
+        days.add(day_value.date())
+        mark = max(mark, changed_at) if mark else changed_at
+    return days, min(mark, utc_now) if mark else None
+
+
+def _dirty_days(conn: Connection, marks: dict, now: datetime) -> tuple[set[date], Optional[datetime], Optional[datetime]]:
+    """Дни, которые нужно пересчитать, и новые значения отметок."""
+    utc_now = datetime.utcnow()
+    booking_days, booking_mark = _changed_since(
+        conn, Booking.datetime_from, Booking.updated_at, marks.get(BOOKINGS_MARK), utc_now
+    )
+    payment_days, payment_mark = _changed_since(conn, Payment.paid_at, Payment.paid_at, marks.get(PAYMENTS_MARK), utc_now)
+    days = booking_days | payment_days
+
+    # день оплаты — по UTC, день занятия — по местному времени: окно покрывает оба «сегодня»
+    for today in {now.date(), utc_now.date()}:
+        days.update(today - timedelta(days=i) for i in range(REFRESH_WINDOW_DAYS + 1))
+    return days, booking_mark, payment_mark
+
+
+def _aggregate_day(conn: Connection, day: date, now: datetime) -> tuple[list[dict], list[dict]]:
+    start, end = _day_range(day)
+    on_day = and_(Booking.datetime_from >= start, Booking.datetime_from < end)
+    cancelled = BookingStatus.code == "cancelled"
+
+    zones: dict[int, dict] = defaultdict(lambda: {
+        "bookings": 0, "participants": 0, "session_revenue": Decimal("0"),
+        "service_revenue": Decimal("0"), "cancellations": 0, "no_shows": 0,
+    })
+    for zone_id, is_cancelled, count, participants, session_sum in conn.execute(
+        select(
+            Booking.zone_id,
+            cancelled,
+            func.count(Booking.id),
+            func.coalesce(func.sum(Booking.participants_count), 0),
+            func.coalesce(func.sum(Booking.session_sum), 0),
+        )
+        .join(BookingStatus, BookingStatus.id == Booking.status_id)
+        .where(on_day)
+        .group_by(Booking.zone_id, cancelled)
+    ):
+        row = zones[zone_id]
+        if is_cancelled:
+            row["cancellations"] += count
+        else:
+            row["bookings"] += count
+            row["participants"] += participants
+            row["session_revenue"] += Decimal(str(session_sum))
+
+    for zone_id, services_sum in conn.execute(
+        select(Booking.zone_id, func.coalesce(func.sum(BookingService.line_sum), 0))
+        .join(BookingService, BookingService.booking_id == Booking.id)
+        .join(BookingStatus, BookingStatus.id == Booking.status_id)
+        .where(on_day, ~cancelled)
+        .group_by(Booking.zone_id)
+    ):
+        zones[zone_id]["service_revenue"] += Decimal(str(services_sum))
+
+    for zone_id, no_shows in conn.execute(
+        select(Booking.zone_id, func.count(Booking.id))
+        .join(BookingStatus, BookingStatus.id == Booking.status_id)
+        .outerjoin(Visit, Visit.booking_id == Booking.id)
+        .where(on_day, ~cancelled, Booking.datetime_to <= now, Visit.checkin_at.is_(None))
+        .group_by(Booking.zone_id)
+    ):
+        zones[zone_id]["no_shows"] += no_shows
+
+    zone_rows = [{"day": day, "zone_id": zone_id, **values} for zone_id, values in zones.items()]
+
+    payment_rows = [
+        {"day": day, "zone_id": zone_id, "method": method, "payments": count, "amount": Decimal(str(amount))}
+        for zone_id, method, count, amount in conn.execute(
+            select(Booking.zone_id, Payment.method, func.count(Payment.id), func.coalesce(func.sum(Payment.amount), 0))
+            .join(Booking, Booking.id == Payment.booking_id)
+            .where(Payment.paid_at >= start, Payment.paid_at < end)
+            .group_by(Booking.zone_id, Payment.method)
+        )
+    ]
+    return zone_rows, payment_rows
+
+
+def refresh_rollups(conn: Connection, full: bool = False, now: Optional[datetime] = None) -> int:
+    """Обновить свёртки; вернуть число пересчитанных дней."""
+    now = now or datetime.now()
+    if full:
+        conn.execute(delete(RollupZoneDay))
+        conn.execute(delete(RollupPaymentDay))
+        conn.execute(delete(RollupState))
+    days, booking_mark, payment_mark = _dirty_days(conn, {} if full else _marks(conn), now)
+
+    for day in sorted(days):
+        zone_rows, payment_rows = _aggregate_day(conn, day, now)
+        conn.execute(delete(RollupZoneDay).where(RollupZoneDay.day == day))
+        conn.execute(delete(RollupPaymentDay).where(RollupPaymentDay.day == day))
+        if zone_rows:
+            conn.execute(RollupZoneDay.__table__.insert(), zone_rows)
+        if payment_rows:
+            conn.execute(RollupPaymentDay.__table__.insert(), payment_rows)
+
+    if booking_mark:
+        _set_mark(conn, BOOKINGS_MARK, booking_mark)
+    if payment_mark:
+        _set_mark(conn, PAYMENTS_MARK, payment_mark)
+    return len(days)
+
+
+def last_refresh(conn: Connection) -> Optional[datetime]:
+    return conn.execute(select(func.max(RollupState.refreshed_at))).scalar_one()
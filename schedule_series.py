@@ -0,0 +1,168 @@
+"""Повторяющиеся смены тренера (ScheduleSeries) и массовая генерация слотов.
+
+Серия задаёт дни недели, время, период дат и даты-исключения. Слоты серии
+создаются одним INSERT на все даты. Пересечения с уже существующими слотами
+зоны ищутся одним запросом по индексу (zone_id, datetime_from) на весь период
+серии и сверяются слиянием двух отсортированных списков — без запроса на слот.
+
+Перегенерация (после правки или сдвига серии) удаляет будущие слоты серии без
+броней и создаёт их заново; слоты, на которые уже записались, не трогаются.
+"""
+from __future__ import annotations
+from typing import NamedTuple, Optional
+
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import select, delete, insert, and_
+from sqlalchemy.orm import Session
+
+from models import ScheduleSeries, ScheduleSlot
+
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+# защита от опечаток в периоде: не больше года слотов за один раз
+MAX_SERIES_DAYS = 366
+
+
+class Conflict(NamedTuple):
+    start: datetime
+    end: datetime
+    slot_id: int
+    slot_from: datetime
+    slot_to: datetime
+
+
+def parse_exclusions(raw: Optional[str]) -> set[date]:
+    """Даты-исключения из текста: ISO-даты через запятую, пробел или перенос строки."""
+    result = set()
+    for part in (raw or "").replace(",", " ").split():
+        try:
+            result.add(date.fromisoformat(part))
+        except ValueError:
+            continue
+    return result
+
+
+def format_exclusions(dates: set[date]) -> Optional[str]:
+    return ",".join(d.isoformat() for d in sorted(dates)) or None
+
+
+def weekday_labels(series: ScheduleSeries) -> str:
+    return ", ".join(WEEKDAY_NAMES[int(d)] for d in series.weekdays)
+
+
+def occurrences(series: ScheduleSeries, not_before: Optional[datetime] = None) -> list[tuple[datetime, datetime]]:
+    """Все (начало, конец) серии по возрастанию; с not_before — только начинающиеся не раньше."""
+    days = {int(d) for d in series.weekdays}
+    excluded = parse_exclusions(series.exclusions)
+    result = []
+    day = series.date_from
+    while day <= series.date_to:
+        if day.weekday() in days and day not in excluded:
+            start = datetime.combine(day, series.time_from)
+            if not_before is None or start >= not_before:
+                result.append((start, datetime.combine(day, series.time_to)))
+        day += timedelta(days=1)
+    return result
+
+
+def find_conflicts(s: Session, zone_id: int, periods: list[tuple[datetime, datetime]]) -> list[Conflict]:
+    """Периоды, пересекающиеся с активными слотами той же зоны.
+
+    periods должны быть отсортированы по началу и не пересекаться между собой.
+    """
+    if not periods:
+        return []
+    existing = s.execute(
+        select(ScheduleSlot.id, ScheduleSlot.datetime_from, ScheduleSlot.datetime_to)
+        .where(
+            ScheduleSlot.zone_id == zone_id,
+            ScheduleSlot.is_active.is_(True),
+            # слоты длиннее суток не заводят, поэтому нижняя граница по datetime_from безопасна
+            ScheduleSlot.datetime_from >= periods[0][0] - timedelta(days=1),
+            ScheduleSlot.datetime_from < periods[-1][1],
+        )
+        .order_by(ScheduleSlot.datetime_from)
+    ).all()
+
+    conflicts = []
+    i = 0
+    for start, end in periods:
+        # слоты, закончившиеся до начала периода, дальше уже ни с чем не пересекутся
+        while i < len(existing) and existing[i].datetime_to <= start:
+            i += 1
+        j = i
+        while j < len(existing) and existing[j].datetime_from < end:
+            if existing[j].datetime_to > start:
+                conflicts.append(Conflict(start, end, existing[j].id, existing[j].datetime_from, existing[j].datetime_to))
+            j += 1
+    return conflicts
+
+
+def clear_future_slots(s: Session, series: ScheduleSeries, now: datetime) -> int:
+    """Удалить будущие слоты серии без броней; вернуть число оставленных (с бронями)."""
+    future = and_(ScheduleSlot.series_id == series.id, ScheduleSlot.datetime_from >= now)
+    s.execute(
+        delete(ScheduleSlot)
+        .where(future, ScheduleSlot.booked_count == 0, ~ScheduleSlot.bookings.any())
+        .execution_options(synchronize_session=False)
+    )
+    return len(s.execute(select(ScheduleSlot.id).where(future)).all())
+
+
+def generate_slots(
+    s: Session,
+    series: ScheduleSeries,
+    now: datetime,
+    skip_conflicts: bool = False,
+) -> tuple[int, list[Conflict]]:
+    """Создать слоты серии начиная с now одним INSERT.
+
+    Если есть пересечения и skip_conflicts=False, ничего не вставляется —
+    вызывающий откатывает транзакцию и показывает список конфликтов.
+    """
+    # будущие слоты серии, оставленные из-за броней, заново не создаются
+    kept = set(
+        s.execute(
+            select(ScheduleSlot.datetime_from).where(ScheduleSlot.series_id == series.id, ScheduleSlot.datetime_from >= now)
+        ).scalars()
+    )
+    periods = [p for p in occurrences(series, not_before=now) if p[0] not in kept]
+    conflicts = find_conflicts(s, series.zone_id, periods)
+    if conflicts and not skip_conflicts:
+        return 0, conflicts
+    busy = {c.start for c in conflicts}
+    rows = [
+        {
+            "zone_id": series.zone_id,
+            "employee_id": series.employee_id,
+            "series_id": series.id,
+            "datetime_from": start,
+            "datetime_to": end,
+            "capacity": series.capacity,
+            "price": series.price,
+            "lesson_type": series.lesson_type,
+            "is_active": True,
+            "booked_count": 0,
+        }
+        for start, end in periods
+        if start not in busy
+    ]
+    if rows:
+        s.execute(insert(ScheduleSlot), rows)
+    return len(rows), conflicts
+
+
+def shift_series(series: ScheduleSeries, days: int = 0, minutes: int = 0) -> None:
+    """Сдвинуть правило серии на days дней и minutes минут (вместе с исключениями)."""
+    delta = timedelta(days=days, minutes=minutes)
+    anchor = datetime.combine(series.date_from, series.time_from)
+    start = anchor + delta
+    end = datetime.combine(series.date_from, series.time_to) + delta
+    day_shift = (start.date() - series.date_from).days
+    series.time_from = start.time()
+    series.time_to = end.time()
+    series.date_from = series.date_from + timedelta(days=day_shift)
+    series.date_to = series.date_to + timedelta(days=day_shift)
+    series.weekdays = "".join(sorted(str((int(d) + day_shift) % 7) for d in series.weekdays))
+    series.exclusions = format_exclusions({d + timedelta(days=day_shift) for d in parse_exclusions(series.exclusions)})
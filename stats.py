@@ -0,0 +1,214 @@
+"""Счётчики для дашборда в таблице stats_counter.
+
+Число зон, клиентов, броней и оплат и сумма оплат меняются триггерами
+на INSERT/DELETE соответствующих таблиц (в PostgreSQL — через журнал
+stats_delta, см. _postgresql_trigger_ddl) — так их поддерживает любой путь
+записи (обработчики, импорт, миграции), а дашборд читает одну маленькую
+таблицу вместо COUNT(*) по большим. `flask rebuild-stats` пересчитывает
+значения с нуля, если счётчики когда-нибудь разойдутся с данными.
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import StatsCounter
+
+# имя счётчика -> таблица, строки которой он считает
+COUNTED_TABLES = {
+    "zones": "zone",
+    "clients": "client",
+    "bookings": "booking",
+    "payments": "payment",
+}
+PAYMENTS_SUM = "payments_sum"
+# PostgreSQL: ключ pg_try_advisory_xact_lock, чтобы журнал сворачивал один процесс за раз
+COMPACT_LOCK_KEY = 0x5354_4154  # "STAT"
+
+
+def _trigger_ddl() -> list[str]:
+    ddl = []
+    for name, table in COUNTED_TABLES.items():
+        ddl.append(f"""
+            CREATE TRIGGER IF NOT EXISTS stats_{table}_ai AFTER INSERT ON {table} BEGIN
+                UPDATE stats_counter SET value = value + 1 WHERE name = '{name}';
+            END
+        """)
+        ddl.append(f"""
+            CREATE TRIGGER IF NOT EXISTS stats_{table}_ad AFTER DELETE ON {table} BEGIN
+                UPDATE stats_counter SET value = value - 1 WHERE name = '{name}';
+            END
+        """)
+    ddl.append(f"""
+        CREATE TRIGGER IF NOT EXISTS stats_payment_sum_ai AFTER INSERT ON payment BEGIN
+            UPDATE stats_counter SET value = ROUND(value + new.amount, 2) WHERE name = '{PAYMENTS_SUM}';
+        END
+    """)
+    ddl.append(f"""
+        CREATE TRIGGER IF NOT EXISTS stats_payment_sum_ad AFTER DELETE ON payment BEGIN
+            UPDATE stats_counter SET value = ROUND(value - old.amount, 2) WHERE name = '{PAYMENTS_SUM}';
+        END
+    """)
+    ddl.append(f"""
+        CREATE TRIGGER IF NOT EXISTS stats_payment_sum_au AFTER UPDATE OF amount ON payment BEGIN
+            UPDATE stats_counter SET value = ROUND(value - old.amount + new.amount, 2) WHERE name = '{PAYMENTS_SUM}';
+        END
+    """)
+    return ddl
+
+
+def _actual_values(conn: Connection) -> dict[str, Decimal]:
+    values = {
+        name: Decimal(conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar_one())
+        for name, table in COUNTED_TABLES.items()
+    }
+    paid = conn.execute(text("SELECT COALESCE(SUM(amount), 0) FROM payment")).scalar_one()
+    values[PAYMENTS_SUM] = Decimal(str(paid)).quantize(Decimal("0.01"))
+    return values
+
+
+def _postgresql_trigger_ddl() -> list[str]:
+    """PostgreSQL: триггеры на оператор дописывают изменения в stats_delta.
+
+    Обновлять из триггера одну строку stats_counter нельзя: её блокировка
+    держалась бы до commit, и все транзакции, пишущие брони, оплаты и клиентов,
+    выстроились бы в очередь. Строки stats_delta только добавляются, их сумма
+    прибавляется к stats_counter при чтении, а compact_stats (`flask
+    compact-deltas` по cron) переносит их в stats_counter.
+    """
+    ddl = [
+        """
+        CREATE TABLE IF NOT EXISTS stats_delta (
+            id BIGSERIAL PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            delta NUMERIC(14, 2) NOT NULL
+        )
+        """,
+        # TG_ARGV: имя счётчика, знак (1 — вставка, -1 — удаление)
+        """
+        CREATE OR REPLACE FUNCTION stats_count_rows() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO stats_delta (name, delta)
+            SELECT TG_ARGV[0], TG_ARGV[1]::integer * COUNT(*) FROM changed HAVING COUNT(*) > 0;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION stats_payment_sum_rows() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO stats_delta (name, delta)
+            SELECT '{PAYMENTS_SUM}', TG_ARGV[0]::integer * SUM(amount) FROM changed HAVING COUNT(*) > 0;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION stats_payment_sum_update() RETURNS trigger AS $$
+        DECLARE
+            diff NUMERIC(14, 2);
+        BEGIN
+            SELECT COALESCE((SELECT SUM(amount) FROM new_rows), 0) - COALESCE((SELECT SUM(amount) FROM old_rows), 0)
+            INTO diff;
+            IF diff <> 0 THEN
+                INSERT INTO stats_delta (name, delta) VALUES ('{PAYMENTS_SUM}', diff);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        # триггеры прошлой версии (на строку, с UPDATE stats_counter)
+        "DROP FUNCTION IF EXISTS stats_count() CASCADE",
+        "DROP FUNCTION IF EXISTS stats_payment_sum() CASCADE",
+    ]
+    for name, table in COUNTED_TABLES.items():
+        for suffix, event, ref, sign in (("ai", "INSERT", "NEW", 1), ("ad", "DELETE", "OLD", -1)):
+            ddl.append(f"DROP TRIGGER IF EXISTS stats_{table}_{suffix} ON {table}")
+            ddl.append(f"""
+                CREATE TRIGGER stats_{table}_{suffix} AFTER {event} ON {table}
+                REFERENCING {ref} TABLE AS changed
+                FOR EACH STATEMENT EXECUTE FUNCTION stats_count_rows('{name}', '{sign}')
+            """)
+    for suffix, event, ref, sign in (("ai", "INSERT", "NEW", 1), ("ad", "DELETE", "OLD", -1)):
+        ddl.append(f"DROP TRIGGER IF EXISTS stats_payment_sum_{suffix} ON payment")
+        ddl.append(f"""
+            CREATE TRIGGER stats_payment_sum_{suffix} AFTER {event} ON payment
+            REFERENCING {ref} TABLE AS changed
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_payment_sum_rows('{sign}')
+        """)
+    ddl.append("DROP TRIGGER IF EXISTS stats_payment_sum_au ON payment")
+    ddl.append("""
+        CREATE TRIGGER stats_payment_sum_au AFTER UPDATE ON payment
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION stats_payment_sum_update()
+    """)
+    return ddl
+
+
+def create_stats_triggers(conn: Connection) -> None:
+    ddl = _trigger_ddl() if conn.dialect.name == "sqlite" else _postgresql_trigger_ddl()
+    for statement in ddl:
+        conn.execute(text(statement))
+
+
+def compact_stats(conn: Connection) -> int | None:
+    """PostgreSQL: перенести накопленные stats_delta в stats_counter одним оператором.
+
+    Возвращает число перенесённых строк или None, если журнал сейчас сворачивает
+    другой процесс (блокировка COMPACT_LOCK_KEY держится до конца транзакции).
+    """
+    if conn.dialect.name == "sqlite":
+        return 0
+    if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": COMPACT_LOCK_KEY}).scalar_one():
+        return None
+    return conn.execute(text("""
+        WITH moved AS (DELETE FROM stats_delta RETURNING name, delta),
+             sums AS (SELECT name, SUM(delta) AS delta, COUNT(*) AS n FROM moved GROUP BY name),
+             applied AS (
+                 UPDATE stats_counter c SET value = c.value + sums.delta FROM sums WHERE c.name = sums.name
+             )
+        SELECT CAST(COALESCE(SUM(n), 0) AS BIGINT) FROM sums
+    """)).scalar_one()
+
+
+def stored_values(conn: Connection) -> dict:
+    """Значения счётчиков вместе с ещё не перенесёнными строками stats_delta."""
+    if conn.dialect.name == "sqlite":
+        return dict(conn.execute(select(StatsCounter.name, StatsCounter.value)).all())
+    return dict(conn.execute(text("""
+        SELECT c.name, c.value + COALESCE(d.delta, 0)
+        FROM stats_counter c
+        LEFT JOIN (SELECT name, SUM(delta) AS delta FROM stats_delta GROUP BY name) d ON d.name = c.name
+    """)).all())
+
+
+def rebuild_stats(conn: Connection) -> dict[str, Decimal]:
+    """Пересчитать все счётчики из таблиц; вернуть новые значения."""
+    values = _actual_values(conn)
+    table = StatsCounter.__table__
+    if conn.dialect.name != "sqlite":
+        conn.execute(text("DELETE FROM stats_delta"))
+    conn.execute(table.delete())
+    conn.execute(table.insert(), [{"name": name, "value": value} for name, value in values.items()])
+    return values
+
+
+def stats_drift(conn: Connection) -> list[dict]:
+    """Счётчики, которые разошлись с таблицами."""
+    stored = stored_values(conn)
+    return [
+        {"name": name, "stored": stored.get(name), "actual": actual}
+        for name, actual in _actual_values(conn).items()
+        if stored.get(name) is None or Decimal(str(stored[name])) != actual
+    ]
+
+
+def read_stats(s: Session) -> dict:
+    """Все счётчики одним запросом: целые для количеств, Decimal для сумм."""
+    rows = stored_values(s.connection())
+    stats = {name: int(rows.get(name) or 0) for name in COUNTED_TABLES}
+    stats[PAYMENTS_SUM] = Decimal(str(rows.get(PAYMENTS_SUM) or 0))
+    return stats
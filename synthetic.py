@@ -0,0 +1,300 @@
+"""Генератор синтетической базы для замеров производительности.
+
+generate(...) наполняет базу, где уже выполнен `flask init-db` (справочники
+и демо-учётки), данными заданного масштаба: клиенты, зоны, тренеры, слоты
+расписания на SCALES[...].days дней назад и FUTURE_DAYS вперёд, брони по
+слотам с услугами, оплатами, посещениями и уведомлениями. Случайность
+детерминирована (seed), поэтому две базы с одинаковыми параметрами совпадают
+и замеры bench.py на них сравнимы.
+
+Строки вставляются пачками по GEN_BATCH_ROWS через INSERT ... executemany с
+заранее назначенными id — дочерние строки ссылаются на них без чтения назад.
+Счётчики дашборда, FTS и версии данных обновляют триггеры; свёртки отчётов
+пересчитываются в конце.
+
+Только для отдельной базы замеров: данные добавляются к существующим.
+"""
+from __future__ import annotations
+from typing import Callable, Iterator, NamedTuple
+
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, func, insert, text
+from sqlalchemy.orm import Session
+from werkzeug.security import generate_password_hash
+
+from booking_flow import money
+from contacts import normalize_phone, normalize_email
+from loadgen import LOAD_PASSWORD, load_login
+from lookups import lookups
+from rollups import refresh_rollups
+from models import (
+    Account, Booking, BookingService, Client, Employee, Notification, Payment, Position, ScheduleSlot, Service, Visit,
+    Zone, ZoneStatus, ZoneType,
+)
+
+GEN_BATCH_ROWS = 5000
+FUTURE_DAYS = 14
+FIRST_SLOT_HOUR = 10
+
+
+class Scale(NamedTuple):
+    clients: int
+    zones: int
+    coaches: int
+    days: int  # дней прошлого расписания
+    slots_per_day: int  # часовых слотов в день на зону
+
+
+SCALES = {
+    "small": Scale(clients=500, zones=3, coaches=5, days=90, slots_per_day=6),
+    "medium": Scale(clients=5_000, zones=6, coaches=12, days=365, slots_per_day=8),
+    "large": Scale(clients=50_000, zones=10, coaches=25, days=730, slots_per_day=10),
+}
+
+FIRST_NAMES = ("Иван", "Анна", "Сергей", "Мария", "Дмитрий", "Ольга", "Алексей", "Елена", "Павел", "Наталья",
+               "Михаил", "Татьяна", "Андрей", "Ирина", "Николай", "Светлана")
+LAST_NAMES = ("Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+              "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров")
+PAYMENT_METHODS = ("cash", "card", "card", "transfer")
+
+
+class GenerateReport:
+    def __init__(self) -> None:
+        self.counts: dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, table: str, n: int) -> None:
+        self.counts[table] = self.counts.get(table, 0) + n
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{table}: {n}" for table, n in self.counts.items())
+        return f"{parts}; {self.elapsed:.1f} с"
+
+
+def _next_id(s: Session, model) -> int:
+    return (s.execute(select(func.max(model.id))).scalar_one() or 0) + 1
+
+
+def _person_name(rng: random.Random) -> str:
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    # женские имена в списке — на «а», фамилии тогда тоже в женском роде
+    if first.endswith("а") or first.endswith("я"):
+        last += "а"
+    return f"{last} {first}"
+
+
+class _Writer:
+    """Копит строки по таблицам и сбрасывает пачками в одной транзакции на пачку."""
+
+    def __init__(self, s: Session, report: GenerateReport) -> None:
+        self.s = s
+        self.report = report
+        self.pending: dict[type, list[dict]] = {}
+        self.size = 0
+
+    def add(self, model, row: dict) -> dict:
+        self.pending.setdefault(model, []).append(row)
+        self.size += 1
+        return row
+
+    def maybe_flush(self) -> None:
+        """Сбросить, если набралась пачка; вызывается между слотами, когда строки слота готовы."""
+        if self.size >= GEN_BATCH_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        # порядок вставки = порядок первого появления таблицы: родители раньше детей
+        for model, rows in self.pending.items():
+            if rows:
+                self.s.execute(insert(model), rows)
+                self.report.add(model.__tablename__, len(rows))
+        self.s.commit()
+        self.pending = {model: [] for model in self.pending}
+        self.size = 0
+
+
+def _sync_sequences(s: Session, models) -> None:
+    """PostgreSQL: после вставки с явными id подвинуть последовательности, иначе INSERT приложения упрётся в дубль ключа."""
+    if s.get_bind().dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__tablename__
+        s.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"))
+    s.commit()
+
+
+def _days(scale: Scale, today: datetime) -> Iterator[datetime]:
+    for offset in range(-scale.days, FUTURE_DAYS):
+        yield today + timedelta(days=offset)
+
+
+def generate(session_factory: Callable[[], Session], scale: Scale, seed: int = 1, now: datetime | None = None) -> GenerateReport:
+    """Добавить в базу синтетические данные масштаба scale."""
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    report = GenerateReport()
+
+    with session_factory() as s:
+        lk = lookups.get(s)
+        status = lk.booking_status_id
+        zone_type_ids = list(s.execute(select(ZoneType.id)).scalars())
+        zone_status_id = s.execute(select(ZoneStatus.id).where(ZoneStatus.code == "available")).scalar_one()
+        position_id = s.execute(select(Position.id).where(Position.code == "trainer")).scalar_one()
+        services = [(sv.id, Decimal(sv.base_price)) for sv in s.execute(select(Service)).scalars()]
+        w = _Writer(s, report)
+
+        # зоны и тренеры — их немного, id нужны сразу
+        zone_id = _next_id(s, Zone)
+        zones = []
+        for i in range(scale.zones):
+            capacity = rng.choice((8, 10, 12, 15, 20))
+            price = money(rng.choice((600, 700, 800, 900, 1000)))
+            w.add(Zone, {
+                "id": zone_id + i, "zone_name": f"Зона {zone_id + i}", "type_id": rng.choice(zone_type_ids),
+                "capacity": capacity, "base_price": price, "status_id": zone_status_id,
+            })
+            zones.append((zone_id + i, capacity, price))
+        employee_id = _next_id(s, Employee)
+        coaches = []
+        for i in range(scale.coaches):
+            w.add(Employee, {"id": employee_id + i, "full_name": _person_name(rng), "position_id": position_id})
+            coaches.append(employee_id + i)
+
+        client_id = _next_id(s, Client)
+        client_status_id = lk.client_status_id["active"]
+        for i in range(scale.clients):
+            w.maybe_flush()
+            cid = client_id + i
+            phone = f"+7 9{cid // 10_000_000 % 100:02d} {cid // 10_000 % 1000:03d}-{cid // 100 % 100:02d}-{cid % 100:02d}"
+            email = f"client{cid}@example.com"
+            w.add(Client, {
+                "id": cid, "full_name": _person_name(rng), "phone": phone, "email": email,
+                "phone_norm": normalize_phone(phone), "email_norm": normalize_email(email),
+                "status_id": client_status_id,
+            })
+        clients = range(client_id, client_id + scale.clients)
+
+        slot_id = _next_id(s, ScheduleSlot)
+        booking_id = _next_id(s, Booking)
+        for day in _days(scale, today):
+            for zone, capacity, price in zones:
+                for h in range(scale.slots_per_day):
+                    start = day + timedelta(hours=FIRST_SLOT_HOUR + h)
+                    end = start + timedelta(hours=1)
+                    past = end <= now
+                    individual = rng.random() < 0.15
+                    slot_capacity = 1 if individual else capacity
+                    # выходные и вечер загружены сильнее
+                    load = rng.betavariate(2, 3) + (0.2 if day.weekday() >= 5 else 0) + (0.1 if h >= scale.slots_per_day - 3 else 0)
+                    seats = min(slot_capacity, round(slot_capacity * load))
+                    slot = w.add(ScheduleSlot, {
+                        "id": slot_id, "zone_id": zone, "employee_id": rng.choice(coaches) if coaches else None,
+                        "datetime_from": start, "datetime_to": end, "capacity": slot_capacity, "booked_count": 0,
+                        "price": price, "lesson_type": "individual" if individual else "group", "is_active": True,
+                    })
+                    booked = 0
+                    while booked < seats:
+                        participants = min(seats - booked, 1 if individual else rng.choice((1, 1, 2, 2, 3, 4)))
+                        roll = rng.random()
+                        if roll < 0.08:
+                            code = "cancelled"
+                        elif past:
+                            code = "done"
+                        else:
+                            code = "new" if roll < 0.35 else "confirmed"
+                        session_sum = money(price * participants)
+                        total = session_sum
+                        lines = []
+                        if services and rng.random() < 0.3:
+                            for sid, unit in rng.sample(services, k=min(len(services), rng.choice((1, 2)))):
+                                qty = rng.randint(1, participants)
+                                line_sum = money(unit * qty)
+                                lines.append({"booking_id": booking_id, "service_id": sid, "qty": qty, "unit_price": unit, "line_sum": line_sum})
+                                total += line_sum
+                        paid = total if code in ("done", "confirmed") else money(0)
+                        client = rng.choice(clients)
+                        # брони будущих слотов созданы в прошлом — иначе отметки свёрток (rollups.py) уйдут вперёд
+                        created_at = min(start - timedelta(hours=rng.randint(1, 14 * 24)), now)
+                        w.add(Booking, {
+                            "id": booking_id, "client_id": client, "zone_id": zone, "schedule_slot_id": slot_id,
+                            "datetime_from": start, "datetime_to": end, "participants_count": participants,
+                            "session_sum": session_sum, "total_sum": total, "paid_sum": paid, "due_sum": total - paid,
+                            "status_id": status[code], "created_at": created_at,
+                        })
+                        for line in lines:
+                            w.add(BookingService, line)
+                        if paid > 0:
+                            w.add(Payment, {
+                                "booking_id": booking_id, "paid_at": min(created_at + timedelta(minutes=rng.randint(1, 60)), now),
+                                "amount": paid, "method": rng.choice(PAYMENT_METHODS),
+                            })
+                        # около 5% прошедших броней — неявка, без посещения
+                        if code == "done" and rng.random() >= 0.05:
+                            w.add(Visit, {
+                                "booking_id": booking_id,
+                                "checkin_at": start - timedelta(minutes=rng.randint(0, 15)),
+                                "checkout_at": end + timedelta(minutes=rng.randint(0, 10)),
+                                "actual_participants_count": participants,
+                            })
+                        w.add(Notification, {
+                            "client_id": client, "message": f"Бронь №{booking_id} создана.",
+                            "created_at": created_at, "is_read": past,
+                        })
+                        if code != "cancelled":
+                            booked += participants
+                        else:
+                            seats -= participants
+                        booking_id += 1
+                    slot["booked_count"] = booked
+                    slot_id += 1
+                    w.maybe_flush()
+        w.flush()
+        _sync_sequences(s, (Zone, Employee, Client, ScheduleSlot, Booking))
+
+        refresh_rollups(s.connection(), full=True, now=now)
+        # новые зоны и тренеры — работающие процессы перечитают справочники
+        lookups.invalidate(s)
+        s.commit()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def create_load_accounts(s: Session, counts: dict[str, int], password: str = LOAD_PASSWORD) -> dict[str, int]:
+    """Учётки load-<роль>-<N> для loadgen.py: клиенты и тренеры — на первых клиентах/сотрудниках базы.
+
+    Существующие логины пропускаются; хеш пароля один на всех (scrypt на каждую учётку — минуты).
+    """
+    password_hash = generate_password_hash(password)
+    existing = set(s.execute(select(Account.login).where(Account.login.like("load-%"))).scalars())
+    targets = {
+        "client": list(s.execute(select(Client.id).order_by(Client.id).limit(counts.get("client", 0))).scalars()),
+        "coach": list(s.execute(
+            select(Employee.id).join(Position).where(Position.code == "trainer").order_by(Employee.id).limit(counts.get("coach", 0))
+        ).scalars()),
+    }
+    created = {}
+    for role, count in counts.items():
+        rows = []
+        for n in range(1, count + 1):
+            login = load_login(role, n)
+            if login in existing:
+                continue
+            row = {"login": login, "password_hash": password_hash, "role": role}
+            if role in targets:
+                if not targets[role]:
+                    break
+                key = "client_id" if role == "client" else "employee_id"
+                row[key] = targets[role][(n - 1) % len(targets[role])]
+            rows.append(row)
+        if rows:
+            s.execute(insert(Account), rows)
+        created[role] = len(rows)
+    s.commit()
+    return created
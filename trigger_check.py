@@ -0,0 +1,86 @@
+"""Проверка триггерных счётчиков на живой базе (`flask check-triggers`).
+
+Счётчики дашборда (stats.py) и версии данных (data_versions.py) ведут триггеры,
+а в PostgreSQL — функции PL/pgSQL с таблицами переходов, журналы *_delta и их
+свёртка compact_*. Проверка выполняет типичные операторы (вставка одной и
+нескольких строк, массовый UPDATE суммы оплат, удаление), после каждого сверяет
+счётчики с таблицами, сворачивает журналы и пробует свернуть их второй раз из
+другого соединения. Всё выполняется в одной транзакции и откатывается — база
+не меняется, но нужны справочники и хотя бы одна зона (`flask init-db`).
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.engine import Connection
+
+from data_versions import VERSIONED_TABLES, compact_versions, read_versions, version_name
+from models import Booking, BookingStatus, Client, Payment, Zone
+from stats import compact_stats, stored_values, stats_drift
+
+
+def _step(results: list[dict], name: str, ok: bool, detail: str = "") -> None:
+    results.append({"name": name, "ok": ok, "detail": detail})
+
+
+def _drift_step(results: list[dict], conn: Connection, name: str) -> None:
+    drift = stats_drift(conn)
+    _step(results, name, not drift, ", ".join(f"{d['name']}: {d['stored']} != {d['actual']}" for d in drift))
+
+
+def check_triggers(conn: Connection) -> list[dict]:
+    """Шаги проверки [{name, ok, detail}]; транзакцию conn откатывает вызывающий."""
+    results: list[dict] = []
+    zone = conn.execute(select(Zone.id, Zone.base_price).order_by(Zone.id).limit(1)).first()
+    status_id = conn.execute(select(BookingStatus.id).where(BookingStatus.code != "cancelled").limit(1)).scalar()
+    if zone is None or status_id is None:
+        _step(results, "справочники", False, "нет зон или статусов броней — сначала flask init-db")
+        return results
+
+    _drift_step(results, conn, "счётчики до проверки совпадают с таблицами")
+    versions = read_versions(conn, VERSIONED_TABLES)
+
+    client_id = conn.execute(insert(Client).values(full_name="Проверка триггеров").returning(Client.id)).scalar_one()
+    start = datetime.now().replace(microsecond=0) + timedelta(days=3650)
+    booking_ids = conn.execute(
+        insert(Booking).returning(Booking.id),
+        [
+            {
+                "client_id": client_id, "zone_id": zone.id, "status_id": status_id,
+                "datetime_from": start + timedelta(hours=i), "datetime_to": start + timedelta(hours=i, minutes=30),
+                "participants_count": 1, "total_sum": zone.base_price,
+            }
+            for i in range(3)
+        ],
+    ).scalars().all()
+    _drift_step(results, conn, "вставка клиента и трёх броней")
+
+    conn.execute(insert(Payment), [
+        {"booking_id": booking_id, "amount": Decimal("100.50"), "method": "cash"} for booking_id in booking_ids
+    ])
+    _drift_step(results, conn, "вставка трёх оплат одним оператором")
+    conn.execute(update(Payment).where(Payment.booking_id.in_(booking_ids)).values(amount=Payment.amount + Decimal("0.25")))
+    _drift_step(results, conn, "UPDATE суммы трёх оплат")
+    conn.execute(delete(Payment).where(Payment.booking_id == booking_ids[0]))
+    _drift_step(results, conn, "удаление оплаты")
+
+    bumped = read_versions(conn, VERSIONED_TABLES)
+    stale = [t for t in ("client", "booking") if bumped[version_name(t)] <= versions[version_name(t)]]
+    _step(results, "версии client и booking выросли", not stale, ", ".join(stale))
+
+    before = stored_values(conn)
+    moved = (compact_stats(conn), compact_versions(conn))
+    _step(results, "свёртка журналов", None not in moved, f"перенесено строк: {moved}")
+    after, after_versions = stored_values(conn), read_versions(conn, VERSIONED_TABLES)
+    _step(results, "после свёртки значения не изменились", before == after and bumped == after_versions)
+    _drift_step(results, conn, "после свёртки счётчики совпадают с таблицами")
+
+    if conn.dialect.name != "sqlite":
+        # блокировка свёртки держится до конца транзакции conn — второй процесс должен уступить
+        with conn.engine.connect() as other:
+            skipped = (compact_stats(other), compact_versions(other))
+            other.rollback()
+        _step(results, "параллельная свёртка пропускается", skipped == (None, None), f"результат: {skipped}")
+    return results